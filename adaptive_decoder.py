@@ -1,53 +1,213 @@
-from typing import BinaryIO
+from typing import BinaryIO, List, Optional, Tuple
+from pathlib import Path
 import sys
+import os
 
-from base_coder import BaseDecoder
-from utils import DECOMP_FILE_EXTENSION, BITS_PER_BYTE, PROGRESS_FILE_NAME, BYTES_PER_MB
-from bit_io_stream import (
-    BitInStream,
-    BitOutStream,
-    IO_MODE_BIT,
-    IO_MODE_BYTE,
+from base_coder import BaseDecoder, BLOCK_STORED, STORED_HEADER_SIZE
+from utils import (
+    DECOMP_FILE_EXTENSION,
+    BITS_PER_BYTE,
+    BUFFER_SIZE,
+    MAX_BYTE_PER_SYMBOL,
+    PROGRESS_FILE_NAME,
+    BYTES_PER_MB,
+    SNAPSHOT_FILE_EXTENSION,
+    STORED_FORMAT_ID,
+    bytes_to_bits,
+    extended_ord,
 )
+from bit_io_stream import BitInStream, IO_MODE_BIT, IO_MODE_BYTE
 from adaptive_huffman_tree import AdaptiveHuffmanTree, DECODE_MODE
+from context_huffman_tree import ContextHuffmanTree
+from adaptive_encoder import (
+    SHRINK_PERIOD_SIZE,
+    DRIFT_WINDOW_SIZE,
+    DRIFT_THRESHOLD_UNIT,
+    CONTEXT_TREES_SIZE,
+    SNAPSHOT_OFFSET_SIZE,
+    SNAPSHOT_LEN_SIZE,
+)
 
 
 class AdaptiveDecoder(BaseDecoder):
     BITS_PER_READ = 256  # more convenient to strip off dummy bits
     ALERT_PERIOD = BYTES_PER_MB
 
-    def __init__(self, verbose: int=0):
+    def __init__(self, verbose: int=0, primer: Optional[List[Tuple[str, int]]]=None):
         super().__init__(verbose)
 
-        self._chunk_size: int
+        self._primer: Optional[List[Tuple[str, int]]] = primer  # must be the primer given to the encoder
+
+        self._shrink_period: int
         self._shrink_factor: int
+        self._aging: int
+        self._evict_after: int
+        self._drift_window: int
+        self._drift_threshold: float
+        self._context_trees: int
+
+        # the tree right after priming, restored for the next files instead of priming again
+        self._primed_snapshot: Optional[bytes] = None
 
     def decode(self, src_file_path: str, decomp_file_path: str):
-        with open(src_file_path, "rb") as src, open(decomp_file_path, "wb") as decomp:
+        with open(src_file_path, "rb") as src:
+            if self._copy_if_stored(src, decomp_file_path):
+                return
+
             self._parse_header(src)
-            tree = AdaptiveHuffmanTree(self._bytes_per_symbol, DECODE_MODE, self._chunk_size, self._shrink_factor)
 
-            istream = BitInStream(src, mode=IO_MODE_BIT)
-            ostream = BitOutStream(decomp, mode=IO_MODE_BYTE)
+            with self._undo_filters(decomp_file_path) as decoded_file_path:
+                with open(decoded_file_path, "wb", BUFFER_SIZE) as decomp:
+                    self._decode_content(src, decomp)
+                self._trunc(decoded_file_path)
+
+    def decode_range(self, src_file_path: str, start: int, size: int) -> bytes:
+        # decode `size` bytes from offset `start` of the original file
+        # decoding starts from the nearest snapshot before `start` if the file has a snapshot index
+        if size <= 0:
+            return b""
+
+        with open(src_file_path, "rb") as src:
+            if src.read(STORED_HEADER_SIZE) == bytes((STORED_FORMAT_ID,)):
+                src.seek(STORED_HEADER_SIZE + start)
+                return src.read(size)
+
+            src.seek(0)
+            self._parse_header(src)
+            assert self._block_size == 0 and self._context_trees == 0 and self._filters is None
 
-            next_bit_seq = istream.read(self.BITS_PER_READ)
-            while next_bit_seq:
-                curr_bit_seq = next_bit_seq
-                next_bit_seq = istream.read(self.BITS_PER_READ)
+            content_offset = src.tell()
+            content_bits = (os.path.getsize(src_file_path) - content_offset) * BITS_PER_BYTE - self._dummy_codeword_bits
 
-                if not next_bit_seq and self._dummy_codeword_bits > 0:
-                    curr_bit_seq = curr_bit_seq[:-self._dummy_codeword_bits]
+            tree = self._build_tree()
+            symbol_offset, bit_offset = 0, 0
+            snapshot = self._find_snapshot(f"{src_file_path}.{SNAPSHOT_FILE_EXTENSION}", start)
+            if snapshot is not None:
+                symbol_offset, bit_offset, tree_snapshot = snapshot
+                tree.restore(tree_snapshot)
 
-                for bit in curr_bit_seq:
+            src.seek(content_offset + bit_offset // BITS_PER_BYTE)
+            istream = BitInStream(src, mode=IO_MODE_BIT)
+            if bit_offset % BITS_PER_BYTE:
+                istream.read(bit_offset % BITS_PER_BYTE)
+            remaining_bits = content_bits - bit_offset
+
+            symbols = []
+            decoded_bytes = 0
+            while remaining_bits > 0 and symbol_offset + decoded_bytes < start + size:
+                bit_seq = istream.read(min(self.BITS_PER_READ, remaining_bits))
+                remaining_bits -= len(bit_seq)
+
+                for bit in bit_seq:
                     symbol = tree.decode(bit)
                     if symbol:
-                        ostream.write(symbol)
-                        self._symbol_cnt += 1
+                        symbols.append(symbol)
+                        decoded_bytes += self._bytes_per_symbol
+
+        decoded = "".join(symbols).encode("latin-1")
+        if remaining_bits == 0 and self._dummy_symbol_bytes > 0:
+            decoded = decoded[:-self._dummy_symbol_bytes]
+
+        return decoded[start-symbol_offset:start-symbol_offset+size]
+
+    def _find_snapshot(self, index_file_path: str, start: int) -> Optional[Tuple[int, int, bytes]]:
+        # return (source offset, bit offset, tree snapshot) of the last snapshot not after `start`
+        if not Path(index_file_path).exists():
+            return None
+
+        snapshot = None
+        with open(index_file_path, "rb") as index:
+            while True:
+                header = index.read(2 * SNAPSHOT_OFFSET_SIZE + SNAPSHOT_LEN_SIZE)
+                if len(header) == 0:
+                    break
+
+                symbol_offset = int.from_bytes(header[:SNAPSHOT_OFFSET_SIZE], "big")
+                if symbol_offset > start:
+                    break
 
-                        if self._should_alert():
-                            self._export_progress()
+                bit_offset = int.from_bytes(header[SNAPSHOT_OFFSET_SIZE:2*SNAPSHOT_OFFSET_SIZE], "big")
+                snapshot_len = int.from_bytes(header[2*SNAPSHOT_OFFSET_SIZE:], "big")
+                snapshot = (symbol_offset, bit_offset, index.read(snapshot_len))
 
-        self._trunc(decomp_file_path)
+        return snapshot
+
+    def _build_tree(self):
+        tree_kwargs = dict(
+            shrink_period=self._shrink_period,
+            shrink_factor=self._shrink_factor,
+            aging=self._aging,
+            evict_after=self._evict_after,
+            drift_window=self._drift_window,
+            drift_threshold=self._drift_threshold,
+        )
+        if self._context_trees > 0:
+            tree = ContextHuffmanTree(DECODE_MODE, self._context_trees, **tree_kwargs)
+        else:
+            tree = AdaptiveHuffmanTree(self._bytes_per_symbol, DECODE_MODE, **tree_kwargs)
+
+        if self._primer:
+            # priming codes every symbol of the primer, restoring the primed tree of the last file is much cheaper
+            if self._primed_snapshot is None:
+                tree.prime(self._primer)
+                self._primed_snapshot = tree.snapshot()
+            else:
+                tree.restore(self._primed_snapshot)
+
+        return tree
+
+    def _decode_content(self, src: BinaryIO, decomp: BinaryIO):
+        tree = self._build_tree()
+
+        if self._block_size > 0:
+            self._decode_blocks(src, decomp, tree)
+            return
+
+        # a buffer is decoded once the next one is read, to strip off the dummy bits of the last one
+        next_buffer = src.read(BUFFER_SIZE)
+        while next_buffer:
+            curr_buffer = next_buffer
+            next_buffer = src.read(BUFFER_SIZE)
+
+            bits = bytes_to_bits(curr_buffer)
+            if not next_buffer and self._dummy_codeword_bits > 0:
+                bits = bits[:-self._dummy_codeword_bits]
+
+            symbols = []
+            for bit in bits:
+                symbol = tree.decode(bit)
+                if symbol:
+                    symbols.append(symbol)
+                    self._symbol_cnt += 1
+
+                    if self._should_alert():
+                        self._export_progress()
+
+            decomp.write("".join(symbols).encode("latin-1"))
+
+    def _decode_blocks(self, src: BinaryIO, decomp: BinaryIO, tree):
+        while True:
+            block = self._read_block(src)
+            if block is None:
+                break
+
+            block_type, content = block
+            if block_type == BLOCK_STORED:
+                decomp.write(content)
+                self._symbol_cnt += len(content) // self._bytes_per_symbol
+                continue
+
+            symbols = []
+            for bit in self._get_codewords(content):
+                symbol = tree.decode(bit)
+                if symbol:
+                    symbols.append(symbol)
+
+            decomp.write("".join(symbols).encode("latin-1"))
+            self._symbol_cnt += len(symbols)
+
+            if self._should_alert():
+                self._export_progress()
 
     def _export_progress(self):
         with open(PROGRESS_FILE_NAME, "w") as f:
@@ -60,14 +220,23 @@ class AdaptiveDecoder(BaseDecoder):
             bits per symbol: 1 byte
             dummy codeword bits: 1 byte
             dummy codeword bytes: 1 byte
-            shrink period (Mb): 1 byte
+            shrink period (symbols): 8 bytes
             shrink factor: 1 byte
+            aging mode: 1 byte
+            evict after (shrinks): 1 byte
+            drift window (symbols): 4 bytes
+            drift threshold (1/16 bits per symbol): 1 byte
+            context trees: 2 bytes
+            block size: 4 bytes
+            filter chain length: 1 byte
+            filter chain: {filter id}{width}... (2 bytes per filter)
         """
 
         stream = BitInStream(file_obj, mode=IO_MODE_BYTE)
         self._bits_per_symbol = ord(stream.read(1))
         assert self._bits_per_symbol > 0 and self._bits_per_symbol % 8 == 0
         self._bytes_per_symbol = self._bits_per_symbol // BITS_PER_BYTE
+        assert self._bytes_per_symbol <= MAX_BYTE_PER_SYMBOL
 
         self._dummy_codeword_bits = ord(stream.read(1))
         assert 0 <= self._dummy_codeword_bits < BITS_PER_BYTE
@@ -75,8 +244,15 @@ class AdaptiveDecoder(BaseDecoder):
         self._dummy_symbol_bytes = ord(stream.read(1))
         assert 0 <= self._dummy_symbol_bytes < self._bytes_per_symbol
 
-        self._chunk_size = ord(stream.read(1))
+        self._shrink_period = extended_ord(stream.read(SHRINK_PERIOD_SIZE))
         self._shrink_factor = ord(stream.read(1))
+        self._aging = ord(stream.read(1))
+        self._evict_after = ord(stream.read(1))
+        self._drift_window = extended_ord(stream.read(DRIFT_WINDOW_SIZE))
+        self._drift_threshold = ord(stream.read(1)) / DRIFT_THRESHOLD_UNIT
+        self._context_trees = extended_ord(stream.read(CONTEXT_TREES_SIZE))
+        self._parse_block_size_header(stream)
+        self._parse_filters_header(stream)
 
 
 if __name__ == "__main__":
@@ -87,4 +263,9 @@ if __name__ == "__main__":
 
     src = kwargs["in"]
     decomp = kwargs.get("out", f"{src}.{DECOMP_FILE_EXTENSION}")
-    decoder.decode(src, decomp)
+
+    if "start" in kwargs:
+        with open(decomp, "wb") as f:
+            f.write(decoder.decode_range(src, int(kwargs["start"]), int(kwargs.get("size", 1))))
+    else:
+        decoder.decode(src, decomp)
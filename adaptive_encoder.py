@@ -1,52 +1,197 @@
-import sys
+from typing import BinaryIO, Dict, List, Optional, Tuple
 from pathlib import Path
+import time
+import sys
+import io
 
-from base_coder import BaseEncoder
-from utils import BITS_PER_BYTE, COMP_FILE_EXTENSION, PROGRESS_FILE_NAME, BYTES_PER_MB
-from bit_io_stream import (
-    BitInStream,
-    BitOutStream,
-    IO_MODE_BYTE,
-    IO_MODE_BIT,
+from base_coder import BaseEncoder, BLOCK_CODED, BLOCK_STORED
+from utils import (
+    BITS_PER_BYTE,
+    BUFFER_SIZE,
+    COMP_FILE_EXTENSION,
+    PROGRESS_FILE_NAME,
+    BYTES_PER_MB,
+    SNAPSHOT_FILE_EXTENSION,
+    SHRINK_PERIOD_SIZE,
+    DRIFT_WINDOW_SIZE,
+    CONTEXT_TREES_SIZE,
+    ADAPTIVE_HEADER_SIZE,
+    bits_to_bytes,
+    extended_chr,
 )
-from adaptive_huffman_tree import AdaptiveHuffmanTree, ENCODE_MODE
+from bit_io_stream import BitOutStream, IO_MODE_BYTE
+from adaptive_huffman_tree import AdaptiveHuffmanTree, ENCODE_MODE, AGING_FULL, AGING_MODES
+from context_huffman_tree import ContextHuffmanTree
+from filters import FilterPipeline
+from estimator import Estimate, DEFAULT_MAX_SYMBOLS, select_bytes_per_symbol
+from result_cache import ResultCache, DEFAULT_CACHE_SIZE
+
+
+DRIFT_THRESHOLD_UNIT = 16  # drift threshold is stored in 1/16 bits per symbol
+
+# the snapshot index is a sidecar file of {source offset}{bit offset}{snapshot length}{tree snapshot}...
+SNAPSHOT_OFFSET_SIZE = 8  # bytes used to store the source offset / content bit offset of a snapshot
+SNAPSHOT_LEN_SIZE = 4  # bytes used to store the length of a tree snapshot
 
 
 class AdaptiveEncoder(BaseEncoder):
     ALERT_PERIOD = BYTES_PER_MB
 
-    def __init__(self, bytes_per_symbol: int, verbose: int=0, chunk_size: int = 0, shrink_factor: int = 2):
-        super().__init__(bytes_per_symbol, verbose)
+    def __init__(
+        self,
+        bytes_per_symbol: int,
+        verbose: int=0,
+        chunk_size: int = 0,
+        shrink_factor: int = 2,
+        filters: Optional[FilterPipeline] = None,
+        context_trees: int = 0,
+        shrink_period: int = 0,
+        aging: int = AGING_FULL,
+        drift_window: int = 0,
+        drift_threshold: float = 0,
+        min_ratio: Optional[float] = None,
+        block_size: int = 0,
+        primer: Optional[List[Tuple[str, int]]] = None,
+        snapshot_size: int = 0,
+        result_cache: Optional[ResultCache] = None,
+        tree_stats: bool = False,
+        evict_after: int = 0,
+        timeline: int = 0,
+    ):
+        super().__init__(bytes_per_symbol, verbose, filters, min_ratio, block_size, result_cache, timeline)
 
-        assert 0 <= chunk_size < 2 ** BITS_PER_BYTE
+        assert chunk_size >= 0
         assert 1 < shrink_factor < 2 ** BITS_PER_BYTE
-        self._chunk_size: int = chunk_size
+        assert 0 <= context_trees < 2 ** (CONTEXT_TREES_SIZE * BITS_PER_BYTE)
+        assert context_trees == 0 or bytes_per_symbol == 1  # context modeling is only supported for b=1
+        assert 0 <= drift_window < 2 ** (DRIFT_WINDOW_SIZE * BITS_PER_BYTE)
+        assert 0 <= drift_threshold * DRIFT_THRESHOLD_UNIT < 2 ** BITS_PER_BYTE
+        self._chunk_size: int = chunk_size  # in Mb
         self._shrink_factor: int = shrink_factor
+        self._context_trees: int = context_trees  # max number of order-1 context trees, 0 for order-0 only
+
+        # shrink period in symbols, takes precedence over chunk size
+        self._shrink_period: int = (
+            shrink_period
+            if shrink_period > 0
+            else chunk_size * BYTES_PER_MB // bytes_per_symbol
+        )
+        self._aging: int = aging
+        # shrinks a leaf may stay at the floor weight before it is evicted, 0 for never
+        assert 0 <= evict_after < 2 ** BITS_PER_BYTE
+        self._evict_after: int = evict_after
+        self._drift_window: int = drift_window
+        self._drift_threshold: float = round(drift_threshold * DRIFT_THRESHOLD_UNIT) / DRIFT_THRESHOLD_UNIT
+
+        # [(symbol, weight)] coded into the tree before the content, not recorded in the header
+        # the decoder must be given the same primer
+        assert primer is None or context_trees == 0
+        self._primer: Optional[List[Tuple[str, int]]] = primer
+
+        # record the tree every `snapshot_size` Mb to a sidecar index, so that any range can be decoded
+        # from the nearest snapshot instead of the beginning of the file, 0 for no index
+        assert snapshot_size == 0 or (block_size == 0 and context_trees == 0 and not filters)
+        assert snapshot_size == 0 or result_cache is None  # the index is not cached
+        self._snapshot_size: int = snapshot_size
+        self._snapshot_cnt: int = 0
+
+        # the tree right after priming, restored for the next files instead of priming again
+        self._primed_snapshot: Optional[bytes] = None
+
+        # count the work done by the tree, see AdaptiveHuffmanTree.stats
+        self._tree_stats: bool = tree_stats
+        self._coding_time: float = 0  # in seconds
     
     @property
     def avg_code_len(self) -> float:
         return self._bits_written / self._symbol_cnt
 
-    def encode(self, src_file_path: str, comp_file_path: str):
-        with open(comp_file_path, "wb") as f:
-            stream = BitOutStream(f, mode=IO_MODE_BYTE)
-            stream.write(chr(0) * self._get_header_size()) # preserve space for header
+    @property
+    def tree_stats(self) -> Dict:
+        # the stats of the tree of the last file, along with the time spent outside of tree updates
+        stats = self._tree.stats
+        stats["coding time"] = self._coding_time
+        stats["codes and I/O time"] = self._coding_time - stats["update time"]
+        return stats
+
+    def reset(self):
+        super().reset()
+        self._snapshot_cnt = 0
+        self._coding_time = 0
+
+    def _encode(self, src_file_path: str, comp_file_path: str):
+        with self._apply_filters(src_file_path) as filtered_file_path:
+            if self._should_store(filtered_file_path):
+                self._store(src_file_path, comp_file_path)
+                return
+
+            with open(filtered_file_path, "rb", BUFFER_SIZE) as src, open(comp_file_path, "w+b", BUFFER_SIZE) as comp:
+                if self._snapshot_size > 0:
+                    with open(f"{comp_file_path}.{SNAPSHOT_FILE_EXTENSION}", "wb") as index:
+                        self._encode_symbols(src, comp, index)
+                else:
+                    self._encode_symbols(src, comp)
 
-        self._write_content(src_file_path, comp_file_path)
-        self._write_header(comp_file_path)
+    def _compress(self, data: bytes, comp: BinaryIO):
+        self._encode_symbols(io.BytesIO(data), comp)
+
+    def _encode_symbols(self, src: BinaryIO, comp: BinaryIO, index: Optional[BinaryIO]=None):
+        comp.write(bytes(self._get_header_size()))  # preserve space for header
+        self._write_content(src, comp, index)
+
+        # the dummies are only known once the content is written
+        end = comp.tell()
+        comp.seek(0)
+        self._write_header(comp)
+        comp.seek(end)
 
     def export_results(self, export_path: Path):
         with open(export_path, "w") as f:
             f.write(f"{'='*10} params {'='*10}\n")
             f.write(f"bytes per symbol: {self._bytes_per_symbol}\n")
-            f.write(f"chunk size: {chunk_size}\n")
+            f.write(f"chunk size: {self._chunk_size}\n")
+            f.write(f"shrink period: {self._shrink_period}\n")
             f.write(f"shrink factor: {self._shrink_factor}\n")
+            f.write(f"aging: {self._aging}\n")
+            f.write(f"evict after: {self._evict_after}\n")
+            f.write(f"drift window: {self._drift_window}\n")
+            f.write(f"drift threshold: {self._drift_threshold}\n")
+            f.write(f"context trees: {self._context_trees}\n")
+            f.write(f"filters: {self._filters}\n")
+            f.write(f"min ratio: {self._min_ratio}\n")
+            f.write(f"block size: {self._block_size}\n")
+            f.write(f"snapshot size: {self._snapshot_size}\n")
 
             f.write(f"\n{'='*10} statistics {'='*10}\n")
+            if self._cached_bytes is not None:
+                f.write(f"found in the result cache\n")
+                f.write(f"compression ratio: {self.compression_ratio}\n")
+                return
+            if self._estimate:
+                f.write(f"predicted compression ratio: {self._estimate.adaptive_ratio}\n")
+            if self._stored:
+                f.write(f"stored as is\n")
+                f.write(f"compression ratio: {self.compression_ratio}\n")
+                return
+
             f.write(f"total symbols: {self._symbol_cnt}\n")
             f.write(f"average codeword length: {self.avg_code_len}\n")
+            if self._block_size > 0:
+                f.write(f"coded blocks: {self._block_cnts[BLOCK_CODED]}\n")
+                f.write(f"stored blocks: {self._block_cnts[BLOCK_STORED]}\n")
             f.write(f"compression ratio: {self.compression_ratio}\n")
             f.write(f"shrink counts: {self._tree.shrink_cnt}\n")
+            if self._evict_after > 0:
+                f.write(f"evicted leaves: {self._tree.evicted_leaf_cnt}\n")
+            if self._snapshot_size > 0:
+                f.write(f"snapshots: {self._snapshot_cnt}\n")
+            if self._context_trees > 0:
+                f.write(f"evicted context trees: {self._tree.evicted_cnt}\n")
+
+            if self._tree_stats:
+                f.write(f"\n{'='*10} tree statistics {'='*10}\n")
+                for key, value in self.tree_stats.items():
+                    f.write(f"{key}: {value}\n")
 
     def _export_progress(self):
         with open(PROGRESS_FILE_NAME, "w") as f:
@@ -55,53 +200,158 @@ class AdaptiveEncoder(BaseEncoder):
         
         self._alert_cnt += 1
 
-    def _write_header(self, comp_file_path: str):
+    def _write_header(self, comp: BinaryIO):
         assert 0 <= self._dummy_codeword_bits < BITS_PER_BYTE
 
         """
             bits per symbol: 1 byte
             dummy codeword bits: 1 byte
             dummy codeword bytes: 1 byte
-            shrink period (Mb): 1 byte
+            shrink period (symbols): 8 bytes
             shrink factor: 1 byte
+            aging mode: 1 byte
+            evict after (shrinks): 1 byte
+            drift window (symbols): 4 bytes
+            drift threshold (1/16 bits per symbol): 1 byte
+            context trees: 2 bytes
+            block size: 4 bytes
+            filter chain length: 1 byte
+            filter chain: {filter id}{width}... (2 bytes per filter)
         """
 
-        with open(comp_file_path, "r+b") as f:
-            stream = BitOutStream(f, mode=IO_MODE_BYTE)
-            stream.write(chr(self._bits_per_symbol))
-            stream.write(chr(self._dummy_codeword_bits))
-            stream.write(chr(self._dummy_symbol_bytes))
-            stream.write(chr(self._chunk_size))
-            stream.write(chr(self._shrink_factor))
-
-    def _write_content(self, src_file_path: str, comp_file_path: str):
-        self._tree = AdaptiveHuffmanTree(self._bytes_per_symbol, ENCODE_MODE, self._chunk_size)
-        with open(src_file_path, "rb") as src, open(comp_file_path, "ab") as comp:
-            istream = BitInStream(src, mode=IO_MODE_BYTE)
-            ostream = BitOutStream(comp, mode=IO_MODE_BIT)
-
-            while True:
-                symbol = istream.read(self._bytes_per_symbol)
-
-                if len(symbol) == 0:
-                    break
-                elif len(symbol) < self._bytes_per_symbol:
-                    self._dummy_symbol_bytes = self._bytes_per_symbol - len(symbol)
-                    symbol += chr(0) * self._dummy_symbol_bytes
-                
+        stream = BitOutStream(comp, mode=IO_MODE_BYTE)
+        stream.write(chr(self._bits_per_symbol))
+        stream.write(chr(self._dummy_codeword_bits))
+        stream.write(chr(self._dummy_symbol_bytes))
+        stream.write(extended_chr(self._shrink_period, SHRINK_PERIOD_SIZE * BITS_PER_BYTE))
+        stream.write(chr(self._shrink_factor))
+        stream.write(chr(self._aging))
+        stream.write(chr(self._evict_after))
+        stream.write(extended_chr(self._drift_window, DRIFT_WINDOW_SIZE * BITS_PER_BYTE))
+        stream.write(chr(int(self._drift_threshold * DRIFT_THRESHOLD_UNIT)))
+        stream.write(extended_chr(self._context_trees, CONTEXT_TREES_SIZE * BITS_PER_BYTE))
+        self._write_block_size_header(stream)
+        self._write_filters_header(stream)
+
+    def _write_content(self, src: BinaryIO, comp: BinaryIO, index: Optional[BinaryIO]=None):
+        self._tree = self._build_tree()
+        self._start_timeline()
+        start = time.perf_counter()
+
+        if self._block_size > 0:
+            self._write_blocks(src, comp)
+        else:
+            self._write_symbols(src, comp, index)
+
+        self._coding_time = time.perf_counter() - start
+
+    def _build_tree(self):
+        tree_kwargs = dict(
+            shrink_period=self._shrink_period,
+            shrink_factor=self._shrink_factor,
+            aging=self._aging,
+            drift_window=self._drift_window,
+            drift_threshold=self._drift_threshold,
+            evict_after=self._evict_after,
+            stats=self._tree_stats,
+        )
+        if self._context_trees > 0:
+            tree = ContextHuffmanTree(ENCODE_MODE, self._context_trees, **tree_kwargs)
+        else:
+            tree = AdaptiveHuffmanTree(self._bytes_per_symbol, ENCODE_MODE, **tree_kwargs)
+
+        if self._primer:
+            # priming codes every symbol of the primer, restoring the primed tree of the last file is much cheaper
+            if self._primed_snapshot is None:
+                tree.prime(self._primer)
+                self._primed_snapshot = tree.snapshot()
+            else:
+                tree.restore(self._primed_snapshot)
+
+        return tree
+
+    def _write_symbols(self, src: BinaryIO, comp: BinaryIO, index: Optional[BinaryIO]=None):
+        # the codewords of a buffer of symbols are joined and written as whole bytes
+        snapshot_period = self._snapshot_size * BYTES_PER_MB // self._bytes_per_symbol  # in symbols
+        b = self._bytes_per_symbol
+        trailing_bits = ""  # bits insufficient to make a byte
+
+        while True:
+            buffer = src.read(BUFFER_SIZE - BUFFER_SIZE % b)
+            if len(buffer) == 0:
+                break
+            elif len(buffer) % b:
+                self._dummy_symbol_bytes = b - len(buffer) % b
+                buffer += bytes(self._dummy_symbol_bytes)
+
+            symbols = buffer.decode("latin-1")
+            codewords = [trailing_bits]
+            for i in range(0, len(symbols), b):
+                code = self._tree.encode(symbols[i:i+b])
+                codewords.append(code)
                 self._symbol_cnt += 1
+                self._bits_written += len(code)
 
-                for bit in self._tree.encode(symbol):
-                    ostream.write(bit)
-                    self._bits_written += 1
+                if index is not None and self._symbol_cnt % snapshot_period == 0:
+                    self._write_snapshot(index)
 
+                if self._should_alert():
+                    self._export_progress()
+
+            trailing_bits = self._write_bits(comp, "".join(codewords))
+            self._update_timeline(symbols[i:i+b] for i in range(0, len(symbols), b))
+
+        comp.write(bits_to_bytes(trailing_bits))
+        self._dummy_codeword_bits = -len(trailing_bits) % BITS_PER_BYTE
+
+    def _write_snapshot(self, index: BinaryIO):
+        snapshot = self._tree.snapshot()
+        index.write((self._symbol_cnt * self._bytes_per_symbol).to_bytes(SNAPSHOT_OFFSET_SIZE, "big"))
+        index.write(self._bits_written.to_bytes(SNAPSHOT_OFFSET_SIZE, "big"))
+        index.write(len(snapshot).to_bytes(SNAPSHOT_LEN_SIZE, "big"))
+        index.write(snapshot)
+        self._snapshot_cnt += 1
+
+    def _write_blocks(self, src: BinaryIO, comp: BinaryIO):
+        for block, symbols in self._read_blocks(src):
+            self._symbol_cnt += len(symbols)
+
+            # the block is coded by the live tree, then stored if that does not save space,
+            # stored blocks leave the adaptive tree untouched on both sides, so it is restored to its state before the block
+            snapshot = self._tree.snapshot()
+            codewords = "".join([self._tree.encode(symbol) for symbol in symbols])
+            if self._should_store_block(len(codewords), len(block)):
+                self._tree.restore(snapshot)
+                self._write_block(comp, BLOCK_STORED, block)
+            else:
+                self._write_coded_block(comp, codewords)
+            self._update_timeline(symbols)
+
+            if self._should_alert():
                 self._export_progress()
 
-            trailing_bits = ostream.flush()
-            self._dummy_codeword_bits = 0 if trailing_bits == 0 else BITS_PER_BYTE - trailing_bits
+    def _get_shrink_cnt(self) -> int:
+        return self._tree.shrink_cnt
+
+    def _get_cache_params(self) -> Dict:
+        params = super()._get_cache_params()
+        params.update(
+            shrink_period=self._shrink_period,
+            shrink_factor=self._shrink_factor,
+            aging=self._aging,
+            evict_after=self._evict_after,
+            drift_window=self._drift_window,
+            drift_threshold=self._drift_threshold,
+            context_trees=self._context_trees,
+            primer=self._primer,
+        )
+        return params
+
+    def _get_predicted_ratio(self, estimate: Estimate) -> float:
+        return estimate.adaptive_ratio
 
     def _get_header_size(self):
-        return 5
+        return ADAPTIVE_HEADER_SIZE + self._get_filters_header_size()
 
 
 if __name__ == "__main__":
@@ -113,16 +363,50 @@ if __name__ == "__main__":
         if export_path.exists():
             raise AssertionError(f"{export_path} already exists!")
 
-    bytes_per_symbol = int(kwargs.get("b", 1))
+    timeline_path = kwargs.get("timeline", None)
+    if timeline_path:
+        timeline_path = Path(timeline_path)
+        if timeline_path.exists():
+            raise AssertionError(f"{timeline_path} already exists!")
+
+    bytes_per_symbol = (
+        select_bytes_per_symbol(kwargs["in"], adaptive=True, max_symbols=int(kwargs.get("alphabet", DEFAULT_MAX_SYMBOLS)))
+        if kwargs.get("b") == "auto"
+        else int(kwargs.get("b", 1))
+    )
     verbose = int(kwargs.get("v", 0))
     chunk_size = int(kwargs.get("K", 0))
     shrink_factor = int(kwargs.get("alpha", 2))
+    filters = FilterPipeline.from_spec(kwargs["filters"]) if "filters" in kwargs else None
+    context_trees = int(kwargs.get("N", 0))
+    shrink_period = int(kwargs.get("Ks", 0))
+    aging = AGING_MODES[kwargs.get("aging", "full")]
+    evict_after = int(kwargs.get("E", 0))
+    drift_window = int(kwargs.get("drift", 0))
+    drift_threshold = float(kwargs.get("drift_th", 0.5))
+    min_ratio = float(kwargs["skip"]) if "skip" in kwargs else None
+    block_size = int(kwargs.get("B", 0)) * 1024
+    snapshot_size = int(kwargs.get("M", 0))
+    tree_stats = bool(int(kwargs.get("stats", 0)))
+    timeline = int(kwargs.get("T", 1)) if timeline_path else 0
+    result_cache = (
+        ResultCache(kwargs["cache"], int(kwargs.get("cache_size", DEFAULT_CACHE_SIZE)) * BYTES_PER_MB)
+        if "cache" in kwargs
+        else None
+    )
 
     src = kwargs["in"]
     comp = kwargs.get("out", f"{src}.{COMP_FILE_EXTENSION}")
 
-    encoder = AdaptiveEncoder(bytes_per_symbol, verbose, chunk_size, shrink_factor)
+    encoder = AdaptiveEncoder(
+        bytes_per_symbol, verbose, chunk_size, shrink_factor, filters, context_trees,
+        shrink_period, aging, drift_window, drift_threshold, min_ratio, block_size,
+        snapshot_size=snapshot_size, result_cache=result_cache, tree_stats=tree_stats,
+        evict_after=evict_after, timeline=timeline,
+    )
     encoder.encode(src, comp)
 
     if export_path:
         encoder.export_results(export_path)
+    if timeline_path:
+        encoder.export_timeline(timeline_path)
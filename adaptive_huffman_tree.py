@@ -1,6 +1,10 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from math import log2
+from time import perf_counter
+import io
 
-from utils import BITS_PER_BYTE, BYTES_PER_MB, extended_chr, extended_ord
+from utils import BITS_PER_BYTE, extended_chr, extended_ord
 from adaptive_nodes import BaseNode, Node, NYT
 from block import BlockManager
 
@@ -8,18 +12,118 @@ from block import BlockManager
 ENCODE_MODE = "ENCODE"
 DECODE_MODE = "DECODE"
 
+AGING_FULL = 0  # shrink the entire tree at once
+AGING_INCREMENTAL = 1  # spread the shrink over the following symbols, a few leaves at a time
+AGING_MODES = {"full": AGING_FULL, "incremental": AGING_INCREMENTAL}
+
+# node kinds of a snapshot, whose nodes are listed in preorder
+SNAPSHOT_INTERNAL = 0
+SNAPSHOT_LEAF = 1
+SNAPSHOT_NYT = 2
+
+class TreeStats:
+    # counters of the work done by a tree, only kept if the tree is created with `stats=True`
+    def __init__(self):
+        self.symbol_cnt: int = 0
+        self.swap_cnt: int = 0
+        self.depth_update_cnt: int = 0  # nodes whose depth is updated after a swap
+        self.escape_cnt: int = 0  # symbols new to the tree, coded after the NYT code
+        self.escape_bits: int = 0  # NYT codes along with the raw / fallback bits
+        self.evict_cnt: int = 0  # cold leaves removed from the tree
+        self.shrink_times: List[float] = []  # in seconds
+        self.update_time: float = 0  # time spent updating the tree after each symbol, including shrinks
+
+    def merge(self, stats):
+        self.symbol_cnt += stats.symbol_cnt
+        self.swap_cnt += stats.swap_cnt
+        self.depth_update_cnt += stats.depth_update_cnt
+        self.escape_cnt += stats.escape_cnt
+        self.escape_bits += stats.escape_bits
+        self.evict_cnt += stats.evict_cnt
+        self.shrink_times += stats.shrink_times
+        self.update_time += stats.update_time
+
+    def to_dict(self) -> Dict:
+        per_symbol = lambda cnt: cnt / self.symbol_cnt if self.symbol_cnt > 0 else 0
+        return {
+            "symbols": self.symbol_cnt,
+            "swaps": self.swap_cnt,
+            "swaps per symbol": per_symbol(self.swap_cnt),
+            "depth updates": self.depth_update_cnt,
+            "depth updates per symbol": per_symbol(self.depth_update_cnt),
+            "escapes": self.escape_cnt,
+            "escape bits": self.escape_bits,
+            "evicted leaves": self.evict_cnt,
+            "shrinks": len(self.shrink_times),
+            "shrink time": sum(self.shrink_times),
+            "max shrink time": max(self.shrink_times, default=0),
+            "update time": self.update_time,
+        }
+
+
+def _put_varint(buffer: bytearray, value: int):
+    assert value >= 0
+    while value >= 0x80:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def _get_varint(stream: io.BytesIO) -> int:
+    value = 0
+    shift = 0
+    while True:
+        byte = stream.read(1)[0]
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value
+        shift += 7
+
+
 class AdaptiveHuffmanTree:
-    def __init__(self, bytes_per_symbol: int, mode: str, chunk_size: int = 0, shrink_factor: int = 2):
+    AGING_STEP = 4  # leaves aged per symbol in incremental aging mode
+
+    def __init__(
+        self,
+        bytes_per_symbol: int,
+        mode: str,
+        shrink_period: int = 0,
+        shrink_factor: int = 2,
+        fallback=None,
+        aging: int = AGING_FULL,
+        drift_window: int = 0,
+        drift_threshold: float = 0,
+        stats: bool = False,
+        evict_after: int = 0,
+    ):
         self._bytes_per_symbol: int = bytes_per_symbol
         self._bits_per_symbol: int = bytes_per_symbol * BITS_PER_BYTE
 
         assert mode in (ENCODE_MODE, DECODE_MODE)
         self._mode = mode
 
-        self._chunk_size: int = chunk_size * BYTES_PER_MB
+        # ===== shrink =====
+        self._shrink_period: int = shrink_period  # in symbols, 0 for never shrink periodically
+        self._periodic_shrink_cnt: int = 0
         self._shrink_cnt: int = 0
         self._shrink_factor: int = shrink_factor
 
+        assert aging in AGING_MODES.values()
+        self._aging: int = aging
+        self._aging_leaves: List[Node] = []  # leaves yet to be shrunk in incremental aging mode
+
+        # a leaf still at the floor weight for `evict_after` consecutive shrinks is removed from the tree,
+        # so that the tree tracks the working set instead of every symbol ever seen, 0 for never
+        assert evict_after >= 0
+        self._evict_after: int = evict_after
+        self._evicted_leaf_cnt: int = 0
+
+        # shrink whenever the average code length of a window exceeds its entropy by `drift_threshold` bits
+        self._drift_window: int = drift_window  # in symbols, 0 for disabled
+        self._drift_threshold: float = drift_threshold
+        self._window_bits: int = 0
+        self._window_dist: Dict[int, int] = {}
+        self._bits_since_symbol: int = 0  # for decoder
+
         self._symbol_cnt: int = 0
 
         self._nyt: NYT = NYT(self._bits_per_symbol)
@@ -27,8 +131,14 @@ class AdaptiveHuffmanTree:
 
         self._block_manager: BlockManager = BlockManager()
 
+        # if given, symbols new to this tree are coded by the fallback tree instead of their raw bits
+        self._fallback: Optional[AdaptiveHuffmanTree] = fallback
+
         self._node_id: int = 0  # assign unique id to each node (for debug purpose)
 
+        # None unless enabled, every counter costs a check on the hot path
+        self._stats: Optional[TreeStats] = TreeStats() if stats else None
+
         # for encoder
         self._ord_node_dict: Dict[int, Node]  = {}
 
@@ -60,6 +170,40 @@ class AdaptiveHuffmanTree:
     def shrink_cnt(self) -> int:
         return self._shrink_cnt
 
+    @property
+    def evicted_leaf_cnt(self) -> int:
+        return self._evicted_leaf_cnt
+
+    @property
+    def stats(self) -> Dict:
+        # the counters, along with the shape of the tree at this point
+        assert self._stats is not None, "stats are not enabled"
+        return {**self._stats.to_dict(), **self._shape_stats()}
+
+    def _shape_stats(self) -> Dict:
+        node_depths = Counter()
+        code_lens = Counter()  # of the leaves, the depth of a leaf is the length of its code
+        stack = [(self._root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            node_depths[depth] += 1
+
+            if isinstance(node, Node) and not node.is_symbol:
+                stack.append((node.left, depth + 1))
+                stack.append((node.right, depth + 1))
+            elif isinstance(node, Node):
+                code_lens[depth] += 1
+
+        block_sizes = Counter(len(nodes) for _, nodes in self._block_manager.blocks)
+        return {
+            "leaves": sum(code_lens.values()),
+            "nodes": sum(node_depths.values()),
+            "blocks": sum(block_sizes.values()),
+            "block sizes": dict(sorted(block_sizes.items())),
+            "node depths": dict(sorted(node_depths.items())),
+            "code lengths": dict(sorted(code_lens.items())),
+        }
+
     def __str__(self):
         # (depth, Node)
         queue: List[BaseNode] = [self._root]
@@ -82,6 +226,189 @@ class AdaptiveHuffmanTree:
 
         return s
 
+    def prime(self, primer: List[Tuple[str, int]]):
+        # code each (symbol, weight) `weight` times without output, identically by encoder and decoder,
+        # so the tree starts from a known distribution instead of an empty one
+        mode = self._mode
+        self._mode = ENCODE_MODE
+
+        for symbol, weight in primer:
+            for _ in range(weight):
+                self.encode(symbol)
+
+        self._mode = mode
+        if mode == DECODE_MODE:
+            self._ord_node_dict = {}
+        self._cur = self._root
+
+    def snapshot(self) -> bytes:
+        """
+            the state between two symbols, restored by `restore` into a tree created with the same params
+            every number is a varint (7 bits per byte, the high bit set on all but the last byte)
+
+            symbol count, periodic shrink count, shrink count, node id, window bits
+            evicted leaf count (with eviction only)
+            node count
+            nodes in preorder: {kind}{weight}{order}{cold count}...
+                kind: 1 byte (internal / leaf / NYT)
+                weight: not for NYT
+                order: leaf only
+                cold count: leaf only, with eviction only
+            block count
+            blocks, in the order they were created: {weight delta}{size}{node index}... or {weight delta}{0}{run}
+                weight delta: zigzag coded difference from the weight of the previous block
+                node index: in heap order
+                run: number of the following empty blocks, whose weights go up by 1
+            aging leaves: {count}{node index}...
+            window distribution: {count}{{order}{count}}...
+        """
+
+        # the fallback tree of a context tree is not part of its state, see ContextHuffmanTree.snapshot
+        assert self._mode == ENCODE_MODE or self._cur == self._root
+
+        nodes: List[BaseNode] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+
+            if isinstance(node, Node) and not node.is_symbol:
+                stack.append(node.right)
+                stack.append(node.left)
+
+        index = {id(node): i for i, node in enumerate(nodes)}
+
+        snapshot = bytearray()
+        put = lambda value: _put_varint(snapshot, value)
+
+        for value in (self._symbol_cnt, self._periodic_shrink_cnt, self._shrink_cnt, self._node_id, self._window_bits):
+            put(value)
+        if self._evict_after > 0:
+            put(self._evicted_leaf_cnt)
+
+        put(len(nodes))
+        for node in nodes:
+            if isinstance(node, NYT):
+                snapshot.append(SNAPSHOT_NYT)
+            elif node.is_symbol:
+                snapshot.append(SNAPSHOT_LEAF)
+                put(node.weight)
+                put(node.order)
+                if self._evict_after > 0:
+                    put(node.cold_cnt)
+            else:
+                snapshot.append(SNAPSHOT_INTERNAL)
+                put(node.weight)
+
+        # empty blocks are kept, since a block refilled later takes its original place in the order
+        blocks = self._block_manager.blocks
+        put(len(blocks))
+        prev_weight = 0
+        i = 0
+        while i < len(blocks):
+            weight, block_nodes = blocks[i]
+            delta = weight - prev_weight
+            put(2 * delta if delta >= 0 else -2 * delta - 1)
+            put(len(block_nodes))
+
+            run = 0
+            if block_nodes:
+                for node in block_nodes:
+                    put(index[id(node)])
+            else:
+                # the weight of each node passes through a block of every weight, most of which end up empty
+                while i + run + 1 < len(blocks) and blocks[i+run+1] == (weight + run + 1, []):
+                    run += 1
+                put(run)
+
+            prev_weight = weight + run
+            i += run + 1
+
+        put(len(self._aging_leaves))
+        for leaf in self._aging_leaves:
+            put(index[id(leaf)])
+
+        put(len(self._window_dist))
+        for order, cnt in self._window_dist.items():
+            put(order)
+            put(cnt)
+
+        return bytes(snapshot)
+
+    def restore(self, snapshot: bytes):
+        # replace the state of the tree with the one of `snapshot`
+        self._nyt = NYT(self._bits_per_symbol)
+
+        stream = io.BytesIO(snapshot)
+        get = lambda: _get_varint(stream)
+
+        self._symbol_cnt = get()
+        self._periodic_shrink_cnt = get()
+        self._shrink_cnt = get()
+        self._node_id = get()
+        self._window_bits = get()
+        if self._evict_after > 0:
+            self._evicted_leaf_cnt = get()
+
+        nodes: List[BaseNode] = []
+        open_nodes: List[Node] = []  # internal nodes yet to get their right child
+        for i in range(get()):
+            kind = stream.read(1)[0]
+            parent = open_nodes[-1] if open_nodes else None
+
+            if kind == SNAPSHOT_NYT:
+                node = self._nyt
+                if parent is not None:
+                    node.set_parent(parent)
+            else:
+                weight = get()
+                order = get() if kind == SNAPSHOT_LEAF else -1
+                cold_cnt = get() if kind == SNAPSHOT_LEAF and self._evict_after > 0 else 0
+                node = Node(id=i, parent=parent, weight=weight, order=order, cold_cnt=cold_cnt)
+
+            if parent is not None:
+                if parent.left is None:
+                    parent.set_left(node)
+                else:
+                    parent.set_right(node)
+                    open_nodes.pop()
+
+            if kind == SNAPSHOT_INTERNAL:
+                open_nodes.append(node)
+            nodes.append(node)
+
+        self._root = nodes[0]
+        self._cur = self._root
+
+        leaves = [node for node in nodes if isinstance(node, Node) and node.is_symbol]
+        self._nyt._transmitted_set = {leaf.order for leaf in leaves}
+        if self._mode == ENCODE_MODE:
+            self._ord_node_dict = {leaf.order: leaf for leaf in leaves}
+
+        self._block_manager = BlockManager()
+        block_cnt = get()
+        weight = 0
+        while block_cnt > 0:
+            delta = get()
+            weight += delta // 2 if delta % 2 == 0 else -(delta + 1) // 2
+
+            block_nodes = [nodes[get()] for _ in range(get())]
+            self._block_manager.restore_block(weight, block_nodes)
+            block_cnt -= 1
+
+            if not block_nodes:
+                for _ in range(get()):
+                    weight += 1
+                    self._block_manager.restore_block(weight, [])
+                    block_cnt -= 1
+
+        self._aging_leaves = [nodes[get()] for _ in range(get())]
+
+        self._window_dist = {}
+        for _ in range(get()):
+            order = get()
+            self._window_dist[order] = get()
+
     def encode(self, symbol: str) -> str:
         self._symbol_cnt += 1
         order = extended_ord(symbol)
@@ -92,13 +419,12 @@ class AdaptiveHuffmanTree:
             # tree updated in create_new_node
         else:
             code = self._encode_existing_symbol(node)
+            start = perf_counter() if self._stats else 0
             self._update(node)
+            if self._stats:
+                self._stats.update_time += perf_counter() - start
 
-        self._block_manager.update()
-
-        if self._should_shrink():
-            self._shrink()
-    
+        self._on_symbol(order, len(code))
         return code
 
     def decode(self, bit: str) -> Optional[str]:
@@ -106,20 +432,29 @@ class AdaptiveHuffmanTree:
         # self._cur should be set to self._root
 
         assert bit == "0" or bit == "1"
+        self._bits_since_symbol += 1
 
         if isinstance(self._cur, NYT):
-            symbol = self._nyt.decode(bit)
+            symbol = (
+                self._fallback.decode(bit)
+                if self._fallback
+                else self._nyt.decode(bit)
+            )
 
             if symbol is not None:
                 self._symbol_cnt += 1
-                self._create_new_node(extended_ord(symbol))
+                order = extended_ord(symbol)
+                if self._stats:
+                    self._stats.escape_cnt += 1
+                    self._stats.escape_bits += self._bits_since_symbol
+                    start = perf_counter()
+                self._create_new_node(order)
                 # tree updated in create_new_node
+                if self._stats:
+                    self._stats.update_time += perf_counter() - start
 
                 self._cur = self._root
-                self._block_manager.update()
-
-                if self._should_shrink():
-                    self._shrink()
+                self._on_symbol(order, self._bits_since_symbol)
 
             return symbol
 
@@ -131,22 +466,59 @@ class AdaptiveHuffmanTree:
 
         if isinstance(self._cur, Node) and self._cur.is_symbol:
             self._symbol_cnt += 1
-            symbol = extended_chr(self._cur.order, self._bits_per_symbol)
+            order = self._cur.order
+            symbol = extended_chr(order, self._bits_per_symbol)
 
+            start = perf_counter() if self._stats else 0
             self._update(self._cur)
+            if self._stats:
+                self._stats.update_time += perf_counter() - start
             self._cur = self._root
-            self._block_manager.update()
-
-            if self._should_shrink():
-                self._shrink()
+            self._on_symbol(order, self._bits_since_symbol)
 
             return symbol
         else:
             return None
 
+    def _on_symbol(self, order: int, code_len: int):
+        # called once the tree is updated for a symbol, identically by encoder and decoder
+        if self._stats:
+            self._stats.symbol_cnt += 1
+            start = perf_counter()
+
+        self._bits_since_symbol = 0
+        self._block_manager.update()
+
+        if self._aging_leaves:
+            self._age(self.AGING_STEP)
+
+        drifted = self._detect_drift(order, code_len)
+
+        if self._should_shrink():
+            self._periodic_shrink_cnt += 1
+            self._start_shrink()
+        elif drifted and isinstance(self._root, Node):
+            self._start_shrink()
+
+        if self._stats:
+            self._stats.update_time += perf_counter() - start
+
     def _encode_new_symbol(self, order: int) -> str:
-        code = self._encode_existing_symbol(self._nyt) + self._nyt.encode(order)
+        code = self._encode_existing_symbol(self._nyt) + (
+            self._fallback.encode(extended_chr(order, self._bits_per_symbol))
+            if self._fallback
+            else self._nyt.encode(order)
+        )
+
+        if self._stats:
+            self._stats.escape_cnt += 1
+            self._stats.escape_bits += len(code)
+            start = perf_counter()
+
         self._create_new_node(order)
+
+        if self._stats:
+            self._stats.update_time += perf_counter() - start
         return code
 
     def _encode_existing_symbol(self, node: BaseNode) -> str:
@@ -175,8 +547,11 @@ class AdaptiveHuffmanTree:
         )
         if new_internal.parent is None:
             self._root = new_internal
-        else:
+        elif new_internal.parent.left == self._nyt:
             new_internal.parent.set_left(new_internal)
+        else:
+            # the NYT takes the place of the parent of an evicted leaf, which may be a right child
+            new_internal.parent.set_right(new_internal)
 
         new_node = Node(
             id=self._get_next_node_id(),
@@ -215,6 +590,9 @@ class AdaptiveHuffmanTree:
 
     def _swap(self, n1: Node, n2: Node):
         # swap the entire subtrees
+        if self._stats:
+            self._stats.swap_cnt += 1
+
         p1 = n1.parent
         n1_is_left = (p1.left == n1)
 
@@ -242,6 +620,8 @@ class AdaptiveHuffmanTree:
 
         node.update_depth()
         self._block_manager.add_update(node.weight)
+        if self._stats:
+            self._stats.depth_update_cnt += 1
 
         if node.left:
             self._update_depth(node.left)
@@ -249,11 +629,53 @@ class AdaptiveHuffmanTree:
 
     def _should_shrink(self) -> bool:
         return (
-            self._chunk_size > 0 and isinstance(self._root, Node) and
-            self._symbol_cnt * self._bytes_per_symbol > self._chunk_size * (self._shrink_cnt+1)
+            self._shrink_period > 0 and isinstance(self._root, Node) and
+            self._symbol_cnt > self._shrink_period * (self._periodic_shrink_cnt+1)
         )
 
+    def _detect_drift(self, order: int, code_len: int) -> bool:
+        if self._drift_window == 0:
+            return False
+
+        self._window_bits += code_len
+        self._window_dist[order] = self._window_dist.get(order, 0) + 1
+
+        if self._symbol_cnt % self._drift_window != 0:
+            return False
+
+        ent = 0
+        for cnt in self._window_dist.values():
+            p = cnt / self._drift_window
+            ent -= p * log2(p)
+
+        drifted = self._window_bits / self._drift_window - ent > self._drift_threshold
+
+        self._window_bits = 0
+        self._window_dist = {}
+
+        return drifted
+
+    def _start_shrink(self):
+        self._shrink_cnt += 1
+        start = perf_counter() if self._stats else 0
+
+        if self._aging == AGING_FULL:
+            self._evict_cold_leaves()
+            self._shrink()
+        else:
+            # finish the previous pass first
+            self._age(len(self._aging_leaves))
+            self._evict_cold_leaves()
+            self._aging_leaves = self._get_leaves()
+
+        if self._stats:
+            self._stats.shrink_times.append(perf_counter() - start)
+
     def _shrink(self):
+        if not isinstance(self._root, Node):
+            # every leaf was evicted, the tree is back to the NYT alone
+            return
+
         def shrink(node: Node):
             if isinstance(node.left, Node):
                 shrink(node.left)
@@ -265,7 +687,83 @@ class AdaptiveHuffmanTree:
             else:
                 node.update_weight()
 
-        assert self._should_shrink()        
-        self._shrink_cnt += 1
         shrink(self._root)
         self._block_manager.shrink()
+
+    def _evict_cold_leaves(self):
+        # identically by encoder and decoder, before the weights are shrunk
+        if self._evict_after == 0:
+            return
+
+        cold_leaves = []
+        for leaf in self._get_leaves():
+            leaf.update_cold_cnt()
+            if leaf.cold_cnt >= self._evict_after:
+                cold_leaves.append(leaf)
+
+        for leaf in cold_leaves:
+            self._remove_leaf(leaf)
+
+        self._block_manager.update()
+        self._cur = self._root
+
+    def _remove_leaf(self, leaf: Node):
+        # the sibling of the leaf takes the place of their parent, the symbol is escaped again when next coded
+        parent = leaf.parent
+        sibling = parent.left if parent.right == leaf else parent.right
+
+        node = parent.parent
+        while node is not None:
+            self._block_manager.decrease_node_weight(node, leaf.weight)
+            node = node.parent
+
+        self._block_manager.remove(leaf)
+        self._block_manager.remove(parent)
+
+        grandparent = parent.parent
+        if grandparent is None:
+            sibling.detach()
+            self._root = sibling
+        else:
+            if grandparent.left == parent:
+                grandparent.set_left(sibling)
+            else:
+                grandparent.set_right(sibling)
+            sibling.set_parent(grandparent)
+        self._update_depth(sibling)
+
+        self._ord_node_dict.pop(leaf.order, None)
+        self._nyt.forget(leaf.order)
+
+        self._evicted_leaf_cnt += 1
+        if self._stats:
+            self._stats.evict_cnt += 1
+
+    def _get_leaves(self) -> List[Node]:
+        # in a deterministic order
+        leaves = []
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, Node):
+                continue
+
+            if node.is_symbol:
+                leaves.append(node)
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+
+        return leaves
+
+    def _age(self, leaf_cnt: int):
+        # shrink the weights of the next `leaf_cnt` leaves, along with their ancestors
+        for _ in range(min(leaf_cnt, len(self._aging_leaves))):
+            leaf = self._aging_leaves.pop()
+            delta = leaf.weight - max(1, leaf.weight // self._shrink_factor)
+
+            node = leaf
+            while delta > 0 and node is not None:
+                self._block_manager.decrease_node_weight(node, delta)
+                node = node.parent
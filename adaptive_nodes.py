@@ -44,6 +44,11 @@ class BaseNode:
     def update_depth(self):
         self._depth = 0 if self._parent is None else self.parent.depth + 1
 
+    def detach(self):
+        # make the node a root
+        self._parent = None
+        self._depth = 0
+
     def set_left(self, node):
         assert isinstance(node, BaseNode)
         self._left = node
@@ -61,9 +66,10 @@ class BaseNode:
         raise NotImplementedError
 
 class Node(BaseNode):
-    def __init__(self, id: int, parent: BaseNode, weight: int, order: int=-1):
+    def __init__(self, id: int, parent: BaseNode, weight: int, order: int=-1, cold_cnt: int=0):
         super().__init__(id=id, weight=weight, parent=parent)
         self._order = order
+        self._cold_cnt = cold_cnt  # consecutive shrinks a leaf has spent at the floor weight
 
     def __str__(self):
         if self.is_symbol:
@@ -82,6 +88,15 @@ class Node(BaseNode):
     def is_symbol(self) -> bool:
         return self._order >= 0
 
+    @property
+    def cold_cnt(self) -> int:
+        return self._cold_cnt
+
+    def update_cold_cnt(self):
+        # called before a shrink, a leaf not coded since the last shrink is still at the floor weight
+        assert self.is_symbol
+        self._cold_cnt = self._cold_cnt + 1 if self._weight == 1 else 0
+
     def update_weight(self):
         assert not self.is_symbol
         self._weight = self._left.weight + self._right.weight
@@ -99,6 +114,10 @@ class Node(BaseNode):
     def increment_weight(self):
         self._weight += 1
 
+    def decrease_weight(self, delta: int):
+        assert 0 < delta < self._weight
+        self._weight -= delta
+
 class NYT(BaseNode):
     def __init__(self, bits_per_symbol: int):
         super().__init__(id=0, weight=0, parent=None)
@@ -115,6 +134,10 @@ class NYT(BaseNode):
         assert isinstance(parent, Node)
         self._parent = parent
 
+    def forget(self, order: int):
+        # the symbol is escaped again the next time it is coded
+        self._transmitted_set.discard(order)
+
     def encode(self, order: int) -> str:
         assert order not in self._transmitted_set
         self._transmitted_set.add(order)
@@ -0,0 +1,160 @@
+from typing import Dict, List, Optional, Tuple
+from math import log2
+import heapq
+
+from utils import extended_chr, extended_ord
+
+
+MIN_TABLE_LOG = 5  # the spread step is odd from a table of 32 states
+DEFAULT_TABLE_LOG = 11
+MAX_TABLE_LOG = 16
+STATE_SIZE = 2  # bytes of the final state, below 2 ** MAX_TABLE_LOG
+
+_BIT_FORMATS = [f"0{nb}b" for nb in range(MAX_TABLE_LOG + 1)]
+
+
+def select_table_log(symbol_cnt: int) -> Optional[int]:
+    # the table must hold every symbol at least once, None if it would be too large
+    table_log = max(DEFAULT_TABLE_LOG, symbol_cnt.bit_length() + 1)
+    return table_log if table_log <= MAX_TABLE_LOG else None
+
+
+def normalize_counts(symbol_distribution: Dict[str, int], table_log: int) -> Dict[str, int]:
+    # scale the counts to sum to 2 ** table_log, each symbol keeps a count of at least 1
+    # the rounding error is settled one unit at a time, where it costs the fewest bits
+    table_size = 2 ** table_log
+    assert len(symbol_distribution) <= table_size
+
+    total = sum(symbol_distribution.values())
+    normalized = {symbol: max(1, cnt * table_size // total) for symbol, cnt in symbol_distribution.items()}
+    diff = table_size - sum(normalized.values())
+
+    def cost(symbol: str) -> float:
+        # bits lost by moving the count of `symbol` one unit towards the target, lowest first
+        n = normalized[symbol]
+        if diff > 0:
+            return -symbol_distribution[symbol] * log2((n + 1) / n)
+        return symbol_distribution[symbol] * log2(n / (n - 1)) if n > 1 else float("inf")
+
+    heap = [(cost(symbol), symbol) for symbol in normalized]
+    heapq.heapify(heap)
+    step = 1 if diff > 0 else -1
+    while diff != 0:
+        _, symbol = heapq.heappop(heap)
+        normalized[symbol] += step
+        diff -= step
+        heapq.heappush(heap, (cost(symbol), symbol))
+
+    return normalized
+
+
+class ANSTable:
+    # tabled asymmetric numeral systems: a symbol of normalized count n takes log2(2 ** table_log / n) bits,
+    # a fraction of a bit for the frequent ones, and is coded and decoded by table lookups on an integer state
+    # symbols are encoded backwards so that the decoder reads the bits forwards
+    # the escape is followed by `bits_per_symbol` raw bits, as the escape codeword of the huffman table
+
+    def __init__(
+        self,
+        normalized_counts: Dict[str, int],
+        table_log: int,
+        escape: Optional[str]=None,
+        bits_per_symbol: int=8,
+    ):
+        assert MIN_TABLE_LOG <= table_log <= MAX_TABLE_LOG
+        size = 2 ** table_log
+        assert sum(normalized_counts.values()) == size and min(normalized_counts.values()) > 0
+
+        self._table_log: int = table_log
+        self._size: int = size
+        self._counts: Dict[str, int] = normalized_counts
+        self._escape: Optional[str] = escape
+        self._bits_per_symbol: int = bits_per_symbol
+
+        # spread the symbols over the states, an odd step visits every state once
+        spread: List[str] = [""] * size
+        step = (size >> 1) + (size >> 3) + 3
+        pos = 0
+        for symbol, cnt in normalized_counts.items():
+            for _ in range(cnt):
+                spread[pos] = symbol
+                pos = (pos + step) & (size - 1)
+
+        # ===== decoding: state -> symbol, bits to read, base of the next state =====
+        self._decode_symbols: List[str] = spread
+        self._decode_bits: List[int] = [0] * size
+        self._decode_bases: List[int] = [0] * size
+
+        # ===== encoding: symbol -> the states it leads to, by the state shifted into [count, 2 * count) =====
+        self._encode_states: Dict[str, List[int]] = {symbol: [] for symbol in normalized_counts}
+        self._encode_bits: Dict[str, int] = {}  # bits output, one less below `count << bits`
+        self._encode_limits: Dict[str, int] = {}
+
+        next_x = dict(normalized_counts)
+        for state, symbol in enumerate(spread):
+            x = next_x[symbol]
+            next_x[symbol] += 1
+
+            nb = table_log - x.bit_length() + 1
+            self._decode_bits[state] = nb
+            self._decode_bases[state] = (x << nb) - size
+            self._encode_states[symbol].append(size + state)
+
+        for symbol, cnt in normalized_counts.items():
+            nb = table_log - cnt.bit_length() + 1
+            self._encode_bits[symbol] = nb
+            self._encode_limits[symbol] = cnt << nb
+
+    @property
+    def table_log(self) -> int:
+        return self._table_log
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return self._counts
+
+    def cost(self, symbol: str) -> float:
+        # bits taken by a symbol on average
+        cnt = self._counts.get(symbol)
+        if cnt is None or symbol == self._escape:
+            return self._table_log - log2(self._counts[self._escape]) + self._bits_per_symbol
+        return self._table_log - log2(cnt)
+
+    def encode(self, symbols: List[str]) -> Tuple[int, str]:
+        # return the final state and the bits of the symbols
+        states, bits, limits, counts = self._encode_states, self._encode_bits, self._encode_limits, self._counts
+        x = self._size  # the decoder ends on this state
+        chunks = []
+
+        for symbol in reversed(symbols):
+            if symbol not in counts:
+                chunks.append(format(extended_ord(symbol), f"0{self._bits_per_symbol}b"))
+                symbol = self._escape
+
+            nb = bits[symbol] - (x < limits[symbol])
+            if nb:
+                chunks.append(format(x & ((1 << nb) - 1), _BIT_FORMATS[nb]))
+            x = states[symbol][(x >> nb) - counts[symbol]]
+
+        chunks.reverse()
+        return x - self._size, "".join(chunks)
+
+    def decode(self, state: int, bits: str, symbol_cnt: int) -> str:
+        decode_symbols, decode_bits, decode_bases = self._decode_symbols, self._decode_bits, self._decode_bases
+        escape, bits_per_symbol = self._escape, self._bits_per_symbol
+        symbols = []
+        pos = 0
+
+        for _ in range(symbol_cnt):
+            symbol = decode_symbols[state]
+            nb = decode_bits[state]
+            state = decode_bases[state] + (int(bits[pos:pos+nb], 2) if nb else 0)
+            pos += nb
+
+            if symbol == escape:
+                symbol = extended_chr(int(bits[pos:pos+bits_per_symbol], 2), bits_per_symbol)
+                pos += bits_per_symbol
+            symbols.append(symbol)
+
+        assert state == 0 and pos == len(bits)
+        return "".join(symbols)
@@ -0,0 +1,106 @@
+from typing import Optional
+from concurrent.futures import Executor
+from functools import partial
+import asyncio
+
+from utils import BYTES_PER_MB
+from codec import CODER_STATIC, CODER_ADAPTIVE, CODER_IDS
+import codec
+
+
+# each chunk is coded independently into a frame: {frame type}{payload size}{payload}
+# the stream ends with a frame of type FRAME_END and an empty payload
+FRAME_END = 0
+FRAME_STATIC = 1
+FRAME_ADAPTIVE = 2
+FRAME_LEN_SIZE = 4
+
+# the frame type is the coder id of the in-memory api
+assert (FRAME_STATIC, FRAME_ADAPTIVE) == (CODER_IDS[CODER_STATIC], CODER_IDS[CODER_ADAPTIVE])
+
+# the event loop only moves bytes, coding of each chunk is offloaded to the executor
+# so the chunk size bounds both the memory and the work per executor job
+DEFAULT_CHUNK_SIZE = BYTES_PER_MB
+
+
+def _encode_chunk(chunk: bytes, coder: str, bytes_per_symbol: int) -> bytes:
+    # return {frame type}{payload size}{payload}
+    payload = codec.compress(chunk, coder, bytes_per_symbol)
+    frame_type, payload = payload[0], payload[1:]
+    return bytes((frame_type,)) + len(payload).to_bytes(FRAME_LEN_SIZE, "big") + payload
+
+
+def _decode_chunk(frame_type: int, payload: bytes) -> bytes:
+    assert frame_type in (FRAME_STATIC, FRAME_ADAPTIVE)
+    return codec.decompress(bytes((frame_type,)) + payload)
+
+
+async def _read_chunk(reader: asyncio.StreamReader, chunk_size: int) -> bytes:
+    # read until `chunk_size` bytes or EOF
+    chunk = b""
+    while len(chunk) < chunk_size:
+        data = await reader.read(chunk_size - len(chunk))
+        if not data:
+            break
+        chunk += data
+
+    return chunk
+
+
+async def encode_stream(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    coder: str = CODER_STATIC,
+    bytes_per_symbol: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    executor: Optional[Executor] = None,
+):
+    # pass a ProcessPoolExecutor to code in parallel with the event loop,
+    # the default executor of the loop shares the GIL with it
+    assert coder in (CODER_STATIC, CODER_ADAPTIVE)
+    assert chunk_size > 0 and chunk_size % bytes_per_symbol == 0
+
+    loop = asyncio.get_running_loop()
+    pending = None  # the chunk being coded while the next one is read
+
+    while True:
+        chunk = await _read_chunk(reader, chunk_size)
+
+        if pending is not None:
+            writer.write(await pending)
+            await writer.drain()  # back pressure from the peer
+            pending = None
+
+        if not chunk:
+            break
+
+        pending = loop.run_in_executor(executor, partial(_encode_chunk, chunk, coder, bytes_per_symbol))
+
+    writer.write(bytes((FRAME_END,)) + (0).to_bytes(FRAME_LEN_SIZE, "big"))
+    await writer.drain()
+
+
+async def decode_stream(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    executor: Optional[Executor] = None,
+):
+    loop = asyncio.get_running_loop()
+    pending = None
+
+    while True:
+        frame_type = (await reader.readexactly(1))[0]
+        payload_size = int.from_bytes(await reader.readexactly(FRAME_LEN_SIZE), "big")
+        payload = await reader.readexactly(payload_size)
+
+        if pending is not None:
+            writer.write(await pending)
+            await writer.drain()
+            pending = None
+
+        if frame_type == FRAME_END:
+            break
+
+        pending = loop.run_in_executor(executor, partial(_decode_chunk, frame_type, payload))
+
+    await writer.drain()
@@ -1,7 +1,45 @@
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+from collections import Counter
 from math import ceil
+from pathlib import Path
+import tempfile
+import shutil
+import os
 import io
 
-from utils import MAX_BYTE_PER_SYMBOL, BITS_PER_BYTE, BYTES_PER_MB
+from utils import (
+    MAX_BYTE_PER_SYMBOL,
+    BITS_PER_BYTE,
+    BYTES_PER_MB,
+    BUFFER_SIZE,
+    STORED_FORMAT_ID,
+    BLOCK_SIZE_SIZE,
+    bits_to_bytes,
+    bytes_to_bits,
+)
+from filters import FilterPipeline
+from estimator import CompressibilityEstimator, Estimate
+from result_cache import ResultCache
+from timeline import Timeline, export_rows
+
+
+STORED_HEADER_SIZE = 1  # format id
+
+# with a block size, the content is a sequence of {block type}{block length}{block}
+#     coded block: {dummy codeword bits: 1 byte}{codewords}
+#     stored block: the symbols as is
+#     interleaved block: {stream count: 1 byte}{stream length: 4 bytes}...{stream}...
+#         the i-th symbol goes to stream i % stream count, each stream is laid out like a coded block
+#     ans block: {symbol count: 4 bytes}{final state: 2 bytes}{dummy codeword bits: 1 byte}{bits}
+BLOCK_CODED = 0
+BLOCK_STORED = 1
+BLOCK_INTERLEAVED = 2
+BLOCK_ANS = 3
+BLOCK_TYPES = {BLOCK_CODED: "coded", BLOCK_STORED: "stored", BLOCK_INTERLEAVED: "interleaved", BLOCK_ANS: "ans"}
+BLOCK_LEN_SIZE = 4
+STREAM_LEN_SIZE = 4
+MAX_STREAMS = 2 ** BITS_PER_BYTE - 1
 
 class BaseCoder:
     ALERT_PERIOD = BYTES_PER_MB
@@ -17,53 +55,412 @@ class BaseCoder:
         self._dummy_symbol_bytes: int = 0   # (total_bytes + dummy_symbol_bytes) % bytes_per_symbol must be 0
         self._dummy_codeword_bits: int = 0  # (bits_of_encoded_content + dummy_codeword_bits) % bits_per_byte must be 0
 
+        # ===== filters =====
+        self._filters: Optional[FilterPipeline] = None  # applied before encoding / undone after decoding
+
+        # ===== blocks =====
+        self._block_size: int = 0  # in bytes, 0 for a single continuous stream of codewords
+        self._block_cnts: Dict[int, int] = {block_type: 0 for block_type in BLOCK_TYPES}
+
         # ===== statistics =====
         self._symbol_cnt: int = 0
 
         # ===== alert =====
         self._alert_cnt: int = 0
 
+    def reset(self):
+        # clear the state left by the last file, so that the coder (and the tables it holds) can be reused
+        self._dummy_symbol_bytes = 0
+        self._dummy_codeword_bits = 0
+        self._block_cnts = {block_type: 0 for block_type in BLOCK_TYPES}
+        self._symbol_cnt = 0
+        self._alert_cnt = 0
+
     def _should_alert(self) -> bool:
         return self._verbose > 0 and self._symbol_cnt * self._bytes_per_symbol > self.ALERT_PERIOD * (self._alert_cnt+1)
 
+    def _get_filters_header_size(self) -> int:
+        # filter chain length: 1 byte
+        # filter chain: 2 bytes per filter
+        return 1 + (0 if self._filters is None else 2 * len(self._filters))
+
 
 class BaseEncoder(BaseCoder):
-    def __init__(self, bytes_per_symbol: int, verbose: int):
+    def __init__(
+        self,
+        bytes_per_symbol: int,
+        verbose: int,
+        filters: Optional[FilterPipeline] = None,
+        min_ratio: Optional[float] = None,
+        block_size: int = 0,
+        result_cache: Optional[ResultCache] = None,
+        timeline: int = 0,
+    ):
         assert 0 < bytes_per_symbol <= MAX_BYTE_PER_SYMBOL
+        assert block_size == 0 or bytes_per_symbol <= block_size < 2 ** (BLOCK_SIZE_SIZE * BITS_PER_BYTE)
         super().__init__(verbose)
 
         self._bytes_per_symbol = bytes_per_symbol
         self._bits_per_symbol = bytes_per_symbol * BITS_PER_BYTE
+        self._filters = filters if filters else None
+        self._block_size = block_size - block_size % bytes_per_symbol  # blocks hold whole symbols
+
+        # store the source file as is if its predicted compression ratio is below `min_ratio`
+        self._min_ratio: Optional[float] = min_ratio
+        self._estimate: Optional[Estimate] = None
+        self._stored: bool = False
 
         self._bits_written: int = 0   # bits written to the zipped file
+        self._src_bytes: Optional[int] = None  # size of the source file before filtering
+
+        # compressed outputs of previous encodes with the same params, looked up by the content of the source file
+        self._result_cache: Optional[ResultCache] = result_cache
+        self._cached_bytes: Optional[int] = None  # size of the compressed file if found in the cache
+
+        # a row of statistics every `timeline` Mb of input, see Timeline, 0 for none
+        assert timeline >= 0
+        self._timeline_size: int = timeline
+        self._timeline: Optional[Timeline] = None
+
+    def reset(self):
+        super().reset()
+        self._estimate = None
+        self._stored = False
+        self._bits_written = 0
+        self._src_bytes = None
+        self._cached_bytes = None
+        self._timeline = None
 
     @property
     def compression_ratio(self) -> float:
-        output_size = ceil(self._bits_written / BITS_PER_BYTE)
-        output_size += self._get_header_size()
+        if self._cached_bytes is not None:
+            output_size = self._cached_bytes
+        else:
+            output_size = ceil(self._bits_written / BITS_PER_BYTE)
+            output_size += STORED_HEADER_SIZE if self._stored else self._get_header_size()
+
+        total_bytes = self._get_total_bytes()
+        return 1 - output_size / total_bytes if total_bytes else 0
+
+    def encode(self, src_file_path: str, comp_file_path: str):
+        if self._result_cache is None:
+            self._encode(src_file_path, comp_file_path)
+            return
+
+        key = self._result_cache.key(self._get_cache_params(), src_file_path=src_file_path)
+        if self._result_cache.get_file(key, comp_file_path):
+            self._src_bytes = os.path.getsize(src_file_path)
+            self._cached_bytes = os.path.getsize(comp_file_path)
+            return
+
+        self._encode(src_file_path, comp_file_path)
+        self._result_cache.put_file(key, comp_file_path)
+
+    def compress(self, data: bytes) -> bytes:
+        # code `data` in memory into the same format as `encode`, without any file
+        # filtered content is framed by the filters into blocks of a file, so filters are not supported
+        assert self._filters is None
+        self._src_bytes = len(data)
+
+        comp = io.BytesIO()
+        self._compress(data, comp)
+
+        # the ratio is known exactly, no need to estimate it
+        if self._min_ratio is not None and self.compression_ratio < self._min_ratio:
+            self._stored = True
+            self._bits_written = len(data) * BITS_PER_BYTE
+            return bytes((STORED_FORMAT_ID,)) + data
+
+        return comp.getvalue()
 
-        return 1 - output_size / self._get_total_bytes()
+    @property
+    def timeline_rows(self) -> List[Dict]:
+        # a file found in the result cache or stored as is has no row
+        rows = self._timeline.rows if self._timeline is not None else []
+        if rows and self._dummy_symbol_bytes > 0:
+            # the zero bytes padding the last symbol are not part of the input
+            rows[-1] = {**rows[-1], "input_bytes": rows[-1]["input_bytes"] - self._dummy_symbol_bytes}
+        return rows
+
+    def export_timeline(self, export_path: Path):
+        # csv, or json for a .json path
+        export_rows(self.timeline_rows, export_path)
+
+    def _start_timeline(self):
+        # should be called right before the content is coded
+        if self._timeline_size > 0:
+            self._timeline = Timeline(self._timeline_size * BYTES_PER_MB, self._bytes_per_symbol)
 
-    def _write_header(self, comp_file_path: str):
+    def _update_timeline(self, symbols: Iterable[str]):
+        # once `symbols` are coded and counted in `_symbol_cnt` and `_bits_written`
+        if self._timeline is not None:
+            self._timeline.update(symbols, self._symbol_cnt, self._bits_written, self._get_shrink_cnt())
+
+    def _update_timeline_with_part(self, part: BinaryIO, size: int, bits: int):
+        # once the next `size` bytes of `part` are coded as a whole into `bits` (a lane, segment or frame)
+        # only the symbol counts of the part are kept, so that it is never read into memory at once
+        b = self._bytes_per_symbol
+        self._symbol_cnt += ceil(size / b)
+        self._bits_written += bits
+        if size % b:
+            # only the last part holds a partial symbol
+            self._dummy_symbol_bytes = b - size % b
+
+        if self._timeline is None or self._symbol_cnt == 0:
+            # the bits of empty parts ahead of the first symbol go to the first row
+            return
+
+        counts = Counter()
+        buffer_size = BUFFER_SIZE - BUFFER_SIZE % b
+        while size > 0:
+            buffer = part.read(min(size, buffer_size))
+            assert len(buffer) > 0
+            size -= len(buffer)
+            if len(buffer) % b:
+                buffer += bytes(b - len(buffer) % b)  # padded like the coders do
+            counts.update(buffer if b == 1 else (buffer[i:i+b] for i in range(0, len(buffer), b)))
+
+        self._update_timeline(counts)
+
+    def _get_shrink_cnt(self) -> int:
+        # shrinks of the model so far, for the timeline
+        return 0
+
+    def _encode(self, src_file_path: str, comp_file_path: str):
+        raise NotImplementedError
+
+    def _compress(self, data: bytes, comp: BinaryIO):
+        raise NotImplementedError
+
+    def _get_cache_params(self) -> Dict:
+        # every param the compressed file depends on
+        return {
+            "coder": type(self).__name__,
+            "bytes_per_symbol": self._bytes_per_symbol,
+            "filters": None if self._filters is None else self._filters.header,
+            "min_ratio": self._min_ratio,
+            "block_size": self._block_size,
+        }
+
+    def _write_header(self, comp: BinaryIO):
         raise NotImplementedError
     
-    def _write_content(self, src_file_path: str, comp_file_path: str):
+    def _write_content(self, src: BinaryIO, comp: BinaryIO):
         raise NotImplementedError
 
     def _get_header_size(self) -> int:
         raise NotImplementedError
-    
+
+    def _get_predicted_ratio(self, estimate: Estimate) -> float:
+        raise NotImplementedError
+
+    def _should_store(self, src_file_path: str) -> bool:
+        if self._min_ratio is None:
+            return False
+
+        self._estimate = CompressibilityEstimator(self._bytes_per_symbol).estimate(src_file_path)
+        return self._get_predicted_ratio(self._estimate) < self._min_ratio
+
+    def _store(self, src_file_path: str, comp_file_path: str):
+        """
+            format id: 1 byte
+            content: the source file as is
+        """
+
+        with open(src_file_path, "rb", BUFFER_SIZE) as src, open(comp_file_path, "wb", BUFFER_SIZE) as comp:
+            comp.write(bytes((STORED_FORMAT_ID,)))
+            shutil.copyfileobj(src, comp, BUFFER_SIZE)
+
+        self._stored = True
+        self._src_bytes = os.path.getsize(src_file_path)
+        self._bits_written = self._src_bytes * BITS_PER_BYTE
+
     def _get_total_bytes(self) -> int:
+        if self._src_bytes is not None:
+            return self._src_bytes
+
         return self._symbol_cnt * self._bytes_per_symbol - self._dummy_symbol_bytes
 
+    @contextmanager
+    def _apply_filters(self, src_file_path: str) -> Iterator[str]:
+        # yield the path of the file to be encoded
+        if self._filters is None:
+            yield src_file_path
+            return
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filtered_file_path = str(Path(tmp_dir) / "filtered")
+            self._src_bytes = self._filters.encode_file(src_file_path, filtered_file_path)
+            yield filtered_file_path
+
+    def _read_blocks(self, src: BinaryIO) -> Iterator[Tuple[bytes, List[str]]]:
+        # yield each block and its symbols, the last symbol is padded with dummy bytes
+        b = self._bytes_per_symbol
+
+        while True:
+            block = src.read(self._block_size)
+            if len(block) == 0:
+                break
+            elif len(block) % b:
+                self._dummy_symbol_bytes = b - len(block) % b
+                block += bytes(self._dummy_symbol_bytes)
+
+            symbols = block.decode("latin-1")
+            yield block, [symbols[i:i+b] for i in range(0, len(symbols), b)]
+
+    @staticmethod
+    def _should_store_block(code_bits: int, block_size: int) -> bool:
+        # coding the block does not save space
+        return 1 + ceil(code_bits / BITS_PER_BYTE) >= block_size
+
+    def _write_block(self, comp: BinaryIO, block_type: int, block: bytes):
+        comp.write(bytes((block_type,)) + len(block).to_bytes(BLOCK_LEN_SIZE, "big"))
+        comp.write(block)
+
+        self._block_cnts[block_type] += 1
+        self._bits_written += (1 + BLOCK_LEN_SIZE + len(block)) * BITS_PER_BYTE
+
+    @staticmethod
+    def _write_bits(comp: BinaryIO, bits: str) -> str:
+        # write the whole bytes of `bits`, return the trailing bits insufficient to make a byte
+        whole_bits = len(bits) - len(bits) % BITS_PER_BYTE
+        comp.write(bits_to_bytes(bits[:whole_bits]))
+        return bits[whole_bits:]
+
+    def _write_coded_block(self, comp: BinaryIO, codewords: str):
+        self._write_block(comp, BLOCK_CODED, self._to_coded_stream(codewords))
+
+    @staticmethod
+    def _to_coded_stream(codewords: str) -> bytes:
+        dummy_bits = -len(codewords) % BITS_PER_BYTE
+        return bytes((dummy_bits,)) + bits_to_bytes(codewords)
+
+    @classmethod
+    def _to_interleaved_block(cls, stream_codewords: List[str]) -> bytes:
+        streams = [cls._to_coded_stream(codewords) for codewords in stream_codewords]
+        return (
+            bytes((len(streams),)) +
+            b"".join([len(stream).to_bytes(STREAM_LEN_SIZE, "big") for stream in streams]) +
+            b"".join(streams)
+        )
+
+    def _write_block_size_header(self, stream):
+        # block size: 4 bytes
+        stream.write(self._block_size.to_bytes(BLOCK_SIZE_SIZE, "big").decode("latin-1"))
+
+    def _write_filters_header(self, stream):
+        """
+            filter chain length: 1 byte
+            filter chain: {filter id}{width}... (2 bytes per filter)
+        """
+
+        if self._filters is None:
+            stream.write(chr(0))
+        else:
+            stream.write(chr(len(self._filters)))
+            stream.write(self._filters.header)
+
 
 class BaseDecoder(BaseCoder):
     def __init__(self, verbose: int):
         super().__init__(verbose)
 
+    def decompress(self, data: bytes) -> bytes:
+        # decode in memory what `compress` (or `encode`) produced
+        if data[:STORED_HEADER_SIZE] == bytes((STORED_FORMAT_ID,)):
+            return data[STORED_HEADER_SIZE:]
+
+        src = io.BytesIO(data)
+        self._parse_header(src)
+        assert self._filters is None
+
+        decomp = io.BytesIO()
+        self._decode_content(src, decomp)
+        decoded = decomp.getvalue()
+        return decoded[:len(decoded) - self._dummy_symbol_bytes]
+
     def _parse_header(self, file_obj):
         raise NotImplementedError
 
+    def _decode_content(self, src: BinaryIO, decomp: BinaryIO):
+        raise NotImplementedError
+
+    @staticmethod
+    def _remaining_bytes(file_obj: BinaryIO) -> int:
+        # bytes left to read, to check the sizes found in a header before reading them
+        pos = file_obj.tell()
+        end = file_obj.seek(0, io.SEEK_END)
+        file_obj.seek(pos)
+        return end - pos
+
+    @staticmethod
+    def _copy_if_stored(file_obj, decomp_file_path: str) -> bool:
+        # return whether the file is stored as is
+        if file_obj.read(STORED_HEADER_SIZE) != bytes((STORED_FORMAT_ID,)):
+            file_obj.seek(0)
+            return False
+
+        with open(decomp_file_path, "wb", BUFFER_SIZE) as decomp:
+            shutil.copyfileobj(file_obj, decomp, BUFFER_SIZE)
+
+        return True
+
+    def _parse_block_size_header(self, stream):
+        self._block_size = int.from_bytes(stream.read(BLOCK_SIZE_SIZE).encode("latin-1"), "big")
+
+    def _read_block(self, src: BinaryIO) -> Optional[Tuple[int, bytes]]:
+        # return the type and content of the next block, None at the end of the file
+        header = src.read(1 + BLOCK_LEN_SIZE)
+        if len(header) == 0:
+            return None
+
+        block_type = header[0]
+        assert block_type in BLOCK_TYPES, f"unknown block type {block_type}"
+        self._block_cnts[block_type] += 1
+
+        return block_type, src.read(int.from_bytes(header[1:], "big"))
+
+    @staticmethod
+    def _split_streams(block: bytes) -> List[bytes]:
+        # streams of an interleaved block
+        stream_cnt = block[0]
+        pos = 1 + stream_cnt * STREAM_LEN_SIZE
+
+        streams = []
+        for i in range(stream_cnt):
+            stream_len = int.from_bytes(block[1+i*STREAM_LEN_SIZE:1+(i+1)*STREAM_LEN_SIZE], "big")
+            streams.append(block[pos:pos+stream_len])
+            pos += stream_len
+
+        return streams
+
+    @staticmethod
+    def _get_codewords(block: bytes) -> str:
+        # codewords of a coded block, without dummy bits
+        codewords = bytes_to_bits(block[1:])
+        return codewords[:len(codewords) - block[0]]
+
+    def _parse_filters_header(self, stream):
+        filters_cnt = ord(stream.read(1))
+        self._filters = (
+            FilterPipeline.from_header(stream.read(2 * filters_cnt))
+            if filters_cnt > 0
+            else None
+        )
+
+    @contextmanager
+    def _undo_filters(self, decomp_file_path: str) -> Iterator[str]:
+        # yield the path to write decoded content to
+        # should be entered after the header is parsed
+        if self._filters is None:
+            yield decomp_file_path
+            return
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            decoded_file_path = str(Path(tmp_dir) / "decoded")
+            yield decoded_file_path
+            self._filters.decode_file(decoded_file_path, decomp_file_path)
+
     def _trunc(self, decomp_file_path: str):
         # strip off dummy symbol bytes
         if self._dummy_symbol_bytes == 0:
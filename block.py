@@ -1,4 +1,4 @@
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Tuple
 import heapq
 
 from adaptive_nodes import Node
@@ -38,6 +38,18 @@ class BlockManager:
         self._block_dict: Dict[int, _Block] = {}  # {block.weight: block}
         self._updated_weights: Set[int] = set()  # blocks to be updated
 
+    @property
+    def blocks(self) -> List[Tuple[int, List[Node]]]:
+        # [(weight, nodes in heap order)], in the order the blocks were created
+        assert not self._updated_weights
+        return [(w, block._nodes) for w, block in self._block_dict.items()]
+
+    def restore_block(self, weight: int, nodes: List[Node]):
+        # blocks must be restored in the order given by `blocks`
+        block = _Block(weight)
+        block._nodes = list(nodes)
+        self._block_dict[weight] = block
+
     def insert(self, node: Node):
         w = node.weight
 
@@ -46,11 +58,19 @@ class BlockManager:
         
         self._block_dict[w].insert(node)
 
+    def remove(self, node: Node):
+        self._block_dict[node.weight].remove(node)
+
     def increment_node_weight(self, node: Node):
         self._block_dict[node.weight].remove(node)
         node.increment_weight()
         self.insert(node)
 
+    def decrease_node_weight(self, node: Node, delta: int):
+        self._block_dict[node.weight].remove(node)
+        node.decrease_weight(delta)
+        self.insert(node)
+
     def get_rep(self, node: Node):
         return self._block_dict[node.weight].rep
 
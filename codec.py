@@ -0,0 +1,123 @@
+from typing import Dict, Iterator, List, MutableMapping, Optional, Tuple
+from contextlib import contextmanager
+
+from base_coder import BaseEncoder, BaseDecoder
+from encoder import Encoder
+from decoder import Decoder
+from adaptive_encoder import AdaptiveEncoder
+from adaptive_decoder import AdaptiveDecoder
+from lz_encoder import LZEncoder
+from lz_decoder import LZDecoder
+from range_encoder import RangeEncoder
+from range_decoder import RangeDecoder
+
+
+# compressed payload: {coder id}{compressed file of the coder}
+CODER_STATIC = "static"
+CODER_ADAPTIVE = "adaptive"
+CODER_LZ = "lz"
+CODER_RANGE = "range"
+CODER_IDS = {CODER_STATIC: 1, CODER_ADAPTIVE: 2, CODER_LZ: 3, CODER_RANGE: 4}
+CODERS = {coder_id: coder for coder, coder_id in CODER_IDS.items()}
+
+DEFAULT_POOL_SIZE = 8  # idle coders kept per kind of coder
+
+
+class CoderPool:
+    # idle coders, reset and reused for the next payload instead of built for every one
+    # the static coders of a pool share `tree_cache` if given, a decoding tree keeps its position
+    # so a pool with a tree cache must not be used by several threads at once
+
+    def __init__(self, capacity: int = DEFAULT_POOL_SIZE, tree_cache: Optional[MutableMapping] = None):
+        assert capacity > 0
+        self._capacity: int = capacity
+        self._tree_cache: Optional[MutableMapping] = tree_cache
+
+        # {(coder, bytes per symbol): [idle encoders]}, {coder: [idle decoders]}
+        # a list pops and appends atomically, so threads may share a pool without a tree cache
+        self._encoders: Dict[Tuple[str, int], List[BaseEncoder]] = {}
+        self._decoders: Dict[str, List[BaseDecoder]] = {}
+
+    @contextmanager
+    def encoder(self, coder: str, bytes_per_symbol: int = 1) -> Iterator[BaseEncoder]:
+        assert coder in CODER_IDS and (coder != CODER_LZ or bytes_per_symbol == 1)
+        idle = self._encoders.setdefault((coder, bytes_per_symbol), [])
+        try:
+            encoder = idle.pop()
+        except IndexError:
+            encoder = self._new_encoder(coder, bytes_per_symbol)
+
+        try:
+            yield encoder
+        finally:
+            encoder.reset()
+            if len(idle) < self._capacity:
+                idle.append(encoder)
+
+    @contextmanager
+    def decoder(self, coder: str) -> Iterator[BaseDecoder]:
+        assert coder in CODER_IDS
+        idle = self._decoders.setdefault(coder, [])
+        try:
+            decoder = idle.pop()
+        except IndexError:
+            decoder = self._new_decoder(coder)
+
+        try:
+            yield decoder
+        finally:
+            decoder.reset()
+            if len(idle) < self._capacity:
+                idle.append(decoder)
+
+    def compress(self, data: bytes, coder: str = CODER_STATIC, bytes_per_symbol: int = 1) -> Tuple[str, bytes]:
+        # return the coder actually used and the compressed file
+        if coder == CODER_STATIC:
+            with self.encoder(CODER_STATIC, bytes_per_symbol) as encoder:
+                try:
+                    return CODER_STATIC, encoder.compress(data)
+                except NotImplementedError:
+                    # the static encoder needs at least 2 distinct symbols
+                    coder = CODER_ADAPTIVE
+
+        with self.encoder(coder, bytes_per_symbol) as encoder:
+            return coder, encoder.compress(data)
+
+    def decompress(self, data: bytes, coder: str = CODER_STATIC) -> bytes:
+        with self.decoder(coder) as decoder:
+            return decoder.decompress(data)
+
+    def _new_encoder(self, coder: str, bytes_per_symbol: int) -> BaseEncoder:
+        if coder == CODER_STATIC:
+            return Encoder(bytes_per_symbol, tree_cache=self._tree_cache)
+        elif coder == CODER_ADAPTIVE:
+            return AdaptiveEncoder(bytes_per_symbol)
+        elif coder == CODER_RANGE:
+            return RangeEncoder(bytes_per_symbol)
+        else:
+            return LZEncoder()
+
+    def _new_decoder(self, coder: str) -> BaseDecoder:
+        if coder == CODER_STATIC:
+            return Decoder(tree_cache=self._tree_cache)
+        elif coder == CODER_ADAPTIVE:
+            return AdaptiveDecoder()
+        elif coder == CODER_RANGE:
+            return RangeDecoder()
+        else:
+            return LZDecoder()
+
+
+# each process has its own pool, without a tree cache so that threads may share it
+_pool = CoderPool()
+
+
+def compress(data: bytes, coder: str = CODER_STATIC, bytes_per_symbol: int = 1, pool: Optional[CoderPool] = None) -> bytes:
+    # the static coder falls back to the adaptive one for fewer than 2 distinct symbols
+    coder, comp = (pool or _pool).compress(data, coder, bytes_per_symbol)
+    return bytes((CODER_IDS[coder],)) + comp
+
+
+def decompress(data: bytes, pool: Optional[CoderPool] = None) -> bytes:
+    assert len(data) > 0 and data[0] in CODERS, "not a compressed payload"
+    return (pool or _pool).decompress(data[1:], CODERS[data[0]])
@@ -0,0 +1,93 @@
+from typing import BinaryIO, Iterator, Tuple
+import zlib
+import sys
+
+from base_coder import BaseDecoder
+from utils import BUFFER_SIZE, DECOMP_FILE_EXTENSION
+import codec
+from container_encoder import (
+    CONTAINER_MAGIC,
+    CONTAINER_VERSION,
+    FRAME_STATIC,
+    FRAME_ADAPTIVE,
+    ORIGINAL_LEN_SIZE,
+    CHECKSUM_SIZE,
+    PAYLOAD_LEN_SIZE,
+    FRAME_HEADER_SIZE,
+)
+
+
+def _decode_frame(frame_type: int, payload: bytes) -> bytes:
+    assert frame_type in (FRAME_STATIC, FRAME_ADAPTIVE)
+    return codec.decompress(bytes((frame_type,)) + payload)
+
+
+class ContainerDecoder(BaseDecoder):
+    def __init__(self, verbose: int = 0):
+        super().__init__(verbose)
+
+        self._frame_cnt: int = 0
+
+    def decode(self, src_file_path: str, decomp_file_path: str):
+        with open(src_file_path, "rb", BUFFER_SIZE) as src, open(decomp_file_path, "wb", BUFFER_SIZE) as decomp:
+            for frame_type, original_len, checksum, payload in self._read_frames(src):
+                chunk = _decode_frame(frame_type, payload)
+                assert len(chunk) == original_len, f"frame {self._frame_cnt}: length mismatch"
+                assert zlib.crc32(chunk) == checksum, f"frame {self._frame_cnt}: checksum mismatch"
+
+                decomp.write(chunk)
+
+    def _read_frames(self, src: BinaryIO) -> Iterator[Tuple[int, int, int, bytes]]:
+        # yield (frame type, original length, checksum, payload) of each frame
+        # a container header may appear before any frame, where containers were concatenated
+        self._parse_header(src)
+
+        while True:
+            header = src.read(len(CONTAINER_MAGIC))
+            if len(header) == 0:
+                break
+            elif header == CONTAINER_MAGIC:
+                src.seek(-len(CONTAINER_MAGIC), 1)
+                self._parse_header(src)
+                continue
+
+            header += src.read(FRAME_HEADER_SIZE - len(header))
+            assert len(header) == FRAME_HEADER_SIZE, "truncated frame header"
+
+            frame_type = header[0]
+            original_len = int.from_bytes(header[1:1+ORIGINAL_LEN_SIZE], "big")
+            checksum = int.from_bytes(header[1+ORIGINAL_LEN_SIZE:1+ORIGINAL_LEN_SIZE+CHECKSUM_SIZE], "big")
+            payload_len = int.from_bytes(header[FRAME_HEADER_SIZE-PAYLOAD_LEN_SIZE:], "big")
+
+            payload = src.read(payload_len)
+            assert len(payload) == payload_len, "truncated frame"
+
+            self._frame_cnt += 1
+            yield frame_type, original_len, checksum, payload
+
+    def _parse_header(self, file_obj: BinaryIO):
+        """
+            magic: 4 bytes
+            version: 1 byte
+            frames: {frame type}{original length}{checksum}{payload length}{payload}...
+                frame type: 1 byte
+                original length: 8 bytes
+                checksum: crc32 of the original bytes, 4 bytes
+                payload length: 8 bytes
+                payload: a complete static / adaptive compressed file
+        """
+
+        assert file_obj.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC, "not a container"
+        version = file_obj.read(1)[0]
+        assert version <= CONTAINER_VERSION, f"unsupported container version {version}"
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    verbose = int(kwargs.get("v", 0))
+    decoder = ContainerDecoder(verbose)
+
+    src = kwargs["in"]
+    decomp = kwargs.get("out", f"{src}.{DECOMP_FILE_EXTENSION}")
+    decoder.decode(src, decomp)
@@ -0,0 +1,155 @@
+from typing import Tuple
+from pathlib import Path
+import zlib
+import sys
+import io
+import os
+
+from base_coder import BaseEncoder
+from utils import BITS_PER_BYTE, BUFFER_SIZE, BYTES_PER_MB, COMP_FILE_EXTENSION, CONTAINER_FORMAT_ID
+from codec import CODER_STATIC, CODER_ADAPTIVE, CODER_IDS
+import codec
+
+
+# a container is {magic}{version} followed by any number of frames, and may be followed by another container,
+# so that concatenating two containers gives a valid container
+CONTAINER_MAGIC = bytes((CONTAINER_FORMAT_ID,)) + b"HUF"
+CONTAINER_VERSION = 1
+
+# frame: {frame type}{original length}{checksum}{payload length}{payload}
+#     payload: a complete static / adaptive compressed file of the original bytes
+#     checksum: crc32 of the original bytes
+FRAME_STATIC = 1
+FRAME_ADAPTIVE = 2
+FRAME_TYPES = {CODER_STATIC: FRAME_STATIC, CODER_ADAPTIVE: FRAME_ADAPTIVE}
+FRAME_CODERS = {frame_type: coder for coder, frame_type in FRAME_TYPES.items()}
+ORIGINAL_LEN_SIZE = 8
+CHECKSUM_SIZE = 4
+PAYLOAD_LEN_SIZE = 8
+FRAME_HEADER_SIZE = 1 + ORIGINAL_LEN_SIZE + CHECKSUM_SIZE + PAYLOAD_LEN_SIZE
+
+DEFAULT_FRAME_SIZE = 4  # in Mb
+
+assert CONTAINER_FORMAT_ID not in FRAME_TYPES.values()
+# the frame type is the coder id of the in-memory api
+assert all(CODER_IDS[coder] == frame_type for coder, frame_type in FRAME_TYPES.items())
+
+
+def _encode_frame(chunk: bytes, frame_type: int, bytes_per_symbol: int) -> Tuple[int, bytes]:
+    # return the frame type actually used and the payload
+    payload = codec.compress(chunk, FRAME_CODERS[frame_type], bytes_per_symbol)
+    return payload[0], payload[1:]
+
+
+class ContainerEncoder(BaseEncoder):
+    # the source file is cut into frames of `frame_size` Mb, each coded independently
+    # frames can be appended to an existing container without touching the frames already written
+
+    def __init__(
+        self,
+        bytes_per_symbol: int,
+        verbose: int = 0,
+        frame_type: int = FRAME_STATIC,
+        frame_size: int = DEFAULT_FRAME_SIZE,
+        timeline: int = 0,
+    ):
+        super().__init__(bytes_per_symbol, verbose, timeline=timeline)
+
+        assert frame_type in FRAME_TYPES.values()
+        assert frame_size > 0
+        self._frame_type: int = frame_type
+        self._frame_size: int = frame_size  # in Mb
+
+        self._frame_cnt: int = 0
+        self._header_written: bool = False
+
+    def encode(self, src_file_path: str, comp_file_path: str):
+        with open(comp_file_path, "wb"):
+            pass
+
+        self.append(src_file_path, comp_file_path)
+
+    def append(self, src_file_path: str, comp_file_path: str):
+        # append the frames of the source file, the container is created if it does not exist or is empty
+        self._src_bytes = 0
+        frame_bytes = self._frame_size * BYTES_PER_MB
+        frame_bytes -= frame_bytes % self._bytes_per_symbol  # frames hold whole symbols
+
+        with open(src_file_path, "rb", BUFFER_SIZE) as src, open(comp_file_path, "ab", BUFFER_SIZE) as comp:
+            if comp.tell() == 0:
+                comp.write(CONTAINER_MAGIC + bytes((CONTAINER_VERSION,)))
+                self._header_written = True
+
+            self._start_timeline()
+            while True:
+                chunk = src.read(frame_bytes)
+                if len(chunk) == 0:
+                    break
+
+                self._write_frame(comp, chunk)
+
+    def export_results(self, export_path: Path):
+        with open(export_path, "w") as f:
+            f.write(f"{'='*10} params {'='*10}\n")
+            f.write(f"bytes per symbol: {self._bytes_per_symbol}\n")
+            f.write(f"frame type: {self._frame_type}\n")
+            f.write(f"frame size: {self._frame_size}\n")
+
+            f.write(f"\n{'='*10} statistics {'='*10}\n")
+            f.write(f"total bytes: {self._src_bytes}\n")
+            f.write(f"frames: {self._frame_cnt}\n")
+            f.write(f"compression ratio: {self.compression_ratio}\n")
+
+    def _write_frame(self, comp, chunk: bytes):
+        frame_type, payload = _encode_frame(chunk, self._frame_type, self._bytes_per_symbol)
+
+        comp.write(bytes((frame_type,)))
+        comp.write(len(chunk).to_bytes(ORIGINAL_LEN_SIZE, "big"))
+        comp.write(zlib.crc32(chunk).to_bytes(CHECKSUM_SIZE, "big"))
+        comp.write(len(payload).to_bytes(PAYLOAD_LEN_SIZE, "big"))
+        comp.write(payload)
+
+        self._frame_cnt += 1
+        self._src_bytes += len(chunk)
+        self._update_timeline_with_part(io.BytesIO(chunk), len(chunk), (FRAME_HEADER_SIZE + len(payload)) * BITS_PER_BYTE)
+
+    def _get_header_size(self) -> int:
+        # of the appended part
+        return len(CONTAINER_MAGIC) + 1 if self._header_written else 0
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    export_path = kwargs.get("export", None)
+    if export_path:
+        export_path = Path(export_path)
+        if export_path.exists():
+            raise AssertionError(f"{export_path} already exists")
+
+    timeline_path = kwargs.get("timeline", None)
+    if timeline_path:
+        timeline_path = Path(timeline_path)
+        if timeline_path.exists():
+            raise AssertionError(f"{timeline_path} already exists")
+
+    bytes_per_symbol = int(kwargs.get("b", 1))
+    verbose = int(kwargs.get("v", 0))
+    frame_type = FRAME_TYPES[kwargs.get("coder", "static")]
+    frame_size = int(kwargs.get("F", DEFAULT_FRAME_SIZE))
+    append = bool(int(kwargs.get("append", 0)))
+    timeline = int(kwargs.get("T", 1)) if timeline_path else 0
+
+    src = kwargs["in"]
+    comp = kwargs.get("out", f"{src}.{COMP_FILE_EXTENSION}")
+
+    encoder = ContainerEncoder(bytes_per_symbol, verbose, frame_type, frame_size, timeline)
+    if append:
+        encoder.append(src, comp)
+    else:
+        encoder.encode(src, comp)
+
+    if export_path:
+        encoder.export_results(export_path)
+    if timeline_path:
+        encoder.export_timeline(timeline_path)
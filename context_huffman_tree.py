@@ -0,0 +1,175 @@
+from typing import Dict, Optional
+from collections import Counter, OrderedDict
+import io
+
+from adaptive_huffman_tree import AdaptiveHuffmanTree, TreeStats, ENCODE_MODE, DECODE_MODE, _put_varint, _get_varint
+
+
+class ContextHuffmanTree:
+    # order-1 context model: one adaptive tree per previous symbol
+    # at most `tree_cnt` context trees are kept, the least recently used one is evicted first
+    # cold / evicted contexts and symbols new to a context tree are coded by a shared order-0 tree
+
+    def __init__(self, mode: str, tree_cnt: int, **tree_kwargs):
+        # tree_kwargs: shrink / stats settings shared by every tree, see AdaptiveHuffmanTree
+        assert mode in (ENCODE_MODE, DECODE_MODE)
+        assert tree_cnt > 0
+
+        self._mode: str = mode
+        self._tree_cnt: int = tree_cnt
+        self._tree_kwargs = tree_kwargs
+
+        self._order0: AdaptiveHuffmanTree = AdaptiveHuffmanTree(1, mode, **tree_kwargs)
+        self._trees: OrderedDict = OrderedDict()  # {previous symbol: AdaptiveHuffmanTree}, in LRU order
+
+        self._context: Optional[str] = None  # previous symbol
+        self._symbol_cnt: int = 0
+        self._evicted_cnt: int = 0
+        self._evicted_shrink_cnt: int = 0
+        self._evicted_leaf_cnt: int = 0  # leaves evicted by the evicted trees
+        self._evicted_stats: TreeStats = TreeStats()
+
+        # for decoder
+        self._cur_tree: AdaptiveHuffmanTree = self._order0
+
+    @property
+    def symbol_cnt(self) -> int:
+        return self._symbol_cnt
+
+    @property
+    def shrink_cnt(self) -> int:
+        return (
+            self._order0.shrink_cnt + self._evicted_shrink_cnt +
+            sum(tree.shrink_cnt for tree in self._trees.values())
+        )
+
+    @property
+    def evicted_cnt(self) -> int:
+        return self._evicted_cnt
+
+    @property
+    def evicted_leaf_cnt(self) -> int:
+        return (
+            self._order0.evicted_leaf_cnt + self._evicted_leaf_cnt +
+            sum(tree.evicted_leaf_cnt for tree in self._trees.values())
+        )
+
+    @property
+    def stats(self) -> Dict:
+        # the counters of every tree including the evicted ones, the shapes of the trees kept
+        # symbols coded by the order-0 tree after the escape of a context tree are counted once
+        trees = [self._order0, *self._trees.values()]
+        assert self._order0._stats is not None, "stats are not enabled"
+
+        counters = TreeStats()
+        counters.merge(self._evicted_stats)
+        for tree in trees:
+            counters.merge(tree._stats)
+        counters.symbol_cnt = self._symbol_cnt
+
+        shape: Dict = {"trees": len(trees)}
+        for tree in trees:
+            for key, value in tree._shape_stats().items():
+                if isinstance(value, dict):
+                    shape[key] = dict(sorted((Counter(shape.get(key, {})) + Counter(value)).items()))
+                else:
+                    shape[key] = shape.get(key, 0) + value
+
+        return {**counters.to_dict(), **shape}
+
+    def snapshot(self) -> bytes:
+        """
+            the state between two symbols, restored by `restore` into a tree created with the same params
+            every number is a varint, as in AdaptiveHuffmanTree.snapshot
+
+            symbol count, evicted tree count, shrink count / leaf count of the evicted trees
+            context: previous symbol + 1, 0 for none
+            order-0 tree: {size}{snapshot}
+            tree count
+            context trees, in LRU order: {context}{size}{snapshot}...
+        """
+
+        snapshot = bytearray()
+        put = lambda value: _put_varint(snapshot, value)
+
+        for value in (self._symbol_cnt, self._evicted_cnt, self._evicted_shrink_cnt, self._evicted_leaf_cnt):
+            put(value)
+        put(ord(self._context) + 1 if self._context is not None else 0)
+
+        order0 = self._order0.snapshot()
+        put(len(order0))
+        snapshot += order0
+
+        put(len(self._trees))
+        for context, tree in self._trees.items():
+            tree_snapshot = tree.snapshot()
+            put(ord(context))
+            put(len(tree_snapshot))
+            snapshot += tree_snapshot
+
+        return bytes(snapshot)
+
+    def restore(self, snapshot: bytes):
+        # replace the state of every tree with the one of `snapshot`
+        stream = io.BytesIO(snapshot)
+        get = lambda: _get_varint(stream)
+
+        self._symbol_cnt = get()
+        self._evicted_cnt = get()
+        self._evicted_shrink_cnt = get()
+        self._evicted_leaf_cnt = get()
+        context = get()
+        self._context = chr(context - 1) if context > 0 else None
+
+        self._order0.restore(stream.read(get()))
+
+        self._trees = OrderedDict()
+        for _ in range(get()):
+            context = chr(get())
+            tree = AdaptiveHuffmanTree(1, self._mode, fallback=self._order0, **self._tree_kwargs)
+            tree.restore(stream.read(get()))
+            self._trees[context] = tree
+
+        self._cur_tree = self._select_tree()
+
+    def encode(self, symbol: str) -> str:
+        assert len(symbol) == 1
+        code = self._select_tree().encode(symbol)
+        self._advance(symbol)
+        return code
+
+    def decode(self, bit: str) -> Optional[str]:
+        symbol = self._cur_tree.decode(bit)
+
+        if symbol is not None:
+            self._advance(symbol)
+            self._cur_tree = self._select_tree()
+
+        return symbol
+
+    def _select_tree(self) -> AdaptiveHuffmanTree:
+        tree = self._trees.get(self._context)
+        if tree is None:
+            return self._order0
+
+        self._trees.move_to_end(self._context)
+        return tree
+
+    def _advance(self, symbol: str):
+        # encoder and decoder must create / evict trees in exactly the same order
+        self._symbol_cnt += 1
+
+        if self._context is not None and self._context not in self._trees:
+            if len(self._trees) == self._tree_cnt:
+                _, evicted = self._trees.popitem(last=False)
+                self._evicted_cnt += 1
+                self._evicted_shrink_cnt += evicted.shrink_cnt
+                self._evicted_leaf_cnt += evicted.evicted_leaf_cnt
+                if evicted._stats is not None:
+                    self._evicted_stats.merge(evicted._stats)
+
+            self._trees[self._context] = AdaptiveHuffmanTree(
+                1, self._mode, fallback=self._order0, **self._tree_kwargs,
+            )
+
+        self._context = symbol
@@ -0,0 +1,415 @@
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.connection import Connection
+from functools import partial
+import multiprocessing
+import itertools
+import threading
+import asyncio
+import socket
+import signal
+import json
+import time
+import sys
+import os
+
+from utils import BYTES_PER_MB, LRUCache
+from codec import CoderPool, CODER_STATIC, CODER_ADAPTIVE
+
+
+# request: {json header}\n{payload}
+#     op: "compress" / "decompress" / "stats"
+#     coder: "static" / "adaptive"
+#     b: bytes per symbol (compress only)
+#     size: size of the inline payload, or
+#     in, out: paths of the source / destination file
+# response: {json header}\n{payload}
+#     ok: bool
+#     error: str (if not ok)
+#     coder: coder actually used (compress only)
+#     size: size of the inline payload
+
+OP_COMPRESS = "compress"
+OP_DECOMPRESS = "decompress"
+OP_STATS = "stats"
+
+DEFAULT_SOCKET_PATH = "/tmp/huffman.sock"
+DEFAULT_CACHE_SIZE = 64  # code books cached per worker
+MEMORY_FACTOR = 16  # rough peak memory of a job per byte of input
+DEFAULT_JOB_TIMEOUT = 600  # seconds a job may run, 0 for unlimited
+KILL_GRACE = 5  # seconds a worker has to give up a job past its deadline, before its pool is replaced
+
+# events reported by the workers to the daemon: (EVENT_WORKER, pid) once started, (EVENT_JOB, job id) as a job starts
+EVENT_WORKER = "worker"
+EVENT_JOB = "job"
+
+# ===== worker states =====
+_pool: Optional[CoderPool] = None  # reused coders sharing a cache of code books
+_events: Optional[Connection] = None
+
+
+def _init_worker(cache_size: int, memory_limit: int, events: Connection):
+    global _pool, _events
+    _pool = CoderPool(tree_cache=LRUCache(cache_size))
+    _events = events
+    _events.send((EVENT_WORKER, os.getpid()))
+
+    if memory_limit > 0:
+        try:
+            import resource
+            with open("/proc/self/statm") as f:
+                baseline = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+            _, hard = resource.getrlimit(resource.RLIMIT_AS)
+            resource.setrlimit(resource.RLIMIT_AS, (baseline + memory_limit, hard))
+        except (ImportError, OSError, ValueError):
+            pass  # address space limits are not supported on this platform
+
+    signal.signal(signal.SIGALRM, _on_deadline)
+
+    # warm up code paths, so that the first job does not pay for them
+    _compress_bytes(bytes(range(4)) * 4, CODER_STATIC, 1)
+
+
+def _on_deadline(signum, frame):
+    raise TimeoutError("job deadline exceeded")
+
+
+def _run_with_deadline(job: Callable, timeout: float):
+    # the worker gives up a job past its deadline, the daemon kills it if it does not
+    if timeout > 0:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return job()
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _start_job(job_id: int, job: Callable, timeout: float):
+    # the deadline of a job runs from its start, not from its submission
+    _events.send((EVENT_JOB, job_id))
+    return _run_with_deadline(job, timeout)
+
+
+def _ping():
+    pass
+
+
+def _compress_file(src_file_path: str, comp_file_path: str, coder: str, bytes_per_symbol: int) -> str:
+    # return the coder actually used
+    if coder == CODER_STATIC:
+        with _pool.encoder(CODER_STATIC, bytes_per_symbol) as encoder:
+            try:
+                encoder.encode(src_file_path, comp_file_path)
+                return CODER_STATIC
+            except NotImplementedError:
+                # the static encoder needs at least 2 distinct symbols
+                pass
+
+    with _pool.encoder(CODER_ADAPTIVE, bytes_per_symbol) as encoder:
+        encoder.encode(src_file_path, comp_file_path)
+    return CODER_ADAPTIVE
+
+
+def _decompress_file(comp_file_path: str, decomp_file_path: str, coder: str):
+    with _pool.decoder(coder) as decoder:
+        decoder.decode(comp_file_path, decomp_file_path)
+
+
+def _compress_bytes(data: bytes, coder: str, bytes_per_symbol: int) -> Tuple[bytes, str]:
+    coder, comp = _pool.compress(data, coder, bytes_per_symbol)
+    return comp, coder
+
+
+def _decompress_bytes(data: bytes, coder: str) -> bytes:
+    return _pool.decompress(data, coder)
+
+
+class _WorkerPool:
+    # a process pool whose workers report their pid and the start of each job through a pipe,
+    # small messages are written atomically so the workers share its write end without a lock
+
+    def __init__(self, workers: int, cache_size: int, memory_limit: int):
+        self._workers: int = workers
+        self._loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        self._reader, self._writer = multiprocessing.Pipe(duplex=False)
+        self._executor: ProcessPoolExecutor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(cache_size, memory_limit, self._writer),
+        )
+
+        self._pids: Set[int] = set()  # of the workers of this pool only
+        self._job_ids: Iterator[int] = itertools.count()
+        self._started: Dict[int, asyncio.Future] = {}  # {job id: set once the job starts}, of the queued jobs
+        threading.Thread(target=self._read_events, daemon=True).start()
+
+    async def start(self):
+        # the pool starts its workers lazily, a job per worker starts (and warms up) all of them now
+        await asyncio.gather(*[self._loop.run_in_executor(self._executor, _ping) for _ in range(self._workers)])
+
+    def submit(self, job: Callable, timeout: float) -> Tuple[asyncio.Future, asyncio.Future]:
+        # return the future of the result, and a future set once a worker starts the job
+        job_id = next(self._job_ids)
+        started = self._started[job_id] = self._loop.create_future()
+        future = self._loop.run_in_executor(self._executor, partial(_start_job, job_id, job, timeout))
+        future.add_done_callback(lambda _: self._started.pop(job_id, None))
+        return future, started
+
+    def kill(self):
+        # a running job cannot be cancelled, the workers of the pool are killed, failing their other jobs
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self.close()
+
+    def shutdown(self):
+        self._executor.shutdown()
+        self.close()
+
+    def close(self):
+        # stop reading the events
+        self._writer.send((None, None))
+        self._writer.close()
+
+    def _read_events(self):
+        while True:
+            kind, value = self._reader.recv()
+            if kind == EVENT_WORKER:
+                self._pids.add(value)
+            elif kind == EVENT_JOB:
+                self._loop.call_soon_threadsafe(self._on_job_started, value)
+            else:
+                break
+        self._reader.close()
+
+    def _on_job_started(self, job_id: int):
+        started = self._started.get(job_id)
+        if started is not None and not started.done():
+            started.set_result(None)
+
+
+class CompressionDaemon:
+    def __init__(
+        self,
+        socket_path: str = DEFAULT_SOCKET_PATH,
+        workers: Optional[int] = None,
+        memory_limit: int = 0,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        timeout: float = DEFAULT_JOB_TIMEOUT,
+    ):
+        assert timeout >= 0
+        self._socket_path: str = socket_path
+        self._workers: int = workers or os.cpu_count()
+        self._memory_limit: int = memory_limit  # per job in bytes, 0 for unlimited
+        self._cache_size: int = cache_size
+        self._timeout: float = timeout  # per job in seconds, 0 for unlimited
+
+        self._worker_pool: Optional[_WorkerPool] = None
+
+        # ===== statistics =====
+        self._start_time: float = 0
+        self._queued_jobs: int = 0  # submitted but not finished
+        self._done_jobs: int = 0
+        self._failed_jobs: int = 0
+        self._timed_out_jobs: int = 0
+        self._bytes_in: int = 0
+        self._bytes_out: int = 0
+        self._busy_time: float = 0  # total time spent on finished jobs
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "uptime": time.time() - self._start_time,
+            "queue depth": self._queued_jobs,
+            "done jobs": self._done_jobs,
+            "failed jobs": self._failed_jobs,
+            "timed out jobs": self._timed_out_jobs,
+            "bytes in": self._bytes_in,
+            "bytes out": self._bytes_out,
+            "throughput (bytes/s)": self._bytes_in / self._busy_time if self._busy_time > 0 else 0,
+        }
+
+    async def serve(self):
+        self._start_time = time.time()
+        self._worker_pool = _WorkerPool(self._workers, self._cache_size, self._memory_limit)
+
+        try:
+            await self._worker_pool.start()
+            server = await asyncio.start_unix_server(self._handle_connection, path=self._socket_path)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._worker_pool.shutdown()
+            if os.path.exists(self._socket_path):
+                os.remove(self._socket_path)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # a connection may send any number of requests
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                # a header that cannot be parsed is answered with an error, as a request without payload
+                try:
+                    request = self._parse_header(line)
+                except (ValueError, AssertionError) as e:
+                    header, output = self._error(e), b""
+                else:
+                    payload = await reader.readexactly(request.get("size", 0))
+                    try:
+                        header, output = await self._run_job(request, payload)
+                    except Exception as e:
+                        header, output = self._error(e), b""
+
+                header["size"] = len(output)
+                writer.write(json.dumps(header).encode() + b"\n" + output)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_header(line: bytes) -> dict:
+        request = json.loads(line)
+        assert isinstance(request, dict), "the header is not a json object"
+        size = request.get("size", 0)
+        assert isinstance(size, int) and size >= 0, f"invalid payload size {size}"
+        return request
+
+    @staticmethod
+    def _error(e: Exception) -> dict:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    async def _replace_worker_pool(self, worker_pool: _WorkerPool):
+        # kill the workers of a pool with a stuck job, the other jobs of the pool fail as well
+        if worker_pool is not self._worker_pool:
+            return  # already replaced
+
+        self._worker_pool = _WorkerPool(self._workers, self._cache_size, self._memory_limit)
+        worker_pool.kill()
+        await self._worker_pool.start()
+
+    async def _run_job(self, request: dict, payload: bytes) -> Tuple[dict, bytes]:
+        op = request["op"]
+        if op == OP_STATS:
+            return {"ok": True, **self.stats}, b""
+
+        assert op in (OP_COMPRESS, OP_DECOMPRESS), f"unknown op {op}"
+        coder = request.get("coder", CODER_STATIC)
+        assert coder in (CODER_STATIC, CODER_ADAPTIVE), f"unknown coder {coder}"
+
+        # a job expected to exceed the memory limit is rejected before it runs,
+        # the workers are also bounded by an address space limit of their own, in case the estimate is off
+        src_file_path = request.get("in")
+        input_size = os.path.getsize(src_file_path) if src_file_path else len(payload)
+        if self._memory_limit > 0 and input_size * MEMORY_FACTOR > self._memory_limit:
+            raise MemoryError(f"job of {input_size} bytes exceeds the memory limit")
+
+        if src_file_path:
+            job = (
+                partial(_compress_file, src_file_path, request["out"], coder, request.get("b", 1))
+                if op == OP_COMPRESS
+                else partial(_decompress_file, src_file_path, request["out"], coder)
+            )
+        else:
+            job = (
+                partial(_compress_bytes, payload, coder, request.get("b", 1))
+                if op == OP_COMPRESS
+                else partial(_decompress_bytes, payload, coder)
+            )
+
+        self._queued_jobs += 1
+        start = time.time()
+        worker_pool = self._worker_pool
+        try:
+            # the deadline runs once a worker starts the job, not while the job waits in the queue
+            future, started = worker_pool.submit(job, self._timeout)
+            await asyncio.wait({future, started}, return_when=asyncio.FIRST_COMPLETED)
+            done, _ = await asyncio.wait({future}, timeout=self._timeout + KILL_GRACE if self._timeout > 0 else None)
+            if not done:
+                future.cancel()
+                await self._replace_worker_pool(worker_pool)
+                raise TimeoutError("job deadline exceeded, its worker was killed")
+            result = future.result()
+        except BaseException as e:
+            self._failed_jobs += 1
+            self._timed_out_jobs += isinstance(e, TimeoutError)
+            raise
+        finally:
+            self._queued_jobs -= 1
+            self._busy_time += time.time() - start
+
+        self._done_jobs += 1
+        self._bytes_in += input_size
+
+        header = {"ok": True}
+        output = b""
+        if op == OP_COMPRESS:
+            if src_file_path:
+                header["coder"] = result
+            else:
+                output, header["coder"] = result
+        elif not src_file_path:
+            output = result
+
+        self._bytes_out += os.path.getsize(request["out"]) if src_file_path else len(output)
+        return header, output
+
+
+class DaemonClient:
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile("rwb")
+
+    def compress(self, data: bytes, coder: str = CODER_STATIC, bytes_per_symbol: int = 1) -> Tuple[bytes, str]:
+        # return compressed data and the coder actually used
+        header, output = self._request({"op": OP_COMPRESS, "coder": coder, "b": bytes_per_symbol}, data)
+        return output, header["coder"]
+
+    def decompress(self, data: bytes, coder: str = CODER_STATIC) -> bytes:
+        return self._request({"op": OP_DECOMPRESS, "coder": coder}, data)[1]
+
+    def compress_file(self, src_file_path: str, comp_file_path: str, coder: str = CODER_STATIC, bytes_per_symbol: int = 1) -> str:
+        request = {"op": OP_COMPRESS, "coder": coder, "b": bytes_per_symbol, "in": src_file_path, "out": comp_file_path}
+        return self._request(request)[0]["coder"]
+
+    def decompress_file(self, comp_file_path: str, decomp_file_path: str, coder: str = CODER_STATIC):
+        self._request({"op": OP_DECOMPRESS, "coder": coder, "in": comp_file_path, "out": decomp_file_path})
+
+    def stats(self) -> dict:
+        return self._request({"op": OP_STATS})[0]
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def _request(self, header: dict, payload: bytes = b"") -> Tuple[dict, bytes]:
+        header["size"] = len(payload)
+        self._file.write(json.dumps(header).encode() + b"\n" + payload)
+        self._file.flush()
+
+        response = json.loads(self._file.readline())
+        output = self._file.read(response["size"])
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+
+        return response, output
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    socket_path = kwargs.get("socket", DEFAULT_SOCKET_PATH)
+    workers = int(kwargs["workers"]) if "workers" in kwargs else None
+    memory_limit = int(kwargs.get("mem", 0)) * BYTES_PER_MB
+    cache_size = int(kwargs.get("cache", DEFAULT_CACHE_SIZE))
+    timeout = float(kwargs.get("timeout", DEFAULT_JOB_TIMEOUT))
+
+    daemon = CompressionDaemon(socket_path, workers, memory_limit, cache_size, timeout)
+    asyncio.run(daemon.serve())
@@ -1,78 +1,240 @@
-from typing import BinaryIO
+from typing import BinaryIO, Dict, List, MutableMapping, Optional
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from math import ceil
 import sys
 import io
+import os
  
-from base_coder import BaseDecoder
+from base_coder import BaseDecoder, BLOCK_STORED, BLOCK_INTERLEAVED, BLOCK_ANS, BLOCK_LEN_SIZE
 from utils import (
     BITS_PER_BYTE,
     BUFFER_SIZE,
+    MAX_BYTE_PER_SYMBOL,
     DECOMP_FILE_EXTENSION,
+    ANS_FORMAT_ID,
+    bytes_to_bits,
+    extended_chr,
     extended_ord,
 )
-from bit_io_stream import (
-    BitInStream,
-    BitOutStream,
-    IO_MODE_BIT,
-    IO_MODE_BYTE,
-)
+from bit_io_stream import BitInStream, IO_MODE_BYTE
 from huffman_tree import HuffmanTree
+from ans_table import ANSTable, STATE_SIZE
+from histogram import escape_symbol
+
+
+# ===== worker states =====
+_stream_decoder = None
+
+
+def _init_stream_worker(bits_per_symbol: int, code_len_dict: Dict[str, int], ans_counts: Optional[Dict[str, int]]):
+    global _stream_decoder
+    _stream_decoder = Decoder()
+    _stream_decoder._set_code_table(bits_per_symbol, code_len_dict, ans_counts)
+
+
+def _decode_stream(stream: bytes) -> bytes:
+    return _stream_decoder._decode_stream(stream)
+
+
+def _decode_ans_block(block: bytes) -> bytes:
+    return _stream_decoder._decode_ans_block(block)
 
 
 class Decoder(BaseDecoder):
-    BITS_PER_READ = 256  # more convenient to strip off dummy bits
-    
-    def __init__(self, verbose: int=0):
+    def __init__(self, verbose: int=0, tree_cache: Optional[MutableMapping]=None, workers: int=1):
         super().__init__(verbose)
 
+        self._tree_cache = tree_cache  # {code length dict: HuffmanTree}, shared by decoders
+        self._code_len_dict: Dict[str, int] = {}
+        self._ans_table: Optional[ANSTable] = None  # only if the file holds a tANS table
+
+        # processes decoding the streams of blocks, None for number of cpus
+        self._workers: Optional[int] = workers or None
+
+        self._escape: Optional[str] = None  # key of the escape codeword
+        self._literal: Optional[str] = None  # bits of the raw symbol being read after an escape
+
     def decode(self, src_file_path: str, decomp_file_path: str):
-        with open(src_file_path, "rb", BUFFER_SIZE) as src, open(decomp_file_path, "wb", BUFFER_SIZE) as decomp:
+        with open(src_file_path, "rb", BUFFER_SIZE) as src:
+            if self._copy_if_stored(src, decomp_file_path):
+                return
+
             self._parse_header(src)
 
-            istream = BitInStream(src, mode=IO_MODE_BIT)
-            ostream = BitOutStream(decomp, mode=IO_MODE_BYTE)
+            with self._undo_filters(decomp_file_path) as decoded_file_path:
+                with open(decoded_file_path, "wb", BUFFER_SIZE) as decomp:
+                    self._decode_content(src, decomp)
+                self._trunc(decoded_file_path)
+
+    def reset(self):
+        super().reset()
+        self._code_len_dict = {}
+        self._ans_table = None
+        self._escape = None
+        self._literal = None
 
-            next_bit_seq = istream.read(self.BITS_PER_READ)
-            while next_bit_seq:
-                curr_bit_seq = next_bit_seq
-                next_bit_seq = istream.read(self.BITS_PER_READ)
+    def _decode_content(self, src: BinaryIO, decomp: BinaryIO):
+        if self._block_size > 0:
+            self._decode_blocks(src, decomp)
+            self.code_dict = self._tree.code_dict
+            return
 
-                if not next_bit_seq and self._dummy_codeword_bits > 0:
-                    curr_bit_seq = curr_bit_seq[:-self._dummy_codeword_bits]
+        # a buffer is decoded once the next one is read, to strip off the dummy bits of the last one
+        next_buffer = src.read(BUFFER_SIZE)
+        while next_buffer:
+            curr_buffer = next_buffer
+            next_buffer = src.read(BUFFER_SIZE)
 
-                symbols = ""
-                for bit in curr_bit_seq:
-                    symbol = self._tree.decode(bit)
-                    if symbol:
-                       symbols += symbol
+            bits = bytes_to_bits(curr_buffer)
+            if not next_buffer and self._dummy_codeword_bits > 0:
+                bits = bits[:-self._dummy_codeword_bits]
 
-                ostream.write(symbols)
+            decomp.write(self._decode_bits(bits).encode("latin-1"))
 
         self.code_dict = self._tree.code_dict
         assert self._tree._cur == self._tree._root
-        self._trunc(decomp_file_path)
+
+    def _decode_blocks(self, src: BinaryIO, decomp: BinaryIO):
+        if self._workers != 1:
+            self._decode_blocks_in_parallel(src, decomp)
+            return
+
+        while True:
+            block = self._read_block(src)
+            if block is None:
+                break
+
+            block_type, content = block
+            if block_type == BLOCK_STORED:
+                decomp.write(content)
+            elif block_type == BLOCK_INTERLEAVED:
+                decomp.write(self._interleave([self._decode_stream(stream) for stream in self._split_streams(content)]))
+            elif block_type == BLOCK_ANS:
+                decomp.write(self._decode_ans_block(content))
+            else:
+                decomp.write(self._decode_stream(content))
+
+    def _decode_blocks_in_parallel(self, src: BinaryIO, decomp: BinaryIO):
+        # every stream (a coded block or a stream of an interleaved block) is decoded by a worker
+        # blocks are written in order, at most a few blocks per worker are pending
+        ans_counts = self._ans_table.counts if self._ans_table is not None else None
+        executor = ProcessPoolExecutor(
+            max_workers=self._workers,
+            initializer=_init_stream_worker,
+            initargs=(self._bits_per_symbol, self._code_len_dict, ans_counts),
+        )
+        max_pending = 2 * (self._workers or os.cpu_count())
+        pending = deque()  # [stored content or futures of the streams]
+
+        def write_block(block):
+            decomp.write(block if isinstance(block, bytes) else self._interleave([f.result() for f in block]))
+
+        with executor:
+            while True:
+                block = self._read_block(src)
+                if block is None:
+                    break
+
+                block_type, content = block
+                if block_type == BLOCK_STORED:
+                    pending.append(content)
+                elif block_type == BLOCK_INTERLEAVED:
+                    pending.append([executor.submit(_decode_stream, stream) for stream in self._split_streams(content)])
+                elif block_type == BLOCK_ANS:
+                    pending.append([executor.submit(_decode_ans_block, content)])
+                else:
+                    pending.append([executor.submit(_decode_stream, content)])
+
+                while len(pending) > max_pending:
+                    write_block(pending.popleft())
+
+            while pending:
+                write_block(pending.popleft())
+
+    def _decode_stream(self, stream: bytes) -> bytes:
+        # a coded block or a stream of an interleaved block
+        symbols = self._decode_bits(self._get_codewords(stream))
+        assert self._tree._cur == self._tree._root and self._literal is None
+        return symbols.encode("latin-1")
+
+    def _decode_ans_block(self, block: bytes) -> bytes:
+        symbol_cnt = int.from_bytes(block[:BLOCK_LEN_SIZE], "big")
+        state = int.from_bytes(block[BLOCK_LEN_SIZE:BLOCK_LEN_SIZE+STATE_SIZE], "big")
+        bits = self._get_codewords(block[BLOCK_LEN_SIZE+STATE_SIZE:])
+        return self._ans_table.decode(state, bits, symbol_cnt).encode("latin-1")
+
+    def _interleave(self, streams: List[bytes]) -> bytes:
+        # the i-th symbol is taken from stream i % len(streams)
+        if len(streams) == 1:
+            return streams[0]
+
+        b = self._bytes_per_symbol
+        step = len(streams) * b
+        symbols = bytearray(sum(len(stream) for stream in streams))
+        for i, stream in enumerate(streams):
+            for j in range(b):
+                symbols[i*b+j::step] = stream[j::b]
+
+        return bytes(symbols)
+
+    def _decode_bits(self, bits: str) -> str:
+        symbols = []
+        for bit in bits:
+            if self._literal is not None:
+                self._literal += bit
+                if len(self._literal) == self._bits_per_symbol:
+                    symbols.append(extended_chr(int(self._literal, 2), self._bits_per_symbol))
+                    self._literal = None
+                continue
+
+            symbol = self._tree.decode(bit)
+            if symbol is None:
+                continue
+            elif symbol == self._escape:
+                self._literal = ""
+            else:
+                symbols.append(symbol)
+
+        return "".join(symbols)
 
     def _parse_header(self, file_obj: BinaryIO):
         """
+            format id: 1 byte (only with a tANS table)
             bits per symbol: 1 byte
             dummy symbol bytes: 1 byte
             size of codelen_dict: `bytes_per_symbol` bytes
             code length dict: {symbol}{code length}{symbol}{code length}{symbol}{code length}...
                 symbol: `bytes_per_symbol` bytes
                 code length: `bytes_per_symbol` bytes
+            escape code length: `bytes_per_symbol` bytes (0 if nothing is escaped)
             dummy codeword bits: 1 byte
+            block size: 4 bytes
+            filter chain length: 1 byte
+            filter chain: {filter id}{width}... (2 bytes per filter)
+            tANS table log: 1 byte (only with a tANS table)
+            tANS counts: {count - 1}... (table log bits each, padded to a byte, only with a tANS table)
+                in the order of the code length dict, followed by the escape if any
         """
 
         stream = BitInStream(file_obj, mode=IO_MODE_BYTE)
 
         self._bits_per_symbol = ord(stream.read(1))
+        has_ans_table = self._bits_per_symbol == ANS_FORMAT_ID
+        if has_ans_table:
+            self._bits_per_symbol = ord(stream.read(1))
+        assert self._bits_per_symbol > 0 and self._bits_per_symbol % BITS_PER_BYTE == 0, "not a huffman coded file"
         self._bytes_per_symbol = self._bits_per_symbol // BITS_PER_BYTE
+        assert self._bytes_per_symbol <= MAX_BYTE_PER_SYMBOL
 
         self._dummy_symbol_bytes = ord(stream.read(1))
+        assert 0 <= self._dummy_symbol_bytes < self._bytes_per_symbol
 
         code_len_dict_size = extended_ord(stream.read(self._bytes_per_symbol))
         if code_len_dict_size == 0:
             # 0 represents 2 ** self._bits_per_symbol
             code_len_dict_size = 2 ** self._bits_per_symbol
+        assert code_len_dict_size * 2 * self._bytes_per_symbol <= self._remaining_bytes(file_obj), "truncated header"
 
         code_len_dict = {}
         for _ in range(code_len_dict_size):
@@ -81,9 +243,63 @@ class Decoder(BaseDecoder):
 
             # 0 represents 2 ** self._bits_per_symbol
             code_len_dict[symbol] = (2 ** self._bits_per_symbol if code_len == 0 else code_len)
-        
+
+        escape_code_len = extended_ord(stream.read(self._bytes_per_symbol))
+        if escape_code_len > 0:
+            code_len_dict[escape_symbol(self._bytes_per_symbol)] = escape_code_len
+
+        # the codes of a huffman tree fill the code space, none is longer than the number of codes - 1
+        max_code_len = max(code_len_dict.values(), default=0)
+        assert 0 < max_code_len < len(code_len_dict), "invalid code lengths"
+        assert sum(1 << (max_code_len - code_len) for code_len in code_len_dict.values()) == 1 << max_code_len, "invalid code lengths"
+
         self._dummy_codeword_bits = ord(stream.read(1))
-        self._tree = HuffmanTree(code_len_dict=code_len_dict)
+        self._parse_block_size_header(stream)
+        self._parse_filters_header(stream)
+
+        ans_counts = None
+        if has_ans_table:
+            table_log = ord(stream.read(1))
+            counts = bytes_to_bits(stream.read(ceil(len(code_len_dict) * table_log / BITS_PER_BYTE)).encode("latin-1"))
+            ans_counts = {
+                symbol: int(counts[i*table_log:(i+1)*table_log], 2) + 1
+                for i, symbol in enumerate(code_len_dict)
+            }
+
+        self._set_code_table(self._bits_per_symbol, code_len_dict, ans_counts)
+
+    def _set_code_table(
+        self,
+        bits_per_symbol: int,
+        code_len_dict: Dict[str, int],
+        ans_counts: Optional[Dict[str, int]]=None,
+    ):
+        self._bits_per_symbol = bits_per_symbol
+        self._bytes_per_symbol = bits_per_symbol // BITS_PER_BYTE
+
+        escape = escape_symbol(self._bytes_per_symbol)
+        self._escape = escape if escape in code_len_dict else None
+
+        self._code_len_dict = code_len_dict
+        self._tree = self._build_tree(code_len_dict)
+
+        if ans_counts is not None:
+            table_log = sum(ans_counts.values()).bit_length() - 1
+            self._ans_table = ANSTable(ans_counts, table_log, self._escape, bits_per_symbol)
+
+    def _build_tree(self, code_len_dict: Dict[str, int]) -> HuffmanTree:
+        if self._tree_cache is None:
+            return HuffmanTree(code_len_dict=code_len_dict)
+
+        key = frozenset(code_len_dict.items())
+        tree = self._tree_cache.get(key)
+        if tree is None:
+            tree = HuffmanTree(code_len_dict=code_len_dict)
+            self._tree_cache[key] = tree
+        else:
+            tree.reset()
+
+        return tree
 
     def _trunc(self, decomp_file_path: str):
         # strip off dummy symbol bytes
@@ -99,7 +315,8 @@ if __name__ == "__main__":
     kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
     
     verbose = int(kwargs.get("v", 0))
-    decoder = Decoder(verbose=verbose)
+    workers = int(kwargs["workers"]) if "workers" in kwargs else 1
+    decoder = Decoder(verbose=verbose, workers=workers)
 
     src = kwargs["in"]
     decomp = kwargs.get("out", f"{src}.{DECOMP_FILE_EXTENSION}")
@@ -1,22 +1,89 @@
-from typing import Dict
-from math import log2
+from typing import BinaryIO, Dict, List, MutableMapping, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from math import ceil, log2
 from pathlib import Path
 import sys
+import os
+import io
 
 from utils import (
     BITS_PER_BYTE,
     BUFFER_SIZE,
     COMP_FILE_EXTENSION,
+    BYTES_PER_MB,
+    ANS_FORMAT_ID,
+    bits_to_bytes,
     extended_chr,
+    extended_ord,
+    static_header_size,
 )
-from base_coder import BaseEncoder
-from bit_io_stream import (
-    BitInStream,
-    BitOutStream,
-    IO_MODE_BYTE,
-    IO_MODE_BIT,
+from base_coder import (
+    BaseEncoder,
+    BLOCK_CODED,
+    BLOCK_STORED,
+    BLOCK_INTERLEAVED,
+    BLOCK_ANS,
+    BLOCK_LEN_SIZE,
+    MAX_STREAMS,
 )
+from bit_io_stream import BitInStream, BitOutStream, IO_MODE_BYTE
 from huffman_tree import HuffmanTree
+from ans_table import ANSTable, STATE_SIZE, normalize_counts, select_table_log
+from histogram import HeavyHitters, SYMBOL_MEMORY, escape_symbol
+from filters import FilterPipeline
+from estimator import Estimate, CompressibilityEstimator, DEFAULT_MAX_SYMBOLS, select_bytes_per_symbol
+from result_cache import ResultCache, DEFAULT_CACHE_SIZE
+
+
+SAMPLE_LEAD = "lead"  # the leading bytes of the file
+SAMPLE_STRIDE = "stride"  # evenly strided blocks of the file, which must be seekable
+SAMPLE_MODES = (SAMPLE_LEAD, SAMPLE_STRIDE)
+DEFAULT_SAMPLE_SIZE = 4 * BYTES_PER_MB
+
+MIN_RANGE_SIZE = BYTES_PER_MB  # of the byte ranges counted in parallel
+
+
+def _count_range(src_file_path: str, start: int, end: int, bytes_per_symbol: int) -> Tuple[Dict[str, int], int]:
+    # return the count of each symbol in [start, end) in order of first occurrence, and the dummy symbol bytes
+    b = bytes_per_symbol
+    counts = Counter()
+    dummy_symbol_bytes = 0
+
+    with open(src_file_path, "rb", BUFFER_SIZE) as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            block = f.read(min(BUFFER_SIZE - BUFFER_SIZE % b, end - pos))
+            if len(block) == 0:
+                break
+
+            pos += len(block)
+            if len(block) % b:
+                dummy_symbol_bytes = b - len(block) % b
+                block += bytes(dummy_symbol_bytes)
+
+            symbols = block.decode("latin-1")
+            counts.update([symbols[i:i+b] for i in range(0, len(symbols), b)])
+
+    return dict(counts), dummy_symbol_bytes
+
+
+class _PrefixedReader:
+    # read `head`, then the rest of `file_obj`
+    def __init__(self, head: bytes, file_obj: BinaryIO):
+        self._head: memoryview = memoryview(head)
+        self._pos: int = 0
+        self._file_obj: BinaryIO = file_obj
+
+    def read(self, n: int) -> bytes:
+        data = bytes(self._head[self._pos:self._pos+n])
+        self._pos += len(data)
+
+        if len(data) < n:
+            data += self._file_obj.read(n - len(data))
+
+        return data
 
 
 class Encoder(BaseEncoder):
@@ -24,33 +91,140 @@ class Encoder(BaseEncoder):
     PROGRESS_WRITE_HEADER = "WRITE_HEADER"
     PROGRESS_WRITE_CONTENT = "WRITE_CONTENT"
 
-    def __init__(self, bytes_per_symbol: int, verbose: int=0):
-        super().__init__(bytes_per_symbol, verbose)
+    def __init__(
+        self,
+        bytes_per_symbol: int,
+        verbose: int=0,
+        filters: Optional[FilterPipeline]=None,
+        tree_cache: Optional[MutableMapping]=None,
+        min_ratio: Optional[float]=None,
+        block_size: int=0,
+        max_memory: int=0,
+        sample: Optional[str]=None,
+        sample_size: int=DEFAULT_SAMPLE_SIZE,
+        workers: Optional[int]=1,
+        streams: int=1,
+        result_cache: Optional[ResultCache]=None,
+        ans: bool=False,
+        timeline: int=0,
+    ):
+        super().__init__(bytes_per_symbol, verbose, filters, min_ratio, block_size, result_cache, timeline)
 
         self._current_progress = None
         self._symbol_distributions: Dict[str, int] = {}  # count for each symbol in the file
+        self._tree_cache = tree_cache  # {symbol distribution: HuffmanTree}, shared by encoders
+
+        # with a memory limit (in bytes), only the most frequent symbols get a codeword,
+        # the others are coded by the escape codeword followed by the raw symbol
+        assert max_memory == 0 or max_memory >= 4 * SYMBOL_MEMORY
+        self._max_memory: int = max_memory
+        self._escape: Optional[str] = None  # key of the escape codeword, None if nothing is escaped
+        self._dummy_symbol_bytes_offset: int = 0
+        self._dummy_codeword_bits_offset: int = 0
+
+        # with a sample mode, the code table is built from a sample and the file is read only once
+        # symbols missing from the sample are escaped
+        assert sample is None or (sample in SAMPLE_MODES and sample_size >= bytes_per_symbol and max_memory == 0)
+        self._sample: Optional[str] = sample
+        self._sample_size: int = sample_size  # in bytes
+
+        self._workers: int = workers or os.cpu_count()  # processes counting symbols, None for number of cpus
+
+        # with more than one stream, the symbols of each block are interleaved into independent streams,
+        # which can be decoded in parallel
+        assert 0 < streams <= MAX_STREAMS and (streams == 1 or block_size > 0)
+        self._streams: int = streams
+
+        # with ans, the file also holds a tANS table normalized from the same counts,
+        # each block is coded with the huffman or the tANS table, whichever is expected to be smaller
+        assert not ans or block_size > 0
+        self._ans: bool = ans
+        self._ans_table: Optional[ANSTable] = None
+
+        self._cached_block_cnt: int = 0  # blocks found in the result cache
+
+    def reset(self):
+        super().reset()
+        self._current_progress = None
+        self._symbol_distributions = {}
+        self._escape = None
+        self._dummy_symbol_bytes_offset = 0
+        self._dummy_codeword_bits_offset = 0
+        self._ans_table = None
+        self._cached_block_cnt = 0
+
+    def _encode(self, src_file_path: str, comp_file_path: str):
+        with self._apply_filters(src_file_path) as filtered_file_path:
+            if self._should_store(filtered_file_path):
+                self._store(src_file_path, comp_file_path)
+                return
+
+            with open(filtered_file_path, "rb", BUFFER_SIZE) as src:
+                if self._sample is not None:
+                    # the file is read only once, the bytes consumed by the sample are coded first
+                    src = _PrefixedReader(self._sample_symbol_dist(filtered_file_path, src), src)
+                else:
+                    self._calculate_symbol_dist(filtered_file_path)
 
-    def encode(self, src_file_path: str, comp_file_path: str):
-        self._calculate_symbol_dist(src_file_path)
+                self._tree = self._build_tree()
+                self._ans_table = self._build_ans_table()
+                with open(comp_file_path, "w+b", BUFFER_SIZE) as comp:
+                    self._write_header(comp)
+                    self._write_content(src, comp)
 
-        if len(self._symbol_distributions) < 2:
-            raise NotImplementedError()
-        else:
-            self._tree = HuffmanTree(symbol_distribution=self._symbol_distributions)
+    def _compress(self, data: bytes, comp: BinaryIO):
+        # the exact counts of a payload in memory are cheap, there is no need to sample or bound them
+        assert self._sample is None and self._max_memory == 0
+        self._current_progress = self.PROGRESS_CALULATE_SYMBOLS
+
+        b = self._bytes_per_symbol
+        symbols = (data + bytes(-len(data) % b)).decode("latin-1")
+        self._symbol_distributions = dict(Counter([symbols[i:i+b] for i in range(0, len(symbols), b)]))
 
-        self._write_header(comp_file_path)
-        self._write_content(src_file_path, comp_file_path)
+        self._tree = self._build_tree()
+        self._ans_table = self._build_ans_table()
+        self._write_header(comp)
+        self._write_content(io.BytesIO(data), comp)
 
     def export_results(self, export_path: Path):
         with open(export_path, "w") as f:
             f.write(f"{'='*10} params {'='*10}\n")
             f.write(f"bytes per symbol: {self._bytes_per_symbol}\n")
+            f.write(f"filters: {self._filters}\n")
+            f.write(f"min ratio: {self._min_ratio}\n")
+            f.write(f"block size: {self._block_size}\n")
+            f.write(f"max memory: {self._max_memory}\n")
+            f.write(f"sample: {self._sample}\n")
+            f.write(f"streams: {self._streams}\n")
+            f.write(f"ans: {self._ans}\n")
 
             f.write(f"\n{'='*10} statistics {'='*10}\n")
+            if self._cached_bytes is not None:
+                f.write(f"found in the result cache\n")
+                f.write(f"compression ratio: {self.compression_ratio}\n")
+                return
+            if self._estimate:
+                f.write(f"predicted compression ratio: {self._estimate.static_ratio}\n")
+            if self._stored:
+                f.write(f"stored as is\n")
+                f.write(f"compression ratio: {self.compression_ratio}\n")
+                return
+
             f.write(f"total symbols: {self._symbol_cnt}\n")
             f.write(f"header size: {self._get_header_size()}\n")
             f.write(f"entropy: {self.entropy}\n")
             f.write(f"average codeword length: {self.avg_codeword_len}\n")
+            if self._escape is not None:
+                f.write(f"escaped symbols: {self._symbol_distributions[self._escape]}\n")
+            if self._ans_table is not None:
+                f.write(f"ans table log: {self._ans_table.table_log}\n")
+                f.write(f"ans average codeword length: {self.ans_avg_codeword_len}\n")
+            if self._block_size > 0:
+                f.write(f"coded blocks: {self._block_cnts[BLOCK_CODED] + self._block_cnts[BLOCK_INTERLEAVED]}\n")
+                f.write(f"ans blocks: {self._block_cnts[BLOCK_ANS]}\n")
+                f.write(f"stored blocks: {self._block_cnts[BLOCK_STORED]}\n")
+                if self._result_cache is not None:
+                    f.write(f"cached blocks: {self._cached_block_cnt}\n")
             f.write(f"compression ratio: {self.compression_ratio}\n")
 
     @property
@@ -63,8 +237,9 @@ class Encoder(BaseEncoder):
         assert self._current_progress not in [None, self.PROGRESS_CALULATE_SYMBOLS]
         
         ent = 0
+        total_cnt = sum(self._symbol_distributions.values())  # of the sample in single pass mode
         for cnt in self._symbol_distributions.values():
-            p = cnt / self._symbol_cnt
+            p = cnt / total_cnt
             ent -= p * log2(p)
 
         return ent
@@ -81,13 +256,69 @@ class Encoder(BaseEncoder):
         total_codelen = 0
         for symbol, cnt in self._symbol_distributions.items():
             total_codelen += cnt * len(self.code_dict[symbol])
+            if symbol == self._escape:
+                total_codelen += cnt * self._bits_per_symbol  # raw symbols
+
+        return total_codelen / sum(self._symbol_distributions.values())
+
+    @property
+    def ans_avg_codeword_len(self) -> float:
+        assert self._ans_table is not None
+
+        total_cost = sum([cnt * self._ans_table.cost(symbol) for symbol, cnt in self._symbol_distributions.items()])
+        return total_cost / sum(self._symbol_distributions.values())
+
+    def _build_tree(self) -> HuffmanTree:
+        if len(self._symbol_distributions) < 2:
+            raise NotImplementedError()
+
+        if self._tree_cache is None:
+            return HuffmanTree(symbol_distribution=self._symbol_distributions)
+
+        key = tuple(self._symbol_distributions.items())
+        tree = self._tree_cache.get(key)
+        if tree is None:
+            tree = HuffmanTree(symbol_distribution=self._symbol_distributions)
+            self._tree_cache[key] = tree
+
+        return tree
+
+    def _build_ans_table(self) -> Optional[ANSTable]:
+        # None without ans, or if the symbols do not fit in the largest table
+        if not self._ans:
+            return None
 
-        return total_codelen / self._symbol_cnt
+        table_log = select_table_log(len(self._symbol_distributions))
+        if table_log is None:
+            return None
+
+        # in the order of the code length dict of the header, where the escape comes last
+        symbols = [symbol for symbol in self._tree.code_dict if symbol != self._escape]
+        if self._escape is not None:
+            symbols.append(self._escape)
+        dist = {symbol: self._symbol_distributions[symbol] for symbol in symbols}
+        table = ANSTable(normalize_counts(dist, table_log), table_log, self._escape, self._bits_per_symbol)
+
+        # the table is only worth its header if it is expected to save more bits than it takes,
+        # by the counts of the whole file (or its sample) even though each block picks its own table
+        saved_bits = 0
+        for symbol, cnt in dist.items():
+            code_len = len(self._tree.code_dict[symbol]) + (self._bits_per_symbol if symbol == self._escape else 0)
+            saved_bits += cnt * (code_len - table.cost(symbol))
+
+        return table if saved_bits > (2 + len(dist) * table_log / BITS_PER_BYTE) * BITS_PER_BYTE else None
 
     def _calculate_symbol_dist(self, src_file_path: str):
         self._current_progress = self.PROGRESS_CALULATE_SYMBOLS
         self._dummy_symbol_bytes = 0
 
+        if self._max_memory > 0:
+            self._calculate_bounded_symbol_dist(src_file_path)
+            return
+        elif self._workers > 1 and os.path.getsize(src_file_path) >= 2 * MIN_RANGE_SIZE:
+            self._calculate_parallel_symbol_dist(src_file_path)
+            return
+
         with open(src_file_path, "rb", BUFFER_SIZE) as f:
             stream = BitInStream(f, IO_MODE_BYTE)
 
@@ -104,79 +335,295 @@ class Encoder(BaseEncoder):
                 else:
                     self._symbol_distributions[symbol] = 1
 
-    def _write_header(self, comp_file_path: str):
+    def _calculate_parallel_symbol_dist(self, src_file_path: str):
+        # count byte ranges aligned to symbols in parallel, only the last range may end with a partial symbol
+        # merged in order of the ranges, the counts keep the order of first occurrence like the serial count
+        total_bytes = os.path.getsize(src_file_path)
+        range_cnt = min(self._workers, total_bytes // MIN_RANGE_SIZE)
+        range_size = total_bytes // range_cnt
+        range_size -= range_size % self._bytes_per_symbol
+
+        starts = [i * range_size for i in range(range_cnt)]
+        ends = starts[1:] + [total_bytes]
+
+        with ProcessPoolExecutor(max_workers=range_cnt) as executor:
+            results = list(executor.map(
+                _count_range,
+                [src_file_path] * range_cnt, starts, ends, [self._bytes_per_symbol] * range_cnt,
+            ))
+
+        for counts, _ in results:
+            for symbol, cnt in counts.items():
+                self._symbol_distributions[symbol] = self._symbol_distributions.get(symbol, 0) + cnt
+
+        self._dummy_symbol_bytes = results[-1][1]
+
+    def _calculate_bounded_symbol_dist(self, src_file_path: str):
+        # half of the memory for the heavy hitters, half for the exact counts of the block being read
+        capacity = self._max_memory // SYMBOL_MEMORY // 2
+        heavy_hitters = HeavyHitters(capacity)
+        b = self._bytes_per_symbol
+
+        with open(src_file_path, "rb", BUFFER_SIZE) as f:
+            while True:
+                block = f.read(capacity * b)
+                if len(block) == 0:
+                    break
+                elif len(block) % b:
+                    self._dummy_symbol_bytes = b - len(block) % b
+                    block += bytes(self._dummy_symbol_bytes)
+
+                symbols = block.decode("latin-1")
+                heavy_hitters.update(Counter([symbols[i:i+b] for i in range(0, len(symbols), b)]))
+
+        self._symbol_distributions = heavy_hitters.counts
+        escaped_cnt = heavy_hitters.total - sum(self._symbol_distributions.values())
+        if escaped_cnt > 0:
+            self._escape = escape_symbol(b)
+            self._symbol_distributions[self._escape] = escaped_cnt
+
+        # with no symbol above the threshold (e.g. all distinct), the escape needs a sibling in the tree
+        if len(self._symbol_distributions) == 1 and self._escape is not None:
+            self._symbol_distributions[chr(0) * b] = 1
+
+    def _sample_symbol_dist(self, src_file_path: str, src: BinaryIO) -> bytes:
+        # return the bytes consumed from `src`
+        self._current_progress = self.PROGRESS_CALULATE_SYMBOLS
+        b = self._bytes_per_symbol
+
+        if self._sample == SAMPLE_LEAD:
+            head = src.read(self._sample_size - self._sample_size % b)
+            is_complete = len(head) < self._sample_size - self._sample_size % b
+            symbols = head.decode("latin-1")
+            if len(symbols) % b:
+                symbols += chr(0) * (b - len(symbols) % b)
+
+            dist = Counter([symbols[i:i+b] for i in range(0, len(symbols), b)])
+        else:
+            head = b""
+            block_size = CompressibilityEstimator.DEFAULT_BLOCK_SIZE
+            estimator = CompressibilityEstimator(b, max(1, self._sample_size // block_size), block_size)
+            dist = {
+                (chr(symbol) if b == 1 else symbol.decode("latin-1")): cnt
+                for symbol, cnt in estimator.sample_distribution(src_file_path).items()
+            }
+            is_complete = sum(dist.values()) * b >= os.path.getsize(src_file_path)
+
+        self._symbol_distributions = dict(dist)
+        if not is_complete:
+            # symbols seen once in the sample estimate the frequency of those missing from it
+            self._escape = escape_symbol(b)
+            self._symbol_distributions[self._escape] = max(1, sum(1 for cnt in dist.values() if cnt == 1))
+
+        return head
+
+    def _get_codeword(self, symbol: str) -> str:
+        code = self.code_dict.get(symbol)
+        if code is None:
+            # escaped
+            code = self.code_dict[self._escape] + format(extended_ord(symbol), f"0{self._bits_per_symbol}b")
+
+        return code
+
+    def _write_header(self, comp: BinaryIO):
         """
+            format id: 1 byte (only with a tANS table)
             bits per symbol: 1 byte
             dummy symbol bytes: 1 byte
             size of codelen_dict: `bytes_per_symbol` bytes
             code length dict: {symbol}{code length}{symbol}{code length}{symbol}{code length}...
                 symbol: `bytes_per_symbol` bytes
                 code length: `bytes_per_symbol` bytes
+            escape code length: `bytes_per_symbol` bytes (0 if nothing is escaped)
             dummy codeword bits: 1 byte
+            block size: 4 bytes
+            filter chain length: 1 byte
+            filter chain: {filter id}{width}... (2 bytes per filter)
+            tANS table log: 1 byte (only with a tANS table)
+            tANS counts: {count - 1}... (table log bits each, padded to a byte, only with a tANS table)
+                in the order of the code length dict, followed by the escape if any
         """
 
         self._current_progress = self.PROGRESS_WRITE_HEADER
 
-        with open(comp_file_path, "wb", BUFFER_SIZE) as f:
-            stream = BitOutStream(f, mode=IO_MODE_BYTE)
-
-            stream.write(chr(self._bits_per_symbol))
-            stream.write(chr(self._dummy_symbol_bytes))
+        stream = BitOutStream(comp, mode=IO_MODE_BYTE)
 
-            if len(self.code_dict) == 2 ** self._bits_per_symbol:
-                # 0 is never used, use it to represent 2 ** self._bits_per_symbol
-                stream.write(extended_chr(0, self._bits_per_symbol))
-            else:
-                stream.write(extended_chr(len(self.code_dict), self._bits_per_symbol))
+        if self._ans_table is not None:
+            stream.write(chr(ANS_FORMAT_ID))
+        stream.write(chr(self._bits_per_symbol))
+        self._dummy_symbol_bytes_offset = comp.tell()
+        stream.write(chr(self._dummy_symbol_bytes))
 
-            trailing_bits = 0  # bits insufficient to make a byte
-            for symbol, code in self.code_dict.items():
-                code_len = len(code)
-                
-                trailing_bits += code_len * self._symbol_distributions[symbol]
-                trailing_bits %= BITS_PER_BYTE
+        code_len_dict_size = len(self.code_dict) - (self._escape is not None)
+        if code_len_dict_size == 2 ** self._bits_per_symbol:
+            # 0 is never used, use it to represent 2 ** self._bits_per_symbol
+            stream.write(extended_chr(0, self._bits_per_symbol))
+        else:
+            stream.write(extended_chr(code_len_dict_size, self._bits_per_symbol))
 
-                stream.write(symbol)
+        trailing_bits = 0  # bits insufficient to make a byte
+        for symbol, code in self.code_dict.items():
+            if symbol == self._escape:
+                continue
 
-                if code_len == 2 ** self._bits_per_symbol:
-                    # 0 is never used, use it to represent 2 ** self._bits_per_symbol
-                    stream.write(extended_chr(0, self._bits_per_symbol))
-                else:
-                    stream.write(extended_chr(code_len, self._bits_per_symbol))
+            code_len = len(code)
+            
+            trailing_bits += code_len * self._symbol_distributions[symbol]
+            trailing_bits %= BITS_PER_BYTE
 
-            self._dummy_codeword_bits = (BITS_PER_BYTE - trailing_bits) % BITS_PER_BYTE
-            stream.write(chr(self._dummy_codeword_bits))
+            stream.write(symbol)
 
-    def _write_content(self, src_file_path: str, comp_file_path: str):
-        self._current_progress = self.PROGRESS_WRITE_CONTENT
+            if code_len == 2 ** self._bits_per_symbol:
+                # 0 is never used, use it to represent 2 ** self._bits_per_symbol
+                stream.write(extended_chr(0, self._bits_per_symbol))
+            else:
+                stream.write(extended_chr(code_len, self._bits_per_symbol))
 
-        with open(src_file_path, "rb", BUFFER_SIZE) as src, open(comp_file_path, "ab", BUFFER_SIZE) as comp:
-            istream = BitInStream(src, mode=IO_MODE_BYTE)
-            ostream = BitOutStream(comp, mode=IO_MODE_BIT)
+        escape_code_len = 0 if self._escape is None else len(self.code_dict[self._escape])
+        stream.write(extended_chr(escape_code_len, self._bits_per_symbol))
 
-            while True:
-                symbol = istream.read(self._bytes_per_symbol)
+        # each coded block carries its own dummy codeword bits
+        self._dummy_codeword_bits = (BITS_PER_BYTE - trailing_bits) % BITS_PER_BYTE if self._block_size == 0 else 0
+        self._dummy_codeword_bits_offset = comp.tell()
+        stream.write(chr(self._dummy_codeword_bits))
+        self._write_block_size_header(stream)
+        self._write_filters_header(stream)
 
-                if len(symbol) == 0:
-                    break
-                elif len(symbol) < self._bytes_per_symbol:
-                    assert self._dummy_symbol_bytes == self._bytes_per_symbol - len(symbol)
-                    symbol += chr(0) * self._dummy_symbol_bytes
+        if self._ans_table is not None:
+            table_log = self._ans_table.table_log
+            stream.write(chr(table_log))
+            counts = "".join([format(cnt - 1, f"0{table_log}b") for cnt in self._ans_table.counts.values()])
+            stream.write(bits_to_bytes(counts).decode("latin-1"))
 
-                self._symbol_cnt += 1
-                for bit in self.code_dict[symbol]:
-                    self._bits_written += 1
-                    ostream.write(bit)
+    def _write_content(self, src: BinaryIO, comp: BinaryIO):
+        self._current_progress = self.PROGRESS_WRITE_CONTENT
+        self._start_timeline()
 
-            trailing_bits = ostream.flush()
-            dummy_bits = 0 if trailing_bits == 0 else BITS_PER_BYTE - trailing_bits
+        if self._block_size > 0:
+            self._write_blocks(src, comp)
+        else:
+            self._write_codewords(src, comp)
+
+        # the dummies are only known once the content is written, if any symbol is escaped
+        end = comp.tell()
+        comp.seek(self._dummy_symbol_bytes_offset)
+        comp.write(bytes((self._dummy_symbol_bytes,)))
+        comp.seek(self._dummy_codeword_bits_offset)
+        comp.write(bytes((self._dummy_codeword_bits,)))
+        comp.seek(end)
+
+    def _write_codewords(self, src: BinaryIO, comp: BinaryIO):
+        # the codewords of a buffer of symbols are joined and written as whole bytes
+        b = self._bytes_per_symbol
+        trailing_bits = ""  # bits insufficient to make a byte
+
+        while True:
+            buffer = src.read(BUFFER_SIZE - BUFFER_SIZE % b)
+            if len(buffer) == 0:
+                break
+            elif len(buffer) % b:
+                self._dummy_symbol_bytes = b - len(buffer) % b
+                buffer += bytes(self._dummy_symbol_bytes)
+
+            symbols = buffer.decode("latin-1")
+            codewords = "".join([self._get_codeword(symbols[i:i+b]) for i in range(0, len(symbols), b)])
+            self._symbol_cnt += len(symbols) // b
+            self._bits_written += len(codewords)
+            trailing_bits = self._write_bits(comp, trailing_bits + codewords)
+            self._update_timeline(symbols[i:i+b] for i in range(0, len(symbols), b))
+
+        comp.write(bits_to_bytes(trailing_bits))
+        dummy_bits = -len(trailing_bits) % BITS_PER_BYTE
+
+        # the escaped symbols are only known once the content is written
+        if self._escape is None:
             assert self._dummy_codeword_bits == dummy_bits
+        else:
+            self._dummy_codeword_bits = dummy_bits
+
+    def _write_blocks(self, src: BinaryIO, comp: BinaryIO):
+        # with a result cache, identical blocks coded with the same code table are looked up by their content
+        table_key = None
+        if self._result_cache is not None:
+            ans_counts = sorted(self._ans_table.counts.items()) if self._ans_table is not None else None
+            table = repr((self._streams, sorted(self.code_dict.items()), self._escape, ans_counts))
+            table_key = ResultCache.key({}, data=table.encode("utf-8"))
+
+        for block, symbols in self._read_blocks(src):
+            self._symbol_cnt += len(symbols)
+            if table_key is None:
+                self._write_block(comp, *self._code_block(block, symbols))
+                self._update_timeline(symbols)
+                continue
+
+            block_key = ResultCache.key({"table": table_key}, data=block)
+            cached = self._result_cache.get(block_key)
+            if cached is None:
+                block_type, content = self._code_block(block, symbols)
+                self._result_cache.put(block_key, bytes((block_type,)) + content)
+            else:
+                block_type, content = cached[0], cached[1:]
+                self._cached_block_cnt += 1
+
+            self._write_block(comp, block_type, content)
+            self._update_timeline(symbols)
+
+    def _code_block(self, block: bytes, symbols: List[str]) -> Tuple[int, bytes]:
+        # return the type and content of the block
+        if self._ans_table is not None and self._prefers_ans(symbols):
+            return self._code_ans_block(block, symbols)
+
+        if self._streams > 1:
+            interleaved = self._to_interleaved_block([
+                "".join([self._get_codeword(symbol) for symbol in symbols[i::self._streams]])
+                for i in range(min(self._streams, len(symbols)))
+            ])
+            return (BLOCK_STORED, block) if len(interleaved) >= len(block) else (BLOCK_INTERLEAVED, interleaved)
+
+        codewords = "".join([self._get_codeword(symbol) for symbol in symbols])
+        if self._should_store_block(len(codewords), len(block)):
+            return BLOCK_STORED, block
+
+        return BLOCK_CODED, self._to_coded_stream(codewords)
+
+    def _prefers_ans(self, symbols: List[str]) -> bool:
+        # whether the tANS table is expected to code the block in fewer bits than the huffman table
+        counts = Counter(symbols)
+        huffman_bits = sum([cnt * len(self._get_codeword(symbol)) for symbol, cnt in counts.items()])
+        ans_bits = sum([cnt * self._ans_table.cost(symbol) for symbol, cnt in counts.items()])
+        return ans_bits + (BLOCK_LEN_SIZE + STATE_SIZE) * BITS_PER_BYTE < huffman_bits
+
+    def _code_ans_block(self, block: bytes, symbols: List[str]) -> Tuple[int, bytes]:
+        state, bits = self._ans_table.encode(symbols)
+        if self._should_store_block(len(bits) + (BLOCK_LEN_SIZE + STATE_SIZE) * BITS_PER_BYTE, len(block)):
+            return BLOCK_STORED, block
+
+        return BLOCK_ANS, (
+            len(symbols).to_bytes(BLOCK_LEN_SIZE, "big") +
+            state.to_bytes(STATE_SIZE, "big") +
+            self._to_coded_stream(bits)
+        )
+
+    def _get_cache_params(self) -> Dict:
+        params = super()._get_cache_params()
+        params.update(
+            max_memory=self._max_memory,
+            sample=self._sample,
+            sample_size=self._sample_size if self._sample else None,
+            streams=self._streams,
+            ans=self._ans,
+        )
+        return params
+
+    def _get_predicted_ratio(self, estimate: Estimate) -> float:
+        return estimate.static_ratio
 
     def _get_header_size(self) -> int:
-        header_size = 2  # bits per symbol, dummy symbol bytes
-        header_size += self._bytes_per_symbol  # size of codelen_dict
-        header_size += len(self.code_dict) * 2 * self._bytes_per_symbol # code length dict
-        header_size += 1  # dummy codeword bits
+        header_size = static_header_size(self._bytes_per_symbol, len(self.code_dict) - (self._escape is not None))
+        header_size += self._get_filters_header_size()
+        if self._ans_table is not None:
+            header_size += 2  # format id, tANS table log
+            header_size += ceil(len(self._ans_table.counts) * self._ans_table.table_log / BITS_PER_BYTE)
         return header_size
 
 
@@ -189,14 +636,45 @@ if __name__ == "__main__":
         if export_path.exists():
             raise AssertionError(f"{export_path} already exists")
 
-    bytes_per_symbol = int(kwargs.get("b", 1))
+    timeline_path = kwargs.get("timeline", None)
+    if timeline_path:
+        timeline_path = Path(timeline_path)
+        if timeline_path.exists():
+            raise AssertionError(f"{timeline_path} already exists")
+
+    bytes_per_symbol = (
+        select_bytes_per_symbol(kwargs["in"], adaptive=False, max_symbols=int(kwargs.get("alphabet", DEFAULT_MAX_SYMBOLS)))
+        if kwargs.get("b") == "auto"
+        else int(kwargs.get("b", 1))
+    )
     verbose = int(kwargs.get("v", 0))
+    filters = FilterPipeline.from_spec(kwargs["filters"]) if "filters" in kwargs else None
+    min_ratio = float(kwargs["skip"]) if "skip" in kwargs else None
+    block_size = int(kwargs.get("B", 0)) * 1024
+    max_memory = int(kwargs.get("mem", 0)) * BYTES_PER_MB
+    sample = kwargs.get("sample", None)
+    sample_size = int(kwargs.get("S", DEFAULT_SAMPLE_SIZE // BYTES_PER_MB)) * BYTES_PER_MB
+    workers = int(kwargs["workers"]) if "workers" in kwargs else 1
+    streams = int(kwargs.get("streams", 1))
+    ans = bool(int(kwargs.get("ans", 0)))
+    timeline = int(kwargs.get("T", 1)) if timeline_path else 0
+    result_cache = (
+        ResultCache(kwargs["cache"], int(kwargs.get("cache_size", DEFAULT_CACHE_SIZE)) * BYTES_PER_MB)
+        if "cache" in kwargs
+        else None
+    )
 
     src = kwargs["in"]
     comp = kwargs.get("out", f"{src}.{COMP_FILE_EXTENSION}")
 
-    encoder = Encoder(bytes_per_symbol=bytes_per_symbol, verbose=verbose)
+    encoder = Encoder(
+        bytes_per_symbol=bytes_per_symbol, verbose=verbose, filters=filters, min_ratio=min_ratio,
+        block_size=block_size, max_memory=max_memory, sample=sample, sample_size=sample_size, workers=workers,
+        streams=streams, result_cache=result_cache, ans=ans, timeline=timeline,
+    )
     encoder.encode(src, comp)
 
     if export_path:
         encoder.export_results(export_path)
+    if timeline_path:
+        encoder.export_timeline(timeline_path)
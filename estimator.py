@@ -0,0 +1,233 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from functools import partial
+from math import ceil, gcd, log2
+import random
+import heapq
+import sys
+import os
+
+from utils import BITS_PER_BYTE, MAX_BYTE_PER_SYMBOL, ADAPTIVE_HEADER_SIZE, static_header_size
+
+
+DEFAULT_MAX_SYMBOLS = 2 ** 16  # alphabet size budget of automatic symbol width selection
+
+def huffman_code_bits(counts: Iterable[int]) -> int:
+    # bits of the content coded by a huffman tree built on its own counts,
+    # which add up to the weights of all internal nodes of the tree
+    heap = list(counts)
+    if len(heap) == 1:
+        return heap[0]  # a single symbol still takes a bit
+
+    heapq.heapify(heap)
+    code_bits = 0
+    while len(heap) > 1:
+        weight = heapq.heappop(heap) + heapq.heappop(heap)
+        code_bits += weight
+        heapq.heappush(heap, weight)
+
+    return code_bits
+
+
+def adaptive_code_bits(counts: Iterable[int], bits_per_symbol: int) -> float:
+    # adaptive coding costs about the entropy of the content, plus every new symbol sent raw after the NYT code
+    counts = list(counts)
+    symbol_cnt = sum(counts)
+    entropy_bits = -sum(cnt * log2(cnt / symbol_cnt) for cnt in counts)
+    return entropy_bits + _escape_bits(len(counts), bits_per_symbol)
+
+
+def _escape_bits(alphabet_size: int, bits_per_symbol: int) -> float:
+    return alphabet_size * (bits_per_symbol + log2(alphabet_size + 1))
+
+
+class Estimate(NamedTuple):
+    total_bytes: int
+    sampled_bytes: int
+    distinct_symbols: int  # in the sample
+    predicted_symbols: int  # in the entire file
+    entropy: float  # bits per symbol
+    static_size: int  # predicted size of the compressed file in bytes
+    adaptive_size: int
+
+    @property
+    def static_ratio(self) -> float:
+        return 1 - self.static_size / self.total_bytes if self.total_bytes else 0
+
+    @property
+    def adaptive_ratio(self) -> float:
+        return 1 - self.adaptive_size / self.total_bytes if self.total_bytes else 0
+
+
+class CompressibilityEstimator:
+    # predict compressed sizes from a few sampled blocks of the file, instead of a full pass
+
+    DEFAULT_BLOCK_CNT = 64
+    DEFAULT_BLOCK_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        bytes_per_symbol: int,
+        block_cnt: int = DEFAULT_BLOCK_CNT,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        seed: Optional[int] = None,
+    ):
+        assert 0 < bytes_per_symbol <= MAX_BYTE_PER_SYMBOL
+        assert block_cnt > 0 and block_size >= bytes_per_symbol
+
+        self._bytes_per_symbol: int = bytes_per_symbol
+        self._block_cnt: int = block_cnt
+        self._block_size: int = block_size - block_size % bytes_per_symbol
+        self._seed: Optional[int] = seed  # sample random blocks if given, evenly strided blocks otherwise
+
+    def estimate(self, src_file_path: str) -> Estimate:
+        total_bytes = os.path.getsize(src_file_path)
+        dist = self.sample_distribution(src_file_path)
+
+        symbol_cnt = sum(dist.values())
+        total_symbols = ceil(total_bytes / self._bytes_per_symbol)
+
+        entropy = 0
+        for cnt in dist.values():
+            p = cnt / symbol_cnt
+            entropy -= p * log2(p)
+
+        predicted_symbols = self._predict_alphabet_size(dist, total_symbols)
+
+        return Estimate(
+            total_bytes=total_bytes,
+            sampled_bytes=symbol_cnt * self._bytes_per_symbol,
+            distinct_symbols=len(dist),
+            predicted_symbols=predicted_symbols,
+            entropy=entropy,
+            static_size=self._predict_static_size(dist, predicted_symbols, total_symbols),
+            adaptive_size=self._predict_adaptive_size(predicted_symbols, entropy, total_symbols),
+        )
+
+    def sample_distribution(self, src_file_path: str) -> Dict[bytes, int]:
+        total_bytes = os.path.getsize(src_file_path)
+        dist = Counter()
+
+        with open(src_file_path, "rb") as f:
+            for offset in self._sample_offsets(total_bytes):
+                f.seek(offset)
+                self._count(f.read(self._block_size), dist)
+
+        return dist
+
+    def _sample_offsets(self, total_bytes: int) -> List[int]:
+        if total_bytes <= self._block_cnt * self._block_size:
+            return list(range(0, total_bytes, self._block_size))
+
+        # block aligned, so that no symbol crosses the boundary of a block
+        blocks = total_bytes // self._block_size
+        if self._seed is None:
+            stride = blocks / self._block_cnt
+            return [int(i * stride) * self._block_size for i in range(self._block_cnt)]
+
+        rand = random.Random(self._seed)
+        return sorted(i * self._block_size for i in rand.sample(range(blocks), self._block_cnt))
+
+    def _count(self, block: bytes, dist: Counter):
+        b = self._bytes_per_symbol
+        if b == 1:
+            dist.update(block)
+        else:
+            # the trailing symbol is padded like the encoders do
+            if len(block) % b:
+                block += bytes(b - len(block) % b)
+            dist.update(block[i:i+b] for i in range(0, len(block), b))
+
+    def _predict_alphabet_size(self, dist: Dict[bytes, int], total_symbols: int) -> int:
+        # symbols seen once in the sample keep showing up at the same rate in the rest of the file
+        symbol_cnt = sum(dist.values())
+        if symbol_cnt == 0 or symbol_cnt >= total_symbols:
+            return len(dist)
+
+        singletons = sum(1 for cnt in dist.values() if cnt == 1)
+        unseen = singletons * (total_symbols / symbol_cnt - 1)
+        return min(
+            len(dist) + ceil(unseen),
+            total_symbols,
+            2 ** (self._bytes_per_symbol * BITS_PER_BYTE),
+        )
+
+    def _predict_static_size(self, dist: Dict[bytes, int], alphabet_size: int, total_symbols: int) -> int:
+        # header + huffman coded content
+        header_size = static_header_size(self._bytes_per_symbol, alphabet_size) + 1  # an empty filter chain
+
+        symbol_cnt = sum(dist.values())
+        avg_code_len = huffman_code_bits(dist.values()) / symbol_cnt if symbol_cnt else 0
+        return header_size + ceil(total_symbols * avg_code_len / BITS_PER_BYTE)
+
+    def _predict_adaptive_size(self, alphabet_size: int, entropy: float, total_symbols: int) -> int:
+        # adaptive coding costs about the entropy, plus every new symbol sent raw after the NYT code
+        header_size = ADAPTIVE_HEADER_SIZE + 1  # an empty filter chain
+        escape_bits = _escape_bits(alphabet_size, self._bytes_per_symbol * BITS_PER_BYTE)
+        return header_size + ceil((total_symbols * entropy + escape_bits) / BITS_PER_BYTE)
+
+
+def _estimate_width(src_file_path: str, block_cnt: int, block_size: int, bytes_per_symbol: int) -> Estimate:
+    return CompressibilityEstimator(bytes_per_symbol, block_cnt, block_size).estimate(src_file_path)
+
+
+def select_bytes_per_symbol(
+    src_file_path: str,
+    adaptive: bool = False,
+    max_symbols: int = DEFAULT_MAX_SYMBOLS,
+    candidates: Iterable[int] = range(1, MAX_BYTE_PER_SYMBOL + 1),
+    block_cnt: int = CompressibilityEstimator.DEFAULT_BLOCK_CNT,
+    block_size: int = CompressibilityEstimator.DEFAULT_BLOCK_SIZE,
+    workers: Optional[int] = None,
+) -> int:
+    # the width with the best predicted ratio, among those whose alphabet fits in `max_symbols`
+    # the alphabet size bounds the memory of the coders (tree nodes, code book, header)
+    candidates = sorted(candidates)
+    assert candidates and 0 < candidates[0] and candidates[-1] <= MAX_BYTE_PER_SYMBOL
+
+    # the block size must be a multiple of every candidate, so that all trials see the same bytes
+    block_size = max(block_size // _lcm(candidates), 1) * _lcm(candidates)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        estimates = list(executor.map(partial(_estimate_width, src_file_path, block_cnt, block_size), candidates))
+
+    best, best_ratio = candidates[0], None
+    for b, estimate in zip(candidates, estimates):
+        if estimate.predicted_symbols > max_symbols and b != candidates[0]:
+            continue
+
+        ratio = estimate.adaptive_ratio if adaptive else estimate.static_ratio
+        if best_ratio is None or ratio > best_ratio:
+            best, best_ratio = b, ratio
+
+    return best
+
+
+def _lcm(nums: List[int]) -> int:
+    lcm = 1
+    for n in nums:
+        lcm = lcm * n // gcd(lcm, n)
+    return lcm
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    block_cnt = int(kwargs.get("blocks", CompressibilityEstimator.DEFAULT_BLOCK_CNT))
+    block_size = int(kwargs.get("block_size", CompressibilityEstimator.DEFAULT_BLOCK_SIZE))
+    seed = int(kwargs["seed"]) if "seed" in kwargs else None
+
+    if kwargs.get("b") == "auto":
+        max_symbols = int(kwargs.get("alphabet", DEFAULT_MAX_SYMBOLS))
+        bytes_per_symbol = select_bytes_per_symbol(kwargs["in"], max_symbols=max_symbols, block_cnt=block_cnt, block_size=block_size)
+        print(f"selected bytes per symbol: {bytes_per_symbol}")
+    else:
+        bytes_per_symbol = int(kwargs.get("b", 1))
+
+    estimate = CompressibilityEstimator(bytes_per_symbol, block_cnt, block_size, seed).estimate(kwargs["in"])
+    print(f"sampled bytes: {estimate.sampled_bytes} / {estimate.total_bytes}")
+    print(f"distinct symbols: {estimate.distinct_symbols} sampled, {estimate.predicted_symbols} predicted")
+    print(f"entropy: {estimate.entropy}")
+    print(f"static: {estimate.static_size} bytes, ratio {estimate.static_ratio}")
+    print(f"adaptive: {estimate.adaptive_size} bytes, ratio {estimate.adaptive_ratio}")
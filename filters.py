@@ -0,0 +1,237 @@
+from typing import Dict, List, Type
+from math import lcm
+import re
+
+from utils import BITS_PER_BYTE, BUFFER_SIZE, BYTES_PER_MB
+
+
+# filters are applied on independent blocks, so that a file never has to fit in memory
+# rounded down to a multiple of the widths of a pipeline, so that no element is split across blocks
+FILTER_BLOCK_SIZE = BYTES_PER_MB
+BLOCK_LEN_BYTES = 4  # each filtered block is prefixed by its length
+
+
+def _byte_mask(n: int, byte: int) -> int:
+    # an integer whose n bytes all equal to `byte`
+    return int.from_bytes(bytes((byte,)) * n, "little")
+
+
+def _swar_sub(x: int, y: int, n: int) -> int:
+    # byte-wise (x - y) % 256 of two n-byte integers, without borrows crossing bytes
+    high = _byte_mask(n, 0x80)
+    low = _byte_mask(n, 0x7F)
+    full = _byte_mask(n, 0xFF)
+    return ((x | high) - (y & low)) ^ ((x ^ y ^ full) & high)
+
+
+def _swar_add(x: int, y: int, n: int) -> int:
+    # byte-wise (x + y) % 256 of two n-byte integers, without carries crossing bytes
+    high = _byte_mask(n, 0x80)
+    low = _byte_mask(n, 0x7F)
+    return ((x & low) + (y & low)) ^ ((x ^ y) & high)
+
+
+class BaseFilter:
+    FILTER_ID: int = None
+    NAME: str = None
+
+    def __init__(self, width: int = 1):
+        assert 0 < width < 2 ** BITS_PER_BYTE
+        self._width: int = width
+
+    def __str__(self):
+        return f"{self.NAME}:{self._width}"
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    def encode(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class ShuffleFilter(BaseFilter):
+    # gather the i-th byte of every element into the i-th byte plane
+    FILTER_ID = 1
+    NAME = "shuffle"
+
+    def encode(self, data: bytes) -> bytes:
+        n = len(data) - len(data) % self._width  # the incomplete tail element is left as is
+        planes = [data[i:n:self._width] for i in range(self._width)]
+        return b"".join(planes) + data[n:]
+
+    def decode(self, data: bytes) -> bytes:
+        n = len(data) - len(data) % self._width
+        plane_size = n // self._width
+
+        output = bytearray(data)
+        for i in range(self._width):
+            output[i:n:self._width] = data[i*plane_size:(i+1)*plane_size]
+
+        return bytes(output)
+
+
+class DeltaFilter(BaseFilter):
+    # byte-wise difference from the corresponding byte of the previous element
+    FILTER_ID = 2
+    NAME = "delta"
+
+    def encode(self, data: bytes) -> bytes:
+        n = len(data)
+        x = int.from_bytes(data, "little")
+        prev = (x << (self._width * BITS_PER_BYTE)) & _byte_mask(n, 0xFF)
+        return _swar_sub(x, prev, n).to_bytes(n, "little")
+
+    def decode(self, data: bytes) -> bytes:
+        # prefix sums by doubling: log2(n / width) passes over the whole block
+        n = len(data)
+        x = int.from_bytes(data, "little")
+        full = _byte_mask(n, 0xFF)
+
+        shift = self._width
+        while shift < n:
+            x = _swar_add(x, (x << (shift * BITS_PER_BYTE)) & full, n)
+            shift *= 2
+
+        return x.to_bytes(n, "little")
+
+
+class XorFilter(BaseFilter):
+    # xor with the previous element
+    FILTER_ID = 3
+    NAME = "xor"
+
+    def encode(self, data: bytes) -> bytes:
+        n = len(data)
+        x = int.from_bytes(data, "little")
+        prev = (x << (self._width * BITS_PER_BYTE)) & _byte_mask(n, 0xFF)
+        return (x ^ prev).to_bytes(n, "little")
+
+    def decode(self, data: bytes) -> bytes:
+        n = len(data)
+        x = int.from_bytes(data, "little")
+        full = _byte_mask(n, 0xFF)
+
+        shift = self._width
+        while shift < n:
+            x ^= (x << (shift * BITS_PER_BYTE)) & full
+            shift *= 2
+
+        return x.to_bytes(n, "little")
+
+
+class ZeroRunLengthFilter(BaseFilter):
+    # a run of zeros is replaced by a single zero followed by the length of the run (1 ~ 255)
+    # width is not used
+    FILTER_ID = 4
+    NAME = "rle"
+
+    MAX_RUN = 2 ** BITS_PER_BYTE - 1
+
+    _ENCODE_PATTERN = re.compile(b"\x00{1,%d}" % MAX_RUN)
+    _DECODE_PATTERN = re.compile(b"\x00(.)", re.DOTALL)
+
+    def __str__(self):
+        return self.NAME
+
+    def encode(self, data: bytes) -> bytes:
+        return self._ENCODE_PATTERN.sub(lambda m: bytes((0, len(m.group()))), data)
+
+    def decode(self, data: bytes) -> bytes:
+        return self._DECODE_PATTERN.sub(lambda m: bytes(m.group(1)[0]), data)
+
+
+FILTER_TYPES: Dict[int, Type[BaseFilter]] = {
+    f.FILTER_ID: f for f in (ShuffleFilter, DeltaFilter, XorFilter, ZeroRunLengthFilter)
+}
+
+
+class FilterPipeline:
+    def __init__(self, filters: List[BaseFilter]):
+        assert len(filters) < 2 ** BITS_PER_BYTE
+        self._filters: List[BaseFilter] = filters
+
+    def __str__(self):
+        return ",".join(str(f) for f in self._filters)
+
+    def __len__(self):
+        return len(self._filters)
+
+    @classmethod
+    def from_spec(cls, spec: str):
+        # e.g. "shuffle:4,delta:1,rle"
+        name_to_type = {f.NAME: f for f in FILTER_TYPES.values()}
+        filters = []
+
+        for item in spec.split(","):
+            name, _, width = item.partition(":")
+            filters.append(name_to_type[name](int(width) if width else 1))
+
+        return cls(filters)
+
+    @classmethod
+    def from_header(cls, header: str):
+        assert len(header) % 2 == 0
+        return cls([
+            FILTER_TYPES[ord(header[i])](ord(header[i+1]))
+            for i in range(0, len(header), 2)
+        ])
+
+    @property
+    def header(self) -> str:
+        """
+            {filter id}{width}{filter id}{width}...
+                filter id: 1 byte
+                width: 1 byte
+        """
+
+        return "".join(f"{chr(f.FILTER_ID)}{chr(f.width)}" for f in self._filters)
+
+    def encode(self, data: bytes) -> bytes:
+        for f in self._filters:
+            data = f.encode(data)
+        return data
+
+    def decode(self, data: bytes) -> bytes:
+        for f in reversed(self._filters):
+            data = f.decode(data)
+        return data
+
+    @property
+    def block_size(self) -> int:
+        # the decoder reads the length of every block, so the block size is not in the header
+        width = lcm(*(f.width for f in self._filters))
+        assert width <= FILTER_BLOCK_SIZE, f"the widths of {self} have no common multiple within a filter block"
+        return FILTER_BLOCK_SIZE - FILTER_BLOCK_SIZE % width
+
+    def encode_file(self, src_file_path: str, dst_file_path: str) -> int:
+        # return size of the source file
+        total_bytes = 0
+        block_size = self.block_size
+
+        with open(src_file_path, "rb", BUFFER_SIZE) as src, open(dst_file_path, "wb", BUFFER_SIZE) as dst:
+            while True:
+                block = src.read(block_size)
+                if len(block) == 0:
+                    break
+
+                total_bytes += len(block)
+                filtered = self.encode(block)
+                dst.write(len(filtered).to_bytes(BLOCK_LEN_BYTES, "big"))
+                dst.write(filtered)
+
+        return total_bytes
+
+    def decode_file(self, src_file_path: str, dst_file_path: str):
+        with open(src_file_path, "rb", BUFFER_SIZE) as src, open(dst_file_path, "wb", BUFFER_SIZE) as dst:
+            while True:
+                block_len = src.read(BLOCK_LEN_BYTES)
+                if len(block_len) == 0:
+                    break
+
+                assert len(block_len) == BLOCK_LEN_BYTES
+                block = src.read(int.from_bytes(block_len, "big"))
+                dst.write(self.decode(block))
@@ -0,0 +1,190 @@
+from typing import Dict, List, Optional, Tuple
+
+
+ESCAPE = 0  # index of the escape, coded before the raw bytes of a symbol new to the model
+MAX_TOTAL = 2 ** 16  # counts are halved once their total reaches it, to bound the precision the range coder needs
+# the least frequent half of the symbols is evicted once the alphabet reaches it,
+# so that halving the counts (floored at 1) always brings the total back below MAX_TOTAL
+MAX_SYMBOLS = MAX_TOTAL // 4
+
+
+class FenwickTree:
+    # counts of a growing alphabet, with O(log n) updates, cumulative counts and lookups by cumulative count
+
+    def __init__(self):
+        self._counts: List[int] = []
+        self._capacity: int = 1  # a power of 2
+        self._tree: List[int] = [0] * (self._capacity + 1)  # 1-based, node i sums the counts (i - (i & -i), i]
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    @property
+    def counts(self) -> List[int]:
+        return self._counts
+
+    def append(self, count: int):
+        if len(self._counts) == self._capacity:
+            self._capacity *= 2
+            self._counts.append(count)
+            self._rebuild()
+        else:
+            self._counts.append(0)
+            self.add(len(self._counts) - 1, count)
+
+    def add(self, index: int, delta: int):
+        self._counts[index] += delta
+
+        tree = self._tree
+        i = index + 1
+        while i <= self._capacity:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, index: int) -> int:
+        # sum of the counts before `index`
+        tree = self._tree
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, value: int) -> Tuple[int, int]:
+        # return the index whose cumulative range [start, start + count) holds `value`, and its start
+        tree = self._tree
+        pos = 0
+        start = 0
+        step = self._capacity
+        while step > 0:
+            nxt = pos + step
+            if nxt <= self._capacity and start + tree[nxt] <= value:
+                pos = nxt
+                start += tree[nxt]
+            step >>= 1
+        return pos, start
+
+    def reset(self, counts: List[int]):
+        self._counts = counts
+        self._capacity = 1
+        while self._capacity < len(counts):
+            self._capacity *= 2
+        self._rebuild()
+
+    def scale(self, factor: int):
+        # divide every count by `factor`, a count never drops below 1
+        self._counts = [max(1, count // factor) for count in self._counts]
+        self._rebuild()
+
+    def _rebuild(self):
+        tree = [0] + self._counts + [0] * (self._capacity - len(self._counts))
+        for i in range(1, self._capacity + 1):
+            parent = i + (i & -i)
+            if parent <= self._capacity:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+
+class FrequencyModel:
+    # adaptive counts of the symbols seen so far (by index, in order of appearance) and of the escape,
+    # divided by `shrink_factor` every `shrink_period` symbols as the adaptive tree is shrunk
+    # at most MAX_SYMBOLS symbols are kept, an evicted symbol is escaped again when next coded
+    # encoder and decoder must update the model identically
+
+    def __init__(self, shrink_period: int = 0, shrink_factor: int = 2):
+        assert shrink_period >= 0 and shrink_factor > 1
+        self._shrink_period: int = shrink_period  # in symbols, 0 for never shrink periodically
+        self._shrink_factor: int = shrink_factor
+
+        self._counts: FenwickTree = FenwickTree()
+        self._counts.append(1)  # escape
+        self._total: int = 1
+        self._symbols: List[Optional[str]] = [None]  # by index, the escape has none
+        self._indices: Dict[str, int] = {}  # {symbol: index}
+
+        self._symbol_cnt: int = 0
+        self._shrink_cnt: int = 0  # periodic shrinks
+        self._rescale_cnt: int = 0  # halvings to stay below MAX_TOTAL
+        self._evict_cnt: int = 0  # evictions to stay below MAX_SYMBOLS
+
+    def __len__(self) -> int:
+        # number of symbols, the escape excluded
+        return len(self._counts) - 1
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    @property
+    def shrink_cnt(self) -> int:
+        return self._shrink_cnt
+
+    @property
+    def rescale_cnt(self) -> int:
+        return self._rescale_cnt
+
+    @property
+    def evict_cnt(self) -> int:
+        return self._evict_cnt
+
+    def index_of(self, symbol: str) -> Optional[int]:
+        # None for a symbol new to the model
+        return self._indices.get(symbol)
+
+    def symbol_of(self, index: int) -> str:
+        return self._symbols[index]
+
+    def range_of(self, index: int) -> Tuple[int, int]:
+        # return (start, count) of an index, in a total of `total`
+        return self._counts.prefix_sum(index), self._counts.counts[index]
+
+    def find(self, value: int) -> Tuple[int, int, int]:
+        # return (index, start, count) of the index whose range holds `value`
+        index, start = self._counts.find(value)
+        return index, start, self._counts.counts[index]
+
+    def add_symbol(self, symbol: str) -> int:
+        # return the index of a new symbol, once its raw bytes are coded after the escape
+        if len(self) == MAX_SYMBOLS:
+            self._evict()
+
+        self._indices[symbol] = len(self._symbols)
+        self._symbols.append(symbol)
+        self._counts.append(1)
+        self._total += 1
+        self._on_update(True)
+        return self._indices[symbol]
+
+    def update(self, index: int):
+        # once a symbol or the escape is coded
+        self._counts.add(index, 1)
+        self._total += 1
+        self._on_update(index != ESCAPE)
+
+    def _on_update(self, is_symbol: bool):
+        if is_symbol:
+            self._symbol_cnt += 1
+            if self._shrink_period > 0 and self._symbol_cnt % self._shrink_period == 0:
+                self._shrink_cnt += 1
+                self._scale(self._shrink_factor)
+
+        if self._total >= MAX_TOTAL:
+            self._rescale_cnt += 1
+            self._scale(2)
+            assert self._total < MAX_TOTAL
+
+    def _evict(self):
+        # keep the most frequent half of the symbols in their order, ties broken by index
+        counts = self._counts.counts
+        kept = sorted(range(ESCAPE + 1, len(counts)), key=lambda index: -counts[index])[:MAX_SYMBOLS // 2]
+        kept.sort()
+
+        self._symbols = [None] + [self._symbols[index] for index in kept]
+        self._indices = {symbol: index for index, symbol in enumerate(self._symbols) if index != ESCAPE}
+        self._counts.reset([counts[ESCAPE]] + [counts[index] for index in kept])
+        self._total = self._counts.prefix_sum(len(self._counts))
+        self._evict_cnt += 1
+
+    def _scale(self, factor: int):
+        self._counts.scale(factor)
+        self._total = self._counts.prefix_sum(len(self._counts))
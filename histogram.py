@@ -0,0 +1,47 @@
+from typing import Dict, Mapping
+import heapq
+
+
+SYMBOL_MEMORY = 256  # rough bytes held per distinct symbol by the histogram, the huffman tree and the code book
+
+
+def escape_symbol(bytes_per_symbol: int) -> str:
+    # a key no symbol can take, for the code which escapes to a raw symbol
+    return chr(0) * (bytes_per_symbol + 1)
+
+
+class HeavyHitters:
+    # misra-gries summary with at most `capacity` counters
+    # every symbol occurring more than total / (capacity+1) times is kept,
+    # its count is underestimated by at most the total amount decremented
+
+    def __init__(self, capacity: int):
+        assert capacity > 0
+
+        self._capacity: int = capacity
+        self._counts: Dict[str, int] = {}
+        self._total: int = 0
+        self._decremented: int = 0
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return self._counts
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    @property
+    def is_exact(self) -> bool:
+        return self._decremented == 0
+
+    def update(self, counts: Mapping[str, int]):
+        # merge the exact counts of a block of symbols
+        for symbol, cnt in counts.items():
+            self._counts[symbol] = self._counts.get(symbol, 0) + cnt
+            self._total += cnt
+
+        if len(self._counts) > self._capacity:
+            threshold = heapq.nlargest(self._capacity + 1, self._counts.values())[-1]
+            self._decremented += threshold
+            self._counts = {symbol: cnt - threshold for symbol, cnt in self._counts.items() if cnt > threshold}
@@ -1,5 +1,55 @@
 from typing import Dict, List, Optional
-import heapq
+
+
+def huffman_code_lengths(symbol_distribution: Dict[str, int]) -> Dict[str, int]:
+    # sort the counts once, then compute the code lengths in place (moffat-katajainen), without any node
+    symbols = sorted(symbol_distribution, key=symbol_distribution.__getitem__)
+    n = len(symbols)
+    if n == 1:
+        return {symbols[0]: 1}
+
+    a = [symbol_distribution[symbol] for symbol in symbols]
+
+    # weights of the internal nodes, two queues: leaves from `leaf`, internal nodes from `root`
+    # a[i] becomes the index of the parent of internal node i
+    a[0] += a[1]
+    root, leaf = 0, 2
+    for nxt in range(1, n-1):
+        if leaf >= n or a[root] < a[leaf]:
+            a[nxt] = a[root]
+            a[root] = nxt
+            root += 1
+        else:
+            a[nxt] = a[leaf]
+            leaf += 1
+
+        if leaf >= n or (root < nxt and a[root] < a[leaf]):
+            a[nxt] += a[root]
+            a[root] = nxt
+            root += 1
+        else:
+            a[nxt] += a[leaf]
+            leaf += 1
+
+    # depths of the internal nodes
+    a[n-2] = 0
+    for nxt in range(n-3, -1, -1):
+        a[nxt] = a[a[nxt]] + 1
+
+    # depths of the leaves, from the nodes available at each depth
+    avail, used, depth = 1, 0, 0
+    root, nxt = n-2, n-1
+    while avail > 0:
+        while root >= 0 and a[root] == depth:
+            used += 1
+            root -= 1
+        while avail > used:
+            a[nxt] = depth
+            nxt -= 1
+            avail -= 1
+        avail, used, depth = 2 * used, 0, depth + 1
+
+    return dict(zip(symbols, a))
 
 
 class BaseNode:
@@ -36,26 +86,6 @@ class BaseNode:
         raise NotImplementedError()
 
 
-class FreqNode(BaseNode):
-    def __init__(self, freq: int, symbol: str="", left: Optional[BaseNode]=None, right: Optional[BaseNode]=None):
-        super().__init__(symbol, left, right)
-        self._freq: int = freq
-
-    def __str__(self):
-        return f"freq={self._freq}||symbol={self._symbol}"
-
-    def __lt__(self, node):
-        return (
-            self._symbol < node.symbol
-            if self._freq == node.freq
-            else self._freq < node.freq 
-        )
-
-    @property
-    def freq(self):
-        return self._freq
-
-
 class CodeLenNode(BaseNode):
     def __init__(self, code_len: int=0, symbol: str=""):
         super().__init__(symbol, None, None)
@@ -97,9 +127,7 @@ class HuffmanTree:
         self._cur: BaseNode  # for decoding only
 
         if "symbol_distribution" in kwargs:
-            self._build_by_distribution(kwargs["symbol_distribution"])
-
-            self._set_code_len_dict(self._root, 0)
+            self._code_len_dict = huffman_code_lengths(kwargs["symbol_distribution"])
             self._build_by_code_len()
             self._set_code_dict(self._root, "")
 
@@ -118,6 +146,10 @@ class HuffmanTree:
     def code_dict(self):
         return self._code_dict
 
+    def reset(self):
+        # to reuse the tree for another stream
+        self._cur = self._root
+
     def decode(self, bit: str) -> Optional[str]:
         assert bit == "0" or bit == "1"
         self._cur = (
@@ -134,34 +166,12 @@ class HuffmanTree:
 
         return symbol
 
-    def _build_by_distribution(self, symbol_distribution: Dict[str, int]):
-        nodes = [
-            FreqNode(freq=count, symbol=symbol) 
-            for symbol, count in symbol_distribution.items()
-        ]
-
-        heapq.heapify(nodes)
-        while len(nodes) > 1:
-            n1 = heapq.heappop(nodes)
-            n2 = heapq.heappop(nodes)
-
-            parent = FreqNode(
-                freq=n1.freq+n2.freq,
-                left=n1,
-                right=n2,
-            )
-
-            heapq.heappush(nodes, parent)
-
-        self._root = nodes.pop()
-        self._cur = self._root
-
     def _build_by_code_len(self):
         symbol_nodes = [
             CodeLenNode(code_len=code_len, symbol=symbol)
             for symbol, code_len in self._code_len_dict.items()
         ]
-        symbol_nodes.sort() # sort in descending order by code_len
+        symbol_nodes.sort(key=lambda node: (node.code_len, node.symbol), reverse=True)  # same order as CodeLenNode.__lt__
         max_code_len = symbol_nodes[0].code_len
 
         self._root = CodeLenNode()
@@ -199,13 +209,6 @@ class HuffmanTree:
 
         assert len(symbol_nodes) == 0
 
-    def _set_code_len_dict(self, node: BaseNode, l: int):
-        if node.is_symbol:
-            self._code_len_dict[node.symbol] = l
-        else:
-            self._set_code_len_dict(node.left, l+1)
-            self._set_code_len_dict(node.right, l+1)
-
     def _set_code_dict(self, node: BaseNode, code: str):
         if node.is_symbol:
             self._code_dict[node.symbol] = code
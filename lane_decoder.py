@@ -0,0 +1,112 @@
+from typing import BinaryIO, List
+from pathlib import Path
+import tempfile
+import sys
+
+from base_coder import BaseDecoder
+from utils import (
+    BUFFER_SIZE,
+    DECOMP_FILE_EXTENSION,
+    LANE_FORMAT_ID,
+    extended_ord,
+)
+from bit_io_stream import BitInStream, IO_MODE_BYTE
+from decoder import Decoder
+from adaptive_decoder import AdaptiveDecoder
+from lane_encoder import LANE_CODER_STATIC, LANE_CODER_ADAPTIVE, TOTAL_BYTES_SIZE
+from parts import code_parts, read_part_entry, extract_part
+
+
+def _decode_lane(src_file_path: str, offset: int, size: int, comp_file_path: str, lane_file_path: str, coder: int):
+    extract_part(src_file_path, offset, size, comp_file_path)
+    if coder == LANE_CODER_STATIC:
+        Decoder().decode(comp_file_path, lane_file_path)
+    else:
+        assert coder == LANE_CODER_ADAPTIVE
+        AdaptiveDecoder().decode(comp_file_path, lane_file_path)
+
+
+class LaneDecoder(BaseDecoder):
+    def __init__(self, verbose: int = 0, workers: int = None):
+        super().__init__(verbose)
+
+        self._workers: int = workers
+
+        self._lane_cnt: int
+        self._total_bytes: int
+        self._lane_coders: List[int] = []
+        self._lane_offsets: List[int] = []
+        self._lane_sizes: List[int] = []
+
+    def decode(self, src_file_path: str, decomp_file_path: str):
+        with open(src_file_path, "rb", BUFFER_SIZE) as src:
+            self._parse_header(src)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            comp_lane_file_paths = [str(Path(tmp_dir) / f"lane{i}") for i in range(self._lane_cnt)]
+            lane_file_paths = [f"{p}.{DECOMP_FILE_EXTENSION}" for p in comp_lane_file_paths]
+
+            code_parts(_decode_lane, [
+                (src_file_path, offset, size, comp, lane, coder)
+                for offset, size, comp, lane, coder in zip(
+                    self._lane_offsets, self._lane_sizes, comp_lane_file_paths, lane_file_paths, self._lane_coders,
+                )
+            ], self._workers)
+
+            self._merge_lanes(lane_file_paths, decomp_file_path)
+
+    def _parse_header(self, file_obj: BinaryIO):
+        """
+            format id: 1 byte
+            lane count: 1 byte
+            total bytes: 8 bytes
+            lane table: {coder}{offset}{size}{coder}{offset}{size}...
+                coder: 1 byte
+                offset of the compressed lane from the beginning of the file: 8 bytes
+                size of the compressed lane: 8 bytes
+            compressed lanes: a complete static / adaptive compressed file per lane
+        """
+
+        stream = BitInStream(file_obj, mode=IO_MODE_BYTE)
+        assert ord(stream.read(1)) == LANE_FORMAT_ID
+
+        self._lane_cnt = ord(stream.read(1))
+        self._total_bytes = extended_ord(stream.read(TOTAL_BYTES_SIZE))
+
+        for _ in range(self._lane_cnt):
+            self._lane_coders.append(ord(stream.read(1)))
+            offset, size = read_part_entry(stream)
+            self._lane_offsets.append(offset)
+            self._lane_sizes.append(size)
+
+    def _merge_lanes(self, lane_file_paths: List[str], decomp_file_path: str):
+        block_size = BUFFER_SIZE - BUFFER_SIZE % self._lane_cnt  # each block holds whole elements
+        remaining = self._total_bytes
+
+        lanes = [open(p, "rb", BUFFER_SIZE) for p in lane_file_paths]
+        try:
+            with open(decomp_file_path, "wb", BUFFER_SIZE) as decomp:
+                while remaining > 0:
+                    block = bytearray(min(block_size, remaining))
+
+                    for i, lane in enumerate(lanes):
+                        lane_bytes = lane.read(len(range(i, len(block), self._lane_cnt)))
+                        block[i::self._lane_cnt] = lane_bytes
+
+                    decomp.write(block)
+                    remaining -= len(block)
+        finally:
+            for lane in lanes:
+                lane.close()
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    verbose = int(kwargs.get("v", 0))
+    workers = int(kwargs["workers"]) if "workers" in kwargs else None
+    decoder = LaneDecoder(verbose, workers)
+
+    src = kwargs["in"]
+    decomp = kwargs.get("out", f"{src}.{DECOMP_FILE_EXTENSION}")
+    decoder.decode(src, decomp)
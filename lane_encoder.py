@@ -0,0 +1,182 @@
+from typing import List
+from pathlib import Path
+import tempfile
+import sys
+import os
+
+from base_coder import BaseEncoder
+from utils import (
+    BITS_PER_BYTE,
+    BUFFER_SIZE,
+    COMP_FILE_EXTENSION,
+    LANE_FORMAT_ID,
+    extended_chr,
+)
+from bit_io_stream import BitOutStream, IO_MODE_BYTE
+from parts import PART_OFFSET_SIZE, code_parts, part_offsets, write_part_entry, concat_parts
+from encoder import Encoder
+from adaptive_encoder import AdaptiveEncoder
+
+
+LANE_CODER_STATIC = 0
+LANE_CODER_ADAPTIVE = 1
+LANE_CODERS = {"static": LANE_CODER_STATIC, "adaptive": LANE_CODER_ADAPTIVE}
+
+TOTAL_BYTES_SIZE = 8  # bytes used to store the size of the source file
+
+
+def _encode_lane(lane_file_path: str, comp_file_path: str, coder: int, chunk_size: int, shrink_factor: int) -> int:
+    # return the coder actually used
+    if coder == LANE_CODER_STATIC:
+        try:
+            Encoder(bytes_per_symbol=1).encode(lane_file_path, comp_file_path)
+            return LANE_CODER_STATIC
+        except NotImplementedError:
+            # the static encoder needs at least 2 distinct symbols
+            pass
+
+    AdaptiveEncoder(1, chunk_size=chunk_size, shrink_factor=shrink_factor).encode(lane_file_path, comp_file_path)
+    return LANE_CODER_ADAPTIVE
+
+
+class LaneEncoder(BaseEncoder):
+    # each byte position within a `lane_cnt`-byte element is coded as an independent stream
+
+    def __init__(
+        self,
+        lane_cnt: int,
+        coder: int = LANE_CODER_STATIC,
+        verbose: int = 0,
+        chunk_size: int = 0,
+        shrink_factor: int = 2,
+        workers: int = None,
+        timeline: int = 0,
+    ):
+        super().__init__(1, verbose, timeline=timeline)
+
+        assert 0 < lane_cnt < 2 ** BITS_PER_BYTE
+        assert coder in LANE_CODERS.values()
+        self._lane_cnt: int = lane_cnt
+        self._coder: int = coder
+        self._chunk_size: int = chunk_size
+        self._shrink_factor: int = shrink_factor
+        self._workers: int = workers
+
+        self._lane_coders: List[int] = []
+        self._lane_sizes: List[int] = []  # size of each compressed lane
+
+    def encode(self, src_file_path: str, comp_file_path: str):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            lane_file_paths = [str(Path(tmp_dir) / f"lane{i}") for i in range(self._lane_cnt)]
+            comp_lane_file_paths = [f"{p}.{COMP_FILE_EXTENSION}" for p in lane_file_paths]
+
+            self._split_lanes(src_file_path, lane_file_paths)
+
+            self._start_timeline()
+            self._lane_coders = code_parts(_encode_lane, [
+                (lane, comp, self._coder, self._chunk_size, self._shrink_factor)
+                for lane, comp in zip(lane_file_paths, comp_lane_file_paths)
+            ], self._workers, on_part=lambda i: self._on_lane_coded(lane_file_paths[i], comp_lane_file_paths[i]))
+
+            self._lane_sizes = [os.path.getsize(p) for p in comp_lane_file_paths]
+
+            self._write_header(comp_file_path)
+            concat_parts(comp_lane_file_paths, comp_file_path, "ab")
+
+    def export_results(self, export_path: Path):
+        with open(export_path, "w") as f:
+            f.write(f"{'='*10} params {'='*10}\n")
+            f.write(f"lanes: {self._lane_cnt}\n")
+            f.write(f"coder: {self._coder}\n")
+
+            f.write(f"\n{'='*10} statistics {'='*10}\n")
+            f.write(f"total bytes: {self._src_bytes}\n")
+            f.write(f"lane coders: {self._lane_coders}\n")
+            f.write(f"lane sizes: {self._lane_sizes}\n")
+            f.write(f"compression ratio: {self.compression_ratio}\n")
+
+    def _split_lanes(self, src_file_path: str, lane_file_paths: List[str]):
+        block_size = BUFFER_SIZE - BUFFER_SIZE % self._lane_cnt  # each block holds whole elements
+        self._src_bytes = 0
+
+        lanes = [open(p, "wb", BUFFER_SIZE) for p in lane_file_paths]
+        try:
+            with open(src_file_path, "rb", BUFFER_SIZE) as src:
+                while True:
+                    block = src.read(block_size)
+                    if len(block) == 0:
+                        break
+
+                    self._src_bytes += len(block)
+                    for i, lane in enumerate(lanes):
+                        lane.write(block[i::self._lane_cnt])
+        finally:
+            for lane in lanes:
+                lane.close()
+
+    def _on_lane_coded(self, lane_file_path: str, comp_lane_file_path: str):
+        with open(lane_file_path, "rb", BUFFER_SIZE) as lane:
+            self._update_timeline_with_part(
+                lane, os.path.getsize(lane_file_path), os.path.getsize(comp_lane_file_path) * BITS_PER_BYTE,
+            )
+
+    def _write_header(self, comp_file_path: str):
+        """
+            format id: 1 byte
+            lane count: 1 byte
+            total bytes: 8 bytes
+            lane table: {coder}{offset}{size}{coder}{offset}{size}...
+                coder: 1 byte
+                offset of the compressed lane from the beginning of the file: 8 bytes
+                size of the compressed lane: 8 bytes
+            compressed lanes: a complete static / adaptive compressed file per lane
+        """
+
+        with open(comp_file_path, "wb") as f:
+            stream = BitOutStream(f, mode=IO_MODE_BYTE)
+            stream.write(chr(LANE_FORMAT_ID))
+            stream.write(chr(self._lane_cnt))
+            stream.write(extended_chr(self._src_bytes, TOTAL_BYTES_SIZE * BITS_PER_BYTE))
+
+            offsets = part_offsets(self._get_header_size(), self._lane_sizes)
+            for coder, offset, size in zip(self._lane_coders, offsets, self._lane_sizes):
+                stream.write(chr(coder))
+                write_part_entry(stream, offset, size)
+
+    def _get_header_size(self) -> int:
+        return 2 + TOTAL_BYTES_SIZE + self._lane_cnt * (1 + 2 * PART_OFFSET_SIZE)
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    export_path = kwargs.get("export", None)
+    if export_path:
+        export_path = Path(export_path)
+        if export_path.exists():
+            raise AssertionError(f"{export_path} already exists")
+
+    timeline_path = kwargs.get("timeline", None)
+    if timeline_path:
+        timeline_path = Path(timeline_path)
+        if timeline_path.exists():
+            raise AssertionError(f"{timeline_path} already exists")
+
+    lane_cnt = int(kwargs.get("W", 4))
+    coder = LANE_CODERS[kwargs.get("coder", "static")]
+    verbose = int(kwargs.get("v", 0))
+    chunk_size = int(kwargs.get("K", 0))
+    shrink_factor = int(kwargs.get("alpha", 2))
+    workers = int(kwargs["workers"]) if "workers" in kwargs else None
+    timeline = int(kwargs.get("T", 1)) if timeline_path else 0
+
+    src = kwargs["in"]
+    comp = kwargs.get("out", f"{src}.{COMP_FILE_EXTENSION}")
+
+    encoder = LaneEncoder(lane_cnt, coder, verbose, chunk_size, shrink_factor, workers, timeline)
+    encoder.encode(src, comp)
+
+    if export_path:
+        encoder.export_results(export_path)
+    if timeline_path:
+        encoder.export_timeline(timeline_path)
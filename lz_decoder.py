@@ -0,0 +1,139 @@
+from typing import BinaryIO, Dict, Optional
+import sys
+
+from base_coder import BaseDecoder, BLOCK_CODED, BLOCK_STORED
+from utils import BUFFER_SIZE, DECOMP_FILE_EXTENSION, LZ_FORMAT_ID
+from bit_io_stream import BitInStream, IO_MODE_BYTE
+from huffman_tree import HuffmanTree
+from lz_encoder import (
+    LITERAL_CODES,
+    LITLEN_CODES,
+    DIST_CODES,
+    CODE_TABLE_SIZE,
+    LENGTH_BASE,
+    LENGTH_EXTRA,
+    DIST_BASE,
+    DIST_EXTRA,
+)
+
+
+class LZDecoder(BaseDecoder):
+    def __init__(self, verbose: int=0):
+        super().__init__(verbose)
+
+        self._level: int
+        self._window: int
+        self._history: bytearray = bytearray()  # the last `window` decoded bytes
+
+    def decode(self, src_file_path: str, decomp_file_path: str):
+        with open(src_file_path, "rb", BUFFER_SIZE) as src:
+            self._parse_header(src)
+
+            with self._undo_filters(decomp_file_path) as decoded_file_path:
+                with open(decoded_file_path, "wb", BUFFER_SIZE) as decomp:
+                    self._decode_content(src, decomp)
+
+    def reset(self):
+        super().reset()
+        self._history.clear()
+
+    def _decode_content(self, src: BinaryIO, decomp: BinaryIO):
+        while True:
+            block = self._read_block(src)
+            if block is None:
+                break
+
+            block_type, content = block
+            assert block_type in (BLOCK_CODED, BLOCK_STORED), f"unexpected block type {block_type}"
+
+            start = len(self._history)
+            if block_type == BLOCK_STORED:
+                self._history += content
+            else:
+                self._decode_block(content)
+
+            decomp.write(self._history[start:])
+            del self._history[:-self._window]
+
+    def _decode_block(self, block: bytes):
+        # append the bytes of a coded block to the history
+        litlen_tree = self._build_tree(block[:LITLEN_CODES])
+        dist_tree = self._build_tree(block[LITLEN_CODES:CODE_TABLE_SIZE])
+        bits = self._get_codewords(block[CODE_TABLE_SIZE:])
+        history = self._history
+
+        i = 0
+        while i < len(bits):
+            symbol = None
+            while symbol is None:
+                symbol = litlen_tree.decode(bits[i])
+                i += 1
+
+            code = ord(symbol)
+            if code < LITERAL_CODES:
+                history.append(code)
+                continue
+
+            code -= LITERAL_CODES
+            n = LENGTH_EXTRA[code]
+            length = LENGTH_BASE[code] + (int(bits[i:i+n], 2) if n else 0)
+            i += n
+
+            symbol = None
+            while symbol is None:
+                symbol = dist_tree.decode(bits[i])
+                i += 1
+
+            code = ord(symbol)
+            n = DIST_EXTRA[code]
+            dist = DIST_BASE[code] + (int(bits[i:i+n], 2) if n else 0)
+            i += n
+
+            assert 0 < dist <= len(history)
+            start = len(history) - dist
+            if dist >= length:
+                history += history[start:start+length]
+            else:
+                # the match overlaps the bytes it copies
+                for j in range(start, start + length):
+                    history.append(history[j])
+
+        assert litlen_tree._cur == litlen_tree._root
+
+    @staticmethod
+    def _build_tree(code_lens: bytes) -> Optional[HuffmanTree]:
+        # None if no code is used
+        code_len_dict: Dict[str, int] = {chr(code): code_len for code, code_len in enumerate(code_lens) if code_len > 0}
+        return HuffmanTree(code_len_dict=code_len_dict) if code_len_dict else None
+
+    def _parse_header(self, file_obj: BinaryIO):
+        """
+            format id: 1 byte
+            level: 1 byte
+            window bits: 1 byte
+            block size: 4 bytes
+            filter chain length: 1 byte
+            filter chain: {filter id}{width}... (2 bytes per filter)
+            blocks: {block type}{block length}{block}...
+                coded block: {literal / length code lengths}{distance code lengths}{dummy codeword bits}{codewords}
+                stored block: the bytes as is
+        """
+
+        stream = BitInStream(file_obj, mode=IO_MODE_BYTE)
+        assert ord(stream.read(1)) == LZ_FORMAT_ID
+
+        self._level = ord(stream.read(1))
+        self._window = 2 ** ord(stream.read(1))
+        self._parse_block_size_header(stream)
+        self._parse_filters_header(stream)
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    verbose = int(kwargs.get("v", 0))
+    decoder = LZDecoder(verbose)
+
+    src = kwargs["in"]
+    decomp = kwargs.get("out", f"{src}.{DECOMP_FILE_EXTENSION}")
+    decoder.decode(src, decomp)
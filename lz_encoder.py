@@ -0,0 +1,371 @@
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from collections import Counter
+from bisect import bisect_right
+from pathlib import Path
+import sys
+import os
+import io
+
+from base_coder import BaseEncoder, BLOCK_CODED, BLOCK_STORED, BLOCK_SIZE_SIZE
+from utils import BITS_PER_BYTE, BUFFER_SIZE, BYTES_PER_MB, COMP_FILE_EXTENSION, LZ_FORMAT_ID
+from bit_io_stream import BitOutStream, IO_MODE_BYTE
+from huffman_tree import HuffmanTree
+from filters import FilterPipeline
+from result_cache import ResultCache, DEFAULT_CACHE_SIZE
+
+
+# the source is parsed into literals and (length, distance) matches, as in deflate
+# literal / length alphabet: literals 0 ~ 255, then a code per range of lengths, followed by extra bits of the length
+# distance alphabet: a code per range of distances, followed by extra bits of the distance
+MIN_MATCH = 3
+MAX_MATCH = 258
+LENGTH_BASE = [3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31, 35, 43, 51, 59, 67, 83, 99, 115, 131, 163, 195, 227, 258]
+LENGTH_EXTRA = [0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 0]
+DIST_BASE = [
+    1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193, 257, 385, 513, 769,
+    1025, 1537, 2049, 3073, 4097, 6145, 8193, 12289, 16385, 24577,
+]
+DIST_EXTRA = [0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12, 12, 13, 13]
+LITERAL_CODES = 2 ** BITS_PER_BYTE
+LITLEN_CODES = LITERAL_CODES + len(LENGTH_BASE)
+DIST_CODES = len(DIST_BASE)
+
+# a coded block is {code lengths of the literal / length alphabet}{code lengths of the distance alphabet}
+# followed by a coded stream (dummy codeword bits and codewords), a code length is 1 byte, 0 for unused codes
+CODE_TABLE_SIZE = LITLEN_CODES + DIST_CODES
+
+# level: (window bits, max chain, nice length, lazy)
+#     window bits: matches are searched in the last 2 ** window bits bytes
+#     max chain: most candidates compared per position
+#     nice length: a match at least this long stops the search
+#     lazy: a match is given up for a longer one at the next position
+LEVELS = {
+    1: (12, 4, 16, False),
+    2: (13, 8, 32, False),
+    3: (14, 16, 64, False),
+    4: (15, 16, 32, True),
+    5: (15, 32, 64, True),
+    6: (15, 128, 128, True),
+    7: (15, 256, 258, True),
+    8: (15, 1024, 258, True),
+    9: (15, 4096, 258, True),
+}
+DEFAULT_LEVEL = 6
+DEFAULT_BLOCK_SIZE = 256 * 1024
+
+assert 2 ** max(window_bits for window_bits, _, _, _ in LEVELS.values()) <= DIST_BASE[-1] + 2 ** DIST_EXTRA[-1]
+
+
+def length_code(length: int) -> Tuple[int, int, int]:
+    # return the code, number of extra bits and extra bits value of a match length
+    i = bisect_right(LENGTH_BASE, length) - 1
+    return LITERAL_CODES + i, LENGTH_EXTRA[i], length - LENGTH_BASE[i]
+
+
+def dist_code(dist: int) -> Tuple[int, int, int]:
+    # return the code, number of extra bits and extra bits value of a match distance
+    i = bisect_right(DIST_BASE, dist) - 1
+    return i, DIST_EXTRA[i], dist - DIST_BASE[i]
+
+
+class LZEncoder(BaseEncoder):
+    # each block is parsed by a hash chain match finder, whose window spans the previous blocks,
+    # then its literals / lengths and distances are coded by 2 huffman trees built for the block
+
+    def __init__(
+        self,
+        verbose: int=0,
+        level: int=DEFAULT_LEVEL,
+        block_size: int=DEFAULT_BLOCK_SIZE,
+        filters: Optional[FilterPipeline]=None,
+        result_cache: Optional[ResultCache]=None,
+        timeline: int=0,
+    ):
+        assert level in LEVELS and block_size > 0
+        super().__init__(1, verbose, filters, block_size=block_size, result_cache=result_cache, timeline=timeline)
+
+        self._level: int = level
+        window_bits, self._max_chain, self._nice_len, self._lazy = LEVELS[level]
+        self._window: int = 2 ** window_bits
+
+        # ===== match finder =====
+        self._history: bytes = b""  # the last `window` bytes before the block being parsed
+        self._history_offset: int = 0  # offset of the history in the source
+        self._head: Dict[bytes, int] = {}  # {3 bytes: offset of their last occurrence}
+        self._prev: List[Optional[int]] = [None] * self._window  # offset of the previous occurrence, by offset % window
+
+        # ===== statistics =====
+        self._literal_cnt: int = 0
+        self._match_cnt: int = 0
+        self._match_bytes: int = 0
+
+    def reset(self):
+        super().reset()
+        self._history = b""
+        self._history_offset = 0
+        self._head.clear()  # stale offsets in `_prev` are never reached from `_head`
+        self._literal_cnt = 0
+        self._match_cnt = 0
+        self._match_bytes = 0
+
+    def _encode(self, src_file_path: str, comp_file_path: str):
+        with self._apply_filters(src_file_path) as filtered_file_path:
+            if self._src_bytes is None:
+                self._src_bytes = os.path.getsize(src_file_path)
+
+            with open(filtered_file_path, "rb", BUFFER_SIZE) as src, open(comp_file_path, "wb", BUFFER_SIZE) as comp:
+                self._write_header(comp)
+                self._write_blocks(src, comp)
+
+    def _compress(self, data: bytes, comp: BinaryIO):
+        self._write_header(comp)
+        self._write_blocks(io.BytesIO(data), comp)
+
+    def export_results(self, export_path: Path):
+        with open(export_path, "w") as f:
+            f.write(f"{'='*10} params {'='*10}\n")
+            f.write(f"level: {self._level}\n")
+            f.write(f"window: {self._window}\n")
+            f.write(f"block size: {self._block_size}\n")
+            f.write(f"filters: {self._filters}\n")
+
+            f.write(f"\n{'='*10} statistics {'='*10}\n")
+            if self._cached_bytes is not None:
+                f.write(f"found in the result cache\n")
+                f.write(f"compression ratio: {self.compression_ratio}\n")
+                return
+
+            f.write(f"total bytes: {self._src_bytes}\n")
+            f.write(f"literals: {self._literal_cnt}\n")
+            f.write(f"matches: {self._match_cnt}\n")
+            f.write(f"average match length: {self._match_bytes / self._match_cnt if self._match_cnt else 0}\n")
+            f.write(f"coded blocks: {self._block_cnts[BLOCK_CODED]}\n")
+            f.write(f"stored blocks: {self._block_cnts[BLOCK_STORED]}\n")
+            f.write(f"compression ratio: {self.compression_ratio}\n")
+
+    def _write_header(self, comp: BinaryIO):
+        """
+            format id: 1 byte
+            level: 1 byte
+            window bits: 1 byte
+            block size: 4 bytes
+            filter chain length: 1 byte
+            filter chain: {filter id}{width}... (2 bytes per filter)
+            blocks: {block type}{block length}{block}...
+                coded block: {literal / length code lengths}{distance code lengths}{dummy codeword bits}{codewords}
+                stored block: the bytes as is
+        """
+
+        stream = BitOutStream(comp, mode=IO_MODE_BYTE)
+        stream.write(chr(LZ_FORMAT_ID))
+        stream.write(chr(self._level))
+        stream.write(chr(self._window.bit_length() - 1))
+        self._write_block_size_header(stream)
+        self._write_filters_header(stream)
+
+    def _write_blocks(self, src: BinaryIO, comp: BinaryIO):
+        self._start_timeline()
+        while True:
+            block = src.read(self._block_size)
+            if len(block) == 0:
+                break
+
+            self._symbol_cnt += len(block)
+            tokens = self._find_matches(block)
+            codewords, code_table = self._code_tokens(tokens)
+
+            if self._should_store_block(len(code_table) * BITS_PER_BYTE + len(codewords), len(block)):
+                self._write_block(comp, BLOCK_STORED, block)
+            else:
+                self._write_block(comp, BLOCK_CODED, code_table + self._to_coded_stream(codewords))
+
+            self._update_timeline(block)
+
+    def _find_matches(self, block: bytes) -> List[Tuple[int, int]]:
+        # return the tokens of the block: (byte, 0) for a literal, (length, distance) for a match
+        buf = self._history + block
+        base = self._history_offset  # offset of buf in the source
+        n = len(buf)
+
+        tokens = []
+        i = len(self._history)
+        pending = None  # match found at i while looking ahead from i-1
+        while i < n:
+            if pending is None:
+                length, dist = self._longest_match(buf, base, i)
+                self._insert(buf, base, i)
+            else:
+                length, dist = pending
+                pending = None
+
+            if length < MIN_MATCH:
+                tokens.append((buf[i], 0))
+                i += 1
+                continue
+
+            if self._lazy and length < self._nice_len and i + 1 < n:
+                next_length, next_dist = self._longest_match(buf, base, i+1)
+                self._insert(buf, base, i+1)
+                if next_length > length:
+                    tokens.append((buf[i], 0))
+                    i += 1
+                    pending = (next_length, next_dist)
+                    continue
+
+                first_uninserted = i + 2
+            else:
+                first_uninserted = i + 1
+
+            tokens.append((length, dist))
+            for j in range(first_uninserted, i + length):
+                self._insert(buf, base, j)
+            i += length
+
+        # keep the last `window` bytes for the next block
+        self._history = buf[-self._window:]
+        self._history_offset = base + n - len(self._history)
+
+        return tokens
+
+    def _longest_match(self, buf: bytes, base: int, i: int) -> Tuple[int, int]:
+        # return the longest match of buf[i:] in the window, (0, 0) if none
+        limit = min(MAX_MATCH, len(buf) - i)
+        if limit < MIN_MATCH:
+            return 0, 0
+
+        pos = base + i
+        candidate = self._head.get(buf[i:i+MIN_MATCH])
+        best_len, best_dist = 0, 0
+        chain = self._max_chain
+
+        while candidate is not None and pos - candidate < self._window and chain > 0:
+            j = candidate - base
+            # a longer match must differ from the best one at best_len
+            if buf[j+best_len] == buf[i+best_len]:
+                length = MIN_MATCH  # the first bytes are equal since they share the key
+                while length + 8 <= limit and buf[j+length:j+length+8] == buf[i+length:i+length+8]:
+                    length += 8
+                while length < limit and buf[j+length] == buf[i+length]:
+                    length += 1
+
+                if length > best_len:
+                    best_len, best_dist = length, pos - candidate
+                    if length >= self._nice_len or length == limit:
+                        break
+
+            candidate = self._prev[candidate % self._window]
+            chain -= 1
+
+        return best_len, best_dist
+
+    def _insert(self, buf: bytes, base: int, i: int):
+        # the bytes at i can be matched from now on
+        if i + MIN_MATCH > len(buf):
+            return
+
+        key = buf[i:i+MIN_MATCH]
+        pos = base + i
+        self._prev[pos % self._window] = self._head.get(key)
+        self._head[key] = pos
+
+    def _code_tokens(self, tokens: List[Tuple[int, int]]) -> Tuple[str, bytes]:
+        # return the codewords of the tokens and the code table of the block
+        litlen_symbols = []
+        dist_symbols = []
+        extra_bits = []  # of each match, length then distance
+        for value, dist in tokens:
+            if dist == 0:
+                litlen_symbols.append(chr(value))
+                self._literal_cnt += 1
+                continue
+
+            code, n, extra = length_code(value)
+            litlen_symbols.append(chr(code))
+            extra_bits.append(format(extra, f"0{n}b") if n else "")
+
+            code, n, extra = dist_code(dist)
+            dist_symbols.append(chr(code))
+            extra_bits.append(format(extra, f"0{n}b") if n else "")
+
+            self._match_cnt += 1
+            self._match_bytes += value
+
+        litlen_codes = self._build_code_dict(Counter(litlen_symbols), LITLEN_CODES)
+        dist_codes = self._build_code_dict(Counter(dist_symbols), DIST_CODES)
+
+        codewords = []
+        dist_iter = iter(dist_symbols)
+        extra_iter = iter(extra_bits)
+        for symbol in litlen_symbols:
+            codewords.append(litlen_codes[symbol])
+            if ord(symbol) >= LITERAL_CODES:
+                codewords.append(next(extra_iter))
+                codewords.append(dist_codes[next(dist_iter)])
+                codewords.append(next(extra_iter))
+
+        code_table = bytes(len(litlen_codes.get(chr(code), "")) for code in range(LITLEN_CODES))
+        code_table += bytes(len(dist_codes.get(chr(code), "")) for code in range(DIST_CODES))
+
+        return "".join(codewords), code_table
+
+    @staticmethod
+    def _build_code_dict(symbol_distribution: Dict[str, int], alphabet_size: int) -> Dict[str, str]:
+        # return the code dict, empty if no symbol is used
+        if len(symbol_distribution) == 0:
+            return {}
+
+        # a huffman tree needs 2 symbols, an unused one is given a codeword
+        if len(symbol_distribution) == 1:
+            unused = next(chr(code) for code in range(alphabet_size) if chr(code) not in symbol_distribution)
+            symbol_distribution[unused] = 0
+
+        return HuffmanTree(symbol_distribution=symbol_distribution).code_dict
+
+    def _get_cache_params(self) -> Dict:
+        params = super()._get_cache_params()
+        params.update(level=self._level)
+        return params
+
+    def _get_header_size(self) -> int:
+        header_size = 3  # format id, level, window bits
+        header_size += BLOCK_SIZE_SIZE
+        header_size += self._get_filters_header_size()
+        return header_size
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    export_path = kwargs.get("export", None)
+    if export_path:
+        export_path = Path(export_path)
+        if export_path.exists():
+            raise AssertionError(f"{export_path} already exists")
+
+    timeline_path = kwargs.get("timeline", None)
+    if timeline_path:
+        timeline_path = Path(timeline_path)
+        if timeline_path.exists():
+            raise AssertionError(f"{timeline_path} already exists")
+
+    verbose = int(kwargs.get("v", 0))
+    level = int(kwargs.get("level", DEFAULT_LEVEL))
+    block_size = int(kwargs.get("B", DEFAULT_BLOCK_SIZE // 1024)) * 1024
+    filters = FilterPipeline.from_spec(kwargs["filters"]) if "filters" in kwargs else None
+    timeline = int(kwargs.get("T", 1)) if timeline_path else 0
+    result_cache = (
+        ResultCache(kwargs["cache"], int(kwargs.get("cache_size", DEFAULT_CACHE_SIZE)) * BYTES_PER_MB)
+        if "cache" in kwargs
+        else None
+    )
+
+    src = kwargs["in"]
+    comp = kwargs.get("out", f"{src}.{COMP_FILE_EXTENSION}")
+
+    encoder = LZEncoder(verbose, level, block_size, filters, result_cache, timeline)
+    encoder.encode(src, comp)
+
+    if export_path:
+        encoder.export_results(export_path)
+    if timeline_path:
+        encoder.export_timeline(timeline_path)
@@ -0,0 +1,74 @@
+from typing import Callable, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import shutil
+
+from utils import BITS_PER_BYTE, BUFFER_SIZE, extended_chr, extended_ord
+
+
+# a file of independently coded parts (lanes, segments) holds a part table after its own header:
+#     {offset}{size}{offset}{size}...
+#         offset of the coded part from the beginning of the file: 8 bytes
+#         size of the coded part: 8 bytes
+# followed by the coded parts, each a complete compressed file
+
+PART_OFFSET_SIZE = 8  # bytes used to store the offset / size of each part
+
+
+def code_parts(
+    code_part: Callable,
+    part_args: Sequence[Tuple],
+    workers: int = None,
+    on_part: Optional[Callable[[int], None]] = None,
+) -> List:
+    # call `code_part` on the args of every part concurrently on a process pool, return the results in order
+    # `on_part(i)` is called in order as soon as the i-th part is done, while the later parts may still be running
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(code_part, *args) for args in part_args]
+
+        results = []
+        for i, f in enumerate(futures):
+            results.append(f.result())
+            if on_part is not None:
+                on_part(i)
+
+        return results
+
+
+def part_offsets(header_size: int, part_sizes: List[int]) -> List[int]:
+    # the parts follow the header back to back
+    offsets = []
+    for size in part_sizes:
+        offsets.append(header_size)
+        header_size += size
+    return offsets
+
+
+def write_part_entry(stream, offset: int, size: int):
+    stream.write(extended_chr(offset, PART_OFFSET_SIZE * BITS_PER_BYTE))
+    stream.write(extended_chr(size, PART_OFFSET_SIZE * BITS_PER_BYTE))
+
+
+def read_part_entry(stream) -> Tuple[int, int]:
+    offset = extended_ord(stream.read(PART_OFFSET_SIZE))
+    size = extended_ord(stream.read(PART_OFFSET_SIZE))
+    return offset, size
+
+
+def extract_part(src_file_path: str, offset: int, size: int, part_file_path: str):
+    # copy `size` bytes of the source from `offset` into a file of their own
+    with open(src_file_path, "rb", BUFFER_SIZE) as src, open(part_file_path, "wb", BUFFER_SIZE) as part:
+        src.seek(offset)
+        while size > 0:
+            buffer = src.read(min(size, BUFFER_SIZE))
+            assert len(buffer) > 0
+            part.write(buffer)
+            size -= len(buffer)
+
+
+def concat_parts(part_file_paths: List[str], file_path: str, mode: str = "wb") -> int:
+    # write the parts back to back into the file ("ab" to follow a header), return its size
+    with open(file_path, mode, BUFFER_SIZE) as f:
+        for p in part_file_paths:
+            with open(p, "rb", BUFFER_SIZE) as part:
+                shutil.copyfileobj(part, f, BUFFER_SIZE)
+        return f.tell()
@@ -0,0 +1,138 @@
+from typing import BinaryIO, Iterator, List
+import sys
+
+from base_coder import BaseDecoder
+from utils import BITS_PER_BYTE, BUFFER_SIZE, BYTES_PER_MB, DECOMP_FILE_EXTENSION, PROGRESS_FILE_NAME, RANGE_FORMAT_ID, extended_ord
+from bit_io_stream import BitInStream, IO_MODE_BYTE
+from frequency_model import FrequencyModel, ESCAPE
+from adaptive_encoder import SHRINK_PERIOD_SIZE
+from range_encoder import RANGE_MASK, RANGE_TOP, RAW_TOTAL, FLUSH_BYTES, SYMBOL_CNT_SIZE
+
+
+class RangeDecoder(BaseDecoder):
+    ALERT_PERIOD = BYTES_PER_MB
+
+    def __init__(self, verbose: int=0):
+        super().__init__(verbose)
+
+        self._total_symbols: int
+        self._shrink_period: int
+        self._shrink_factor: int
+
+    def decode(self, src_file_path: str, decomp_file_path: str):
+        with open(src_file_path, "rb", BUFFER_SIZE) as src:
+            self._parse_header(src)
+
+            with self._undo_filters(decomp_file_path) as decoded_file_path:
+                with open(decoded_file_path, "wb", BUFFER_SIZE) as decomp:
+                    self._decode_content(src, decomp)
+                self._trunc(decoded_file_path)
+
+    def _decode_content(self, src: BinaryIO, decomp: BinaryIO):
+        model = FrequencyModel(self._shrink_period, self._shrink_factor)
+        b = self._bytes_per_symbol
+
+        # past the end of the content the decoder reads zeros, as the encoder flushed enough bytes
+        content = self._read_bytes(src)
+        code = 0
+        for _ in range(FLUSH_BYTES):
+            code = (code << BITS_PER_BYTE) | next(content, 0)
+        rng = RANGE_MASK
+
+        decoded: List[str] = []
+        for _ in range(self._total_symbols):
+            total = model.total
+            r = rng // total
+            index, start, size = model.find(min(code // r, total - 1))
+            code -= r * start
+            rng = r * size
+            while rng < RANGE_TOP:
+                rng <<= BITS_PER_BYTE
+                code = (code << BITS_PER_BYTE) | next(content, 0)
+
+            if index == ESCAPE:
+                model.update(ESCAPE)
+
+                raw = []
+                for _ in range(b):
+                    r = rng // RAW_TOTAL
+                    byte = min(code // r, RAW_TOTAL - 1)
+                    code -= r * byte
+                    rng = r
+                    while rng < RANGE_TOP:
+                        rng <<= BITS_PER_BYTE
+                        code = (code << BITS_PER_BYTE) | next(content, 0)
+                    raw.append(chr(byte))
+
+                symbol = "".join(raw)
+                model.add_symbol(symbol)
+            else:
+                symbol = model.symbol_of(index)
+                model.update(index)
+
+            decoded.append(symbol)
+            if len(decoded) * b >= BUFFER_SIZE:
+                self._write_symbols(decomp, decoded)
+
+        self._write_symbols(decomp, decoded)
+
+    def _write_symbols(self, decomp: BinaryIO, symbols: List[str]):
+        decomp.write("".join(symbols).encode("latin-1"))
+        self._symbol_cnt += len(symbols)
+        symbols.clear()
+
+        if self._should_alert():
+            self._export_progress()
+
+    @staticmethod
+    def _read_bytes(src: BinaryIO) -> Iterator[int]:
+        while True:
+            buffer = src.read(BUFFER_SIZE)
+            if len(buffer) == 0:
+                return
+            yield from buffer
+
+    def _export_progress(self):
+        with open(PROGRESS_FILE_NAME, "w") as f:
+            f.write(f"{self._symbol_cnt * self._bytes_per_symbol // self.ALERT_PERIOD} Mb decompressed\n")
+
+        self._alert_cnt += 1
+
+    def _parse_header(self, file_obj: BinaryIO):
+        """
+            format id: 1 byte
+            bits per symbol: 1 byte
+            dummy symbol bytes: 1 byte
+            symbol count: 8 bytes
+            shrink period (symbols): 8 bytes
+            shrink factor: 1 byte
+            filter chain length: 1 byte
+            filter chain: {filter id}{width}... (2 bytes per filter)
+            content: range coded symbols, a symbol new to the model is coded as the escape followed by its raw bytes
+        """
+
+        stream = BitInStream(file_obj, mode=IO_MODE_BYTE)
+        assert ord(stream.read(1)) == RANGE_FORMAT_ID
+
+        self._bits_per_symbol = ord(stream.read(1))
+        assert self._bits_per_symbol > 0 and self._bits_per_symbol % 8 == 0
+        self._bytes_per_symbol = self._bits_per_symbol // BITS_PER_BYTE
+
+        self._dummy_symbol_bytes = ord(stream.read(1))
+        assert 0 <= self._dummy_symbol_bytes < self._bytes_per_symbol
+
+        self._total_symbols = extended_ord(stream.read(SYMBOL_CNT_SIZE))
+        self._shrink_period = extended_ord(stream.read(SHRINK_PERIOD_SIZE))
+        self._shrink_factor = ord(stream.read(1))
+        self._parse_filters_header(stream)
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    verbose = int(kwargs.get("v", 0))
+    decoder = RangeDecoder(verbose)
+
+    src = kwargs["in"]
+    decomp = kwargs.get("out", f"{src}.{DECOMP_FILE_EXTENSION}")
+    decoder.decode(src, decomp)
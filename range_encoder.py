@@ -0,0 +1,275 @@
+from typing import BinaryIO, Dict, Optional
+from pathlib import Path
+import sys
+import io
+
+from base_coder import BaseEncoder
+from utils import BITS_PER_BYTE, BUFFER_SIZE, BYTES_PER_MB, COMP_FILE_EXTENSION, PROGRESS_FILE_NAME, RANGE_FORMAT_ID
+from bit_io_stream import BitOutStream, IO_MODE_BYTE
+from frequency_model import FrequencyModel, ESCAPE
+from adaptive_encoder import SHRINK_PERIOD_SIZE
+from filters import FilterPipeline
+from result_cache import ResultCache, DEFAULT_CACHE_SIZE
+
+
+# a 32 bits range coder with carry propagation (as in lzma), renormalized a byte at a time
+# the top byte of `low` is held back while a carry may still change it, along with the 0xff bytes after it
+RANGE_BITS = 32
+RANGE_MASK = 2 ** RANGE_BITS - 1
+RANGE_TOP = 2 ** (RANGE_BITS - BITS_PER_BYTE)  # the range is kept at least RANGE_TOP
+CARRY_LIMIT = RANGE_MASK - RANGE_TOP + 1  # a top byte below 0xff can absorb a carry
+RAW_TOTAL = 2 ** BITS_PER_BYTE  # each raw byte of a new symbol is coded in a uniform total
+FLUSH_BYTES = 5  # bytes of `low` flushed at the end, the decoder starts by reading as many
+SYMBOL_CNT_SIZE = 8  # bytes used to store the number of symbols
+
+
+class RangeEncoder(BaseEncoder):
+    # adaptive arithmetic coding of symbols with the counts of a FrequencyModel,
+    # the counts are shrunk every chunk as the adaptive huffman tree is (K / alpha)
+    ALERT_PERIOD = BYTES_PER_MB
+
+    def __init__(
+        self,
+        bytes_per_symbol: int,
+        verbose: int=0,
+        chunk_size: int=0,
+        shrink_factor: int=2,
+        shrink_period: int=0,
+        filters: Optional[FilterPipeline]=None,
+        result_cache: Optional[ResultCache]=None,
+        timeline: int=0,
+    ):
+        super().__init__(bytes_per_symbol, verbose, filters, result_cache=result_cache, timeline=timeline)
+
+        assert chunk_size >= 0
+        assert 1 < shrink_factor < 2 ** BITS_PER_BYTE
+        self._chunk_size: int = chunk_size  # in Mb
+        self._shrink_factor: int = shrink_factor
+
+        # shrink period in symbols, takes precedence over chunk size
+        self._shrink_period: int = (
+            shrink_period
+            if shrink_period > 0
+            else chunk_size * BYTES_PER_MB // bytes_per_symbol
+        )
+
+        self._model: Optional[FrequencyModel] = None
+        self._escape_cnt: int = 0
+
+        # ===== range coder =====
+        self._low: int = 0
+        self._range: int = RANGE_MASK
+        self._cache: int = 0  # the top byte held back
+        self._cache_size: int = 1  # the held back byte and the 0xff bytes after it
+        self._out: bytearray = bytearray()
+
+    @property
+    def avg_code_len(self) -> float:
+        return self._bits_written / self._symbol_cnt
+
+    def reset(self):
+        super().reset()
+        self._model = None
+        self._escape_cnt = 0
+        self._low = 0
+        self._range = RANGE_MASK
+        self._cache = 0
+        self._cache_size = 1
+        self._out.clear()
+
+    def _encode(self, src_file_path: str, comp_file_path: str):
+        with self._apply_filters(src_file_path) as filtered_file_path:
+            with open(filtered_file_path, "rb", BUFFER_SIZE) as src, open(comp_file_path, "w+b", BUFFER_SIZE) as comp:
+                self._encode_symbols(src, comp)
+
+    def _compress(self, data: bytes, comp: BinaryIO):
+        self._encode_symbols(io.BytesIO(data), comp)
+
+    def _encode_symbols(self, src: BinaryIO, comp: BinaryIO):
+        comp.write(bytes(self._get_header_size()))  # preserve space for header
+        self._write_content(src, comp)
+
+        # the number of symbols is only known once the content is written
+        end = comp.tell()
+        comp.seek(0)
+        self._write_header(comp)
+        comp.seek(end)
+
+    def export_results(self, export_path: Path):
+        with open(export_path, "w") as f:
+            f.write(f"{'='*10} params {'='*10}\n")
+            f.write(f"bytes per symbol: {self._bytes_per_symbol}\n")
+            f.write(f"chunk size: {self._chunk_size}\n")
+            f.write(f"shrink period: {self._shrink_period}\n")
+            f.write(f"shrink factor: {self._shrink_factor}\n")
+            f.write(f"filters: {self._filters}\n")
+
+            f.write(f"\n{'='*10} statistics {'='*10}\n")
+            if self._cached_bytes is not None:
+                f.write(f"found in the result cache\n")
+                f.write(f"compression ratio: {self.compression_ratio}\n")
+                return
+
+            f.write(f"total symbols: {self._symbol_cnt}\n")
+            f.write(f"distinct symbols: {len(self._model)}\n")
+            f.write(f"escapes: {self._escape_cnt}\n")
+            f.write(f"average codeword length: {self.avg_code_len}\n")
+            f.write(f"compression ratio: {self.compression_ratio}\n")
+            f.write(f"shrink counts: {self._model.shrink_cnt}\n")
+            f.write(f"rescale counts: {self._model.rescale_cnt}\n")
+            f.write(f"evict counts: {self._model.evict_cnt}\n")
+
+    def _export_progress(self):
+        with open(PROGRESS_FILE_NAME, "w") as f:
+            f.write(f"{self._symbol_cnt * self._bytes_per_symbol // self.ALERT_PERIOD} Mb compressed\n")
+            f.write(f"Average codeword length: {self.avg_code_len} bits\n")
+
+        self._alert_cnt += 1
+
+    def _write_header(self, comp: BinaryIO):
+        """
+            format id: 1 byte
+            bits per symbol: 1 byte
+            dummy symbol bytes: 1 byte
+            symbol count: 8 bytes
+            shrink period (symbols): 8 bytes
+            shrink factor: 1 byte
+            filter chain length: 1 byte
+            filter chain: {filter id}{width}... (2 bytes per filter)
+            content: range coded symbols, a symbol new to the model is coded as the escape followed by its raw bytes
+        """
+
+        comp.write(bytes((RANGE_FORMAT_ID, self._bits_per_symbol, self._dummy_symbol_bytes)))
+        comp.write(self._symbol_cnt.to_bytes(SYMBOL_CNT_SIZE, "big"))
+        comp.write(self._shrink_period.to_bytes(SHRINK_PERIOD_SIZE, "big"))
+        comp.write(bytes((self._shrink_factor,)))
+        self._write_filters_header(BitOutStream(comp, mode=IO_MODE_BYTE))
+
+    def _write_content(self, src: BinaryIO, comp: BinaryIO):
+        self._model = model = FrequencyModel(self._shrink_period, self._shrink_factor)
+        b = self._bytes_per_symbol
+        self._start_timeline()
+
+        while True:
+            buffer = src.read(BUFFER_SIZE - BUFFER_SIZE % b)
+            if len(buffer) == 0:
+                break
+            elif len(buffer) % b:
+                self._dummy_symbol_bytes = b - len(buffer) % b
+                buffer += bytes(self._dummy_symbol_bytes)
+
+            symbols = buffer.decode("latin-1")
+            for i in range(0, len(symbols), b):
+                symbol = symbols[i:i+b]
+                index = model.index_of(symbol)
+
+                if index is None:
+                    start, size = model.range_of(ESCAPE)
+                    self._encode_range(start, size, model.total)
+                    model.update(ESCAPE)
+
+                    for byte in symbol:
+                        self._encode_range(ord(byte), 1, RAW_TOTAL)
+                    model.add_symbol(symbol)
+                    self._escape_cnt += 1
+                else:
+                    start, size = model.range_of(index)
+                    self._encode_range(start, size, model.total)
+                    model.update(index)
+
+            self._symbol_cnt += len(symbols) // b
+            self._flush_out(comp)
+            self._update_timeline(symbols[i:i+b] for i in range(0, len(symbols), b))
+
+            if self._should_alert():
+                self._export_progress()
+
+        for _ in range(FLUSH_BYTES):
+            self._shift_low()
+        self._flush_out(comp)
+
+    def _encode_range(self, start: int, size: int, total: int):
+        r = self._range // total
+        self._low += r * start
+        self._range = r * size
+
+        while self._range < RANGE_TOP:
+            self._range <<= BITS_PER_BYTE
+            self._shift_low()
+
+    def _shift_low(self):
+        if self._low < CARRY_LIMIT or self._low > RANGE_MASK:
+            # the held back bytes are final
+            carry = self._low >> RANGE_BITS
+            byte = self._cache
+            for _ in range(self._cache_size):
+                self._out.append((byte + carry) & 0xff)
+                byte = 0xff
+
+            self._cache_size = 0
+            self._cache = (self._low >> (RANGE_BITS - BITS_PER_BYTE)) & 0xff
+
+        self._cache_size += 1
+        self._low = (self._low << BITS_PER_BYTE) & RANGE_MASK
+
+    def _flush_out(self, comp: BinaryIO):
+        comp.write(self._out)
+        self._bits_written += len(self._out) * BITS_PER_BYTE
+        self._out.clear()
+
+    def _get_shrink_cnt(self) -> int:
+        return self._model.shrink_cnt
+
+    def _get_cache_params(self) -> Dict:
+        params = super()._get_cache_params()
+        params.update(shrink_period=self._shrink_period, shrink_factor=self._shrink_factor)
+        return params
+
+    def _get_header_size(self) -> int:
+        header_size = 3  # format id, bits per symbol, dummy symbol bytes
+        header_size += SYMBOL_CNT_SIZE
+        header_size += SHRINK_PERIOD_SIZE + 1  # shrink period, shrink factor
+        header_size += self._get_filters_header_size()
+        return header_size
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    export_path = kwargs.get("export", None)
+    if export_path:
+        export_path = Path(export_path)
+        if export_path.exists():
+            raise AssertionError(f"{export_path} already exists")
+
+    timeline_path = kwargs.get("timeline", None)
+    if timeline_path:
+        timeline_path = Path(timeline_path)
+        if timeline_path.exists():
+            raise AssertionError(f"{timeline_path} already exists")
+
+    bytes_per_symbol = int(kwargs.get("b", 1))
+    verbose = int(kwargs.get("v", 0))
+    chunk_size = int(kwargs.get("K", 0))
+    shrink_factor = int(kwargs.get("alpha", 2))
+    shrink_period = int(kwargs.get("Ks", 0))
+    timeline = int(kwargs.get("T", 1)) if timeline_path else 0
+    filters = FilterPipeline.from_spec(kwargs["filters"]) if "filters" in kwargs else None
+    result_cache = (
+        ResultCache(kwargs["cache"], int(kwargs.get("cache_size", DEFAULT_CACHE_SIZE)) * BYTES_PER_MB)
+        if "cache" in kwargs
+        else None
+    )
+
+    src = kwargs["in"]
+    comp = kwargs.get("out", f"{src}.{COMP_FILE_EXTENSION}")
+
+    encoder = RangeEncoder(
+        bytes_per_symbol, verbose, chunk_size, shrink_factor, shrink_period, filters, result_cache, timeline,
+    )
+    encoder.encode(src, comp)
+
+    if export_path:
+        encoder.export_results(export_path)
+    if timeline_path:
+        encoder.export_timeline(timeline_path)
@@ -0,0 +1,123 @@
+from typing import BinaryIO, Dict, Iterator, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+import tempfile
+import hashlib
+import shutil
+import os
+
+from utils import BUFFER_SIZE
+
+
+# part of every key, bump it whenever a compressed format changes so that stale results are never served
+CACHE_FORMAT_VERSION = 2
+DEFAULT_CACHE_SIZE = 1024  # in Mb
+
+
+class ResultCache:
+    # compressed outputs on disk, keyed by the hash of the content and the params of the coder
+    # the least recently used entries are evicted to keep the total size below `capacity` bytes
+    # entries are written to a temporary file then renamed, so readers never see a partial entry
+
+    def __init__(self, directory: str, capacity: int):
+        assert capacity > 0
+        self._directory: Path = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._capacity: int = capacity
+
+        # {key: size}, from the least recently used, loaded from the modification times of the entries
+        self._entries: OrderedDict = OrderedDict()
+        paths = [p for p in self._directory.iterdir() if p.is_file() and not p.name.startswith(".")]
+        for p in sorted(paths, key=lambda p: p.stat().st_mtime):
+            self._entries[p.name] = p.stat().st_size
+        self._size: int = sum(self._entries.values())
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def key(params: Dict, src_file_path: Optional[str]=None, data: Optional[bytes]=None) -> str:
+        # of the content of a file or of bytes, along with the params the output depends on
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(repr((CACHE_FORMAT_VERSION, sorted(params.items()))).encode())
+
+        if data is not None:
+            hasher.update(data)
+        else:
+            with open(src_file_path, "rb", BUFFER_SIZE) as f:
+                while True:
+                    buffer = f.read(BUFFER_SIZE)
+                    if len(buffer) == 0:
+                        break
+                    hasher.update(buffer)
+
+        return hasher.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._hit(key)
+        if path is None:
+            return None
+
+        with open(path, "rb") as f:
+            return f.read()
+
+    def get_file(self, key: str, dest_file_path: str) -> bool:
+        # copy the entry to `dest_file_path`, return whether it is found
+        path = self._hit(key)
+        if path is None:
+            return False
+
+        shutil.copyfile(path, dest_file_path)
+        return True
+
+    def put(self, key: str, data: bytes):
+        with self._atomic_write(key) as f:
+            f.write(data)
+
+    def put_file(self, key: str, src_file_path: str):
+        with self._atomic_write(key) as f, open(src_file_path, "rb", BUFFER_SIZE) as src:
+            shutil.copyfileobj(src, f, BUFFER_SIZE)
+
+    def _hit(self, key: str) -> Optional[Path]:
+        path = self._directory / key
+        try:
+            os.utime(path)  # most recently used, for the next process loading the cache
+        except FileNotFoundError:
+            # missing, or evicted by another process
+            self._size -= self._entries.pop(key, 0)
+            self.misses += 1
+            return None
+
+        if key not in self._entries:
+            self._entries[key] = path.stat().st_size
+            self._size += self._entries[key]
+        self._entries.move_to_end(key)
+
+        self.hits += 1
+        return path
+
+    @contextmanager
+    def _atomic_write(self, key: str) -> Iterator[BinaryIO]:
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        os.replace(tmp_path, self._directory / key)
+        self._add(key, os.path.getsize(self._directory / key))
+
+    def _add(self, key: str, size: int):
+        self._size += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+
+        while self._size > self._capacity and len(self._entries) > 1:
+            old_key, old_size = self._entries.popitem(last=False)
+            self._size -= old_size
+            try:
+                os.remove(self._directory / old_key)
+            except FileNotFoundError:
+                pass
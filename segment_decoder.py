@@ -0,0 +1,105 @@
+from typing import BinaryIO, List, Optional, Tuple
+from pathlib import Path
+import tempfile
+import sys
+import os
+
+from base_coder import BaseDecoder
+from utils import (
+    BITS_PER_BYTE,
+    BUFFER_SIZE,
+    DECOMP_FILE_EXTENSION,
+    SEGMENT_FORMAT_ID,
+    extended_ord,
+)
+from bit_io_stream import BitInStream, IO_MODE_BYTE
+from adaptive_decoder import AdaptiveDecoder
+from segment_encoder import TOTAL_BYTES_SIZE, SEGMENT_CNT_SIZE, PRIMER_SIZE_SIZE
+from parts import code_parts, read_part_entry, extract_part, concat_parts
+
+
+def _decode_segment(
+    src_file_path: str,
+    offset: int,
+    size: int,
+    segment_file_path: str,
+    primer: Optional[List[Tuple[str, int]]],
+):
+    comp_segment_file_path = f"{segment_file_path}.comp"
+    extract_part(src_file_path, offset, size, comp_segment_file_path)
+
+    AdaptiveDecoder(primer=primer).decode(comp_segment_file_path, segment_file_path)
+    os.remove(comp_segment_file_path)
+
+
+class SegmentDecoder(BaseDecoder):
+    def __init__(self, verbose: int = 0, workers: int = None):
+        super().__init__(verbose)
+
+        self._workers: int = workers
+
+        self._total_bytes: int
+        self._primer: List[Tuple[str, int]] = []
+        self._segment_offsets: List[int] = []
+        self._segment_sizes: List[int] = []
+
+    def decode(self, src_file_path: str, decomp_file_path: str):
+        with open(src_file_path, "rb", BUFFER_SIZE) as src:
+            self._parse_header(src)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            segment_file_paths = [
+                str(Path(tmp_dir) / f"segment{i}.{DECOMP_FILE_EXTENSION}") for i in range(len(self._segment_offsets))
+            ]
+
+            code_parts(_decode_segment, [
+                (src_file_path, offset, size, segment, self._primer or None)
+                for offset, size, segment in zip(self._segment_offsets, self._segment_sizes, segment_file_paths)
+            ], self._workers)
+
+            decomp_bytes = concat_parts(segment_file_paths, decomp_file_path)
+            assert decomp_bytes == self._total_bytes
+
+    def _parse_header(self, file_obj: BinaryIO):
+        """
+            format id: 1 byte
+            bits per symbol: 1 byte
+            total bytes: 8 bytes
+            primer size: 2 bytes
+            primer: {symbol}{weight}{symbol}{weight}...
+                symbol: `bytes_per_symbol` bytes
+                weight: 1 byte
+            segment count: 4 bytes
+            segment table: {offset}{size}{offset}{size}...
+                offset of the compressed segment from the beginning of the file: 8 bytes
+                size of the compressed segment: 8 bytes
+            compressed segments: a complete adaptive compressed file per segment
+        """
+
+        stream = BitInStream(file_obj, mode=IO_MODE_BYTE)
+        assert ord(stream.read(1)) == SEGMENT_FORMAT_ID
+
+        self._bits_per_symbol = ord(stream.read(1))
+        self._bytes_per_symbol = self._bits_per_symbol // BITS_PER_BYTE
+        self._total_bytes = extended_ord(stream.read(TOTAL_BYTES_SIZE))
+
+        for _ in range(extended_ord(stream.read(PRIMER_SIZE_SIZE))):
+            symbol = stream.read(self._bytes_per_symbol)
+            self._primer.append((symbol, ord(stream.read(1))))
+
+        for _ in range(extended_ord(stream.read(SEGMENT_CNT_SIZE))):
+            offset, size = read_part_entry(stream)
+            self._segment_offsets.append(offset)
+            self._segment_sizes.append(size)
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    verbose = int(kwargs.get("v", 0))
+    workers = int(kwargs["workers"]) if "workers" in kwargs else None
+    decoder = SegmentDecoder(verbose, workers)
+
+    src = kwargs["in"]
+    decomp = kwargs.get("out", f"{src}.{DECOMP_FILE_EXTENSION}")
+    decoder.decode(src, decomp)
@@ -0,0 +1,209 @@
+from typing import List, Optional, Tuple
+from pathlib import Path
+import tempfile
+import sys
+import os
+
+from base_coder import BaseEncoder
+from utils import (
+    BITS_PER_BYTE,
+    BUFFER_SIZE,
+    BYTES_PER_MB,
+    COMP_FILE_EXTENSION,
+    SEGMENT_FORMAT_ID,
+    extended_chr,
+)
+from bit_io_stream import BitOutStream, IO_MODE_BYTE
+from parts import PART_OFFSET_SIZE, code_parts, part_offsets, write_part_entry, extract_part, concat_parts
+from adaptive_encoder import AdaptiveEncoder
+from estimator import CompressibilityEstimator
+
+
+TOTAL_BYTES_SIZE = 8  # bytes used to store the size of the source file
+SEGMENT_CNT_SIZE = 4  # bytes used to store the number of segments
+PRIMER_SIZE_SIZE = 2  # bytes used to store the number of primer symbols
+MAX_PRIMER_WEIGHT = 2 ** BITS_PER_BYTE - 1
+PRIMER_TOTAL_WEIGHT = 1024  # the primer weights are scaled to about this many symbols
+
+
+def _encode_segment(
+    src_file_path: str,
+    offset: int,
+    size: int,
+    comp_file_path: str,
+    bytes_per_symbol: int,
+    chunk_size: int,
+    shrink_factor: int,
+    primer: Optional[List[Tuple[str, int]]],
+):
+    # each segment is coded into a complete adaptive compressed file, with a fresh tree
+    segment_file_path = f"{comp_file_path}.src"
+    extract_part(src_file_path, offset, size, segment_file_path)
+
+    AdaptiveEncoder(
+        bytes_per_symbol, chunk_size=chunk_size, shrink_factor=shrink_factor, primer=primer,
+    ).encode(segment_file_path, comp_file_path)
+    os.remove(segment_file_path)
+
+
+class SegmentEncoder(BaseEncoder):
+    # the source file is cut into segments of `segment_size` Mb, each coded independently by an adaptive encoder
+
+    def __init__(
+        self,
+        bytes_per_symbol: int,
+        verbose: int = 0,
+        segment_size: int = 16,
+        chunk_size: int = 0,
+        shrink_factor: int = 2,
+        primer_size: int = 0,
+        workers: int = None,
+        timeline: int = 0,
+    ):
+        super().__init__(bytes_per_symbol, verbose, timeline=timeline)
+
+        assert segment_size > 0
+        assert 0 <= primer_size < 2 ** (PRIMER_SIZE_SIZE * BITS_PER_BYTE)
+        self._segment_size: int = segment_size  # in Mb
+        self._chunk_size: int = chunk_size
+        self._shrink_factor: int = shrink_factor
+        self._primer_size: int = primer_size  # number of most frequent symbols priming every tree, 0 for no priming
+        self._workers: int = workers
+
+        self._primer: List[Tuple[str, int]] = []
+        self._segment_sizes: List[int] = []  # size of each compressed segment
+
+    def encode(self, src_file_path: str, comp_file_path: str):
+        self._src_bytes = os.path.getsize(src_file_path)
+        if self._primer_size > 0:
+            self._primer = self._build_primer(src_file_path)
+
+        segment_bytes = self._segment_size * BYTES_PER_MB
+        segment_bytes -= segment_bytes % self._bytes_per_symbol  # segments hold whole symbols
+        offsets = list(range(0, self._src_bytes, segment_bytes))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            comp_segment_file_paths = [str(Path(tmp_dir) / f"segment{i}.{COMP_FILE_EXTENSION}") for i in range(len(offsets))]
+
+            sizes = [min(segment_bytes, self._src_bytes - offset) for offset in offsets]
+            self._start_timeline()
+            with open(src_file_path, "rb", BUFFER_SIZE) as src:
+                # the segments are read in order, right after each other
+                code_parts(_encode_segment, [
+                    (
+                        src_file_path, offset, size, comp,
+                        self._bytes_per_symbol, self._chunk_size, self._shrink_factor, self._primer or None,
+                    )
+                    for offset, size, comp in zip(offsets, sizes, comp_segment_file_paths)
+                ], self._workers, on_part=lambda i: self._update_timeline_with_part(
+                    src, sizes[i], os.path.getsize(comp_segment_file_paths[i]) * BITS_PER_BYTE,
+                ))
+
+            self._segment_sizes = [os.path.getsize(p) for p in comp_segment_file_paths]
+
+            self._write_header(comp_file_path)
+            concat_parts(comp_segment_file_paths, comp_file_path, "ab")
+
+    def export_results(self, export_path: Path):
+        with open(export_path, "w") as f:
+            f.write(f"{'='*10} params {'='*10}\n")
+            f.write(f"bytes per symbol: {self._bytes_per_symbol}\n")
+            f.write(f"segment size: {self._segment_size}\n")
+            f.write(f"chunk size: {self._chunk_size}\n")
+            f.write(f"shrink factor: {self._shrink_factor}\n")
+            f.write(f"primer size: {self._primer_size}\n")
+
+            f.write(f"\n{'='*10} statistics {'='*10}\n")
+            f.write(f"total bytes: {self._src_bytes}\n")
+            f.write(f"primer symbols: {len(self._primer)}\n")
+            f.write(f"segment sizes: {self._segment_sizes}\n")
+            f.write(f"compression ratio: {self.compression_ratio}\n")
+
+    def _build_primer(self, src_file_path: str) -> List[Tuple[str, int]]:
+        # the most frequent symbols of a sample, weighted in proportion to their counts
+        dist = CompressibilityEstimator(self._bytes_per_symbol).sample_distribution(src_file_path)
+        most_common = dist.most_common(self._primer_size)
+        total = sum(cnt for _, cnt in most_common)
+
+        primer = []
+        for symbol, cnt in most_common:
+            symbol = chr(symbol) if isinstance(symbol, int) else symbol.decode("latin-1")
+            weight = min(MAX_PRIMER_WEIGHT, max(1, round(cnt * PRIMER_TOTAL_WEIGHT / total)))
+            primer.append((symbol, weight))
+
+        return primer
+
+    def _write_header(self, comp_file_path: str):
+        """
+            format id: 1 byte
+            bits per symbol: 1 byte
+            total bytes: 8 bytes
+            primer size: 2 bytes
+            primer: {symbol}{weight}{symbol}{weight}...
+                symbol: `bytes_per_symbol` bytes
+                weight: 1 byte
+            segment count: 4 bytes
+            segment table: {offset}{size}{offset}{size}...
+                offset of the compressed segment from the beginning of the file: 8 bytes
+                size of the compressed segment: 8 bytes
+            compressed segments: a complete adaptive compressed file per segment
+        """
+
+        with open(comp_file_path, "wb") as f:
+            stream = BitOutStream(f, mode=IO_MODE_BYTE)
+            stream.write(chr(SEGMENT_FORMAT_ID))
+            stream.write(chr(self._bits_per_symbol))
+            stream.write(extended_chr(self._src_bytes, TOTAL_BYTES_SIZE * BITS_PER_BYTE))
+
+            stream.write(extended_chr(len(self._primer), PRIMER_SIZE_SIZE * BITS_PER_BYTE))
+            for symbol, weight in self._primer:
+                stream.write(symbol)
+                stream.write(chr(weight))
+
+            stream.write(extended_chr(len(self._segment_sizes), SEGMENT_CNT_SIZE * BITS_PER_BYTE))
+            for offset, size in zip(part_offsets(self._get_header_size(), self._segment_sizes), self._segment_sizes):
+                write_part_entry(stream, offset, size)
+
+    def _get_header_size(self) -> int:
+        header_size = 2 + TOTAL_BYTES_SIZE  # format id, bits per symbol, total bytes
+        header_size += PRIMER_SIZE_SIZE + len(self._primer) * (self._bytes_per_symbol + 1)
+        header_size += SEGMENT_CNT_SIZE + len(self._segment_sizes) * 2 * PART_OFFSET_SIZE
+        return header_size
+
+
+if __name__ == "__main__":
+    kwargs = dict([arg.split("=") for arg in sys.argv[1:]])
+
+    export_path = kwargs.get("export", None)
+    if export_path:
+        export_path = Path(export_path)
+        if export_path.exists():
+            raise AssertionError(f"{export_path} already exists")
+
+    timeline_path = kwargs.get("timeline", None)
+    if timeline_path:
+        timeline_path = Path(timeline_path)
+        if timeline_path.exists():
+            raise AssertionError(f"{timeline_path} already exists")
+
+    bytes_per_symbol = int(kwargs.get("b", 1))
+    verbose = int(kwargs.get("v", 0))
+    segment_size = int(kwargs.get("S", 16))
+    chunk_size = int(kwargs.get("K", 0))
+    shrink_factor = int(kwargs.get("alpha", 2))
+    primer_size = int(kwargs.get("prime", 0))
+    workers = int(kwargs["workers"]) if "workers" in kwargs else None
+    timeline = int(kwargs.get("T", 1)) if timeline_path else 0
+
+    src = kwargs["in"]
+    comp = kwargs.get("out", f"{src}.{COMP_FILE_EXTENSION}")
+
+    encoder = SegmentEncoder(
+        bytes_per_symbol, verbose, segment_size, chunk_size, shrink_factor, primer_size, workers, timeline,
+    )
+    encoder.encode(src, comp)
+
+    if export_path:
+        encoder.export_results(export_path)
+    if timeline_path:
+        encoder.export_timeline(timeline_path)
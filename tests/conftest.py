@@ -0,0 +1,22 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+
+# the modules live at the root of the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def round_trip(tmp_path):
+    # encode `data` with `encoder` and decode it with `decoder`, return the decoded bytes
+    def run(encoder, decoder, data: bytes) -> bytes:
+        src, comp, dst = tmp_path / "src", tmp_path / "comp", tmp_path / "dst"
+        src.write_bytes(data)
+        encoder.encode(str(src), str(comp))
+        decoder.decode(str(comp), str(dst))
+        return dst.read_bytes()
+
+    return run
+
@@ -0,0 +1,9 @@
+import random
+
+
+def all_distinct(bytes_per_symbol: int, symbol_cnt: int) -> bytes:
+    # `symbol_cnt` distinct symbols of `bytes_per_symbol` bytes, shuffled
+    rng = random.Random(symbol_cnt)
+    symbols = list(range(symbol_cnt))
+    rng.shuffle(symbols)
+    return b"".join(symbol.to_bytes(bytes_per_symbol, "big") for symbol in symbols)
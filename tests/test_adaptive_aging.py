@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+from adaptive_encoder import AdaptiveEncoder
+from adaptive_decoder import AdaptiveDecoder
+from adaptive_huffman_tree import AGING_FULL, AGING_INCREMENTAL
+from helpers import all_distinct
+
+
+@pytest.mark.parametrize("aging", [AGING_FULL, AGING_INCREMENTAL])
+@pytest.mark.parametrize("bytes_per_symbol, data", [
+    (1, all_distinct(1, 256) * 8),
+    (1, b"a" * 3000 + os.urandom(1000) + b"ab" * 1000),
+    (2, all_distinct(2, 1000)),
+], ids=["all distinct", "mixed", "all distinct wide"])
+def test_shrink_period(round_trip, aging, bytes_per_symbol, data):
+    encoder = AdaptiveEncoder(bytes_per_symbol, shrink_period=300, aging=aging)
+    assert round_trip(encoder, AdaptiveDecoder(), data) == data
+
+
+def test_drift(round_trip):
+    # the distribution changes abruptly twice
+    data = b"abcd" * 2000 + all_distinct(1, 256) * 8 + b"xy" * 2000
+    encoder = AdaptiveEncoder(1, drift_window=256, drift_threshold=0.5)
+    assert round_trip(encoder, AdaptiveDecoder(), data) == data
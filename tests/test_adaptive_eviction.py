@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from adaptive_encoder import AdaptiveEncoder
+from adaptive_decoder import AdaptiveDecoder
+from adaptive_huffman_tree import AGING_INCREMENTAL
+from helpers import all_distinct
+
+
+@pytest.mark.parametrize("params", [
+    dict(shrink_period=10, evict_after=1),
+    dict(shrink_period=10, evict_after=1, aging=AGING_INCREMENTAL),
+    dict(drift_window=64, drift_threshold=0.1, evict_after=1),
+])
+def test_evict_every_leaf(round_trip, params):
+    # every leaf is cold at each shrink, the tree falls back to the NYT alone
+    data = bytes(range(256)) * 4
+    assert round_trip(AdaptiveEncoder(1, **params), AdaptiveDecoder(0), data) == data
+
+
+def test_evict_all_distinct_wide_symbols(round_trip):
+    data = all_distinct(2, 5000)
+    assert round_trip(AdaptiveEncoder(2, shrink_period=10, evict_after=1), AdaptiveDecoder(0), data) == data
+
+
+def test_evict_random(round_trip):
+    data = os.urandom(20000)
+    assert round_trip(AdaptiveEncoder(2, shrink_period=100, evict_after=2), AdaptiveDecoder(0), data) == data
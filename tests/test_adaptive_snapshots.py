@@ -0,0 +1,45 @@
+import time
+import os
+
+import pytest
+
+import adaptive_encoder
+from adaptive_encoder import AdaptiveEncoder
+from adaptive_decoder import AdaptiveDecoder
+from utils import SNAPSHOT_FILE_EXTENSION
+
+
+DATA = bytes(range(256)) + b"snapshots index the adaptive stream for range decoding. " * 600
+
+
+@pytest.fixture
+def comp(tmp_path, monkeypatch) -> str:
+    # a snapshot every 4000 bytes instead of every Mb
+    monkeypatch.setattr(adaptive_encoder, "BYTES_PER_MB", 4000)
+    src, comp = tmp_path / "src", tmp_path / "comp"
+    src.write_bytes(DATA)
+    AdaptiveEncoder(1, shrink_period=1000, snapshot_size=1).encode(str(src), str(comp))
+    assert os.path.getsize(f"{comp}.{SNAPSHOT_FILE_EXTENSION}") > 0
+    return str(comp)
+
+
+def test_round_trip(comp, tmp_path):
+    AdaptiveDecoder().decode(comp, str(tmp_path / "dst"))
+    assert (tmp_path / "dst").read_bytes() == DATA
+
+
+def test_decode_range(comp):
+    decoder = AdaptiveDecoder()
+    for start, size in [(0, 10), (5000, 3000), (len(DATA) - 100, 1000), (12345, 1)]:
+        assert decoder.decode_range(comp, start, size) == DATA[start:start+size]
+
+
+def test_decode_empty_range(tmp_path):
+    # without snapshots, decoding up to `start` would go through the whole stream
+    src, comp = tmp_path / "src", tmp_path / "comp"
+    src.write_bytes(DATA)
+    AdaptiveEncoder(1).encode(str(src), str(comp))
+
+    start = time.perf_counter()
+    assert AdaptiveDecoder().decode_range(str(comp), len(DATA) - 1, 0) == b""
+    assert time.perf_counter() - start < 0.1
@@ -0,0 +1,71 @@
+import os
+import random
+
+import pytest
+
+from ans_table import ANSTable, MAX_TABLE_LOG, normalize_counts, select_table_log
+from encoder import Encoder, SAMPLE_LEAD
+from decoder import Decoder
+from helpers import all_distinct
+
+
+def table_round_trip(dist, symbols, escape=None, bits_per_symbol=8):
+    table_log = select_table_log(len(dist))
+    counts = normalize_counts(dist, table_log)
+    assert sum(counts.values()) == 2 ** table_log and min(counts.values()) > 0
+
+    table = ANSTable(counts, table_log, escape, bits_per_symbol)
+    state, bits = table.encode(symbols)
+    return table.decode(state, bits, len(symbols))
+
+
+def test_skewed_table():
+    rng = random.Random(0)
+    dist = {"a": 10 ** 6, "b": 1000, "c": 10, "d": 1}
+    symbols = rng.choices(list(dist), weights=list(dist.values()), k=5000) + list("dcba")
+    assert table_round_trip(dist, symbols) == "".join(symbols)
+
+
+def test_all_distinct_table():
+    # every symbol has the smallest count
+    symbols = [chr(i) for i in range(256)]
+    dist = {symbol: 1 for symbol in symbols}
+    assert table_round_trip(dist, symbols) == "".join(symbols)
+
+
+def test_escaped_symbols():
+    dist = {"a": 100, "b": 50, "\x00\x00": 10}
+    symbols = ["a", "b", "\x12\x34", "a", "\xff\xff"]
+    assert table_round_trip(dist, symbols, escape="\x00\x00", bits_per_symbol=16) == "".join(symbols)
+
+
+def test_too_many_symbols():
+    assert select_table_log(2 ** (MAX_TABLE_LOG - 1)) is None
+
+
+@pytest.mark.parametrize("bytes_per_symbol, symbol_cnt", [(1, 256), (2, 5000), (2, 2 ** (MAX_TABLE_LOG - 1))])
+def test_all_distinct(round_trip, bytes_per_symbol, symbol_cnt):
+    # the largest alphabet does not fit in a table, and is coded by the huffman table only
+    data = all_distinct(bytes_per_symbol, symbol_cnt)
+    encoder = Encoder(bytes_per_symbol, block_size=2000 * bytes_per_symbol, ans=True)
+    assert round_trip(encoder, Decoder(), data) == data
+
+
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2, 3])
+def test_many_distinct(round_trip, bytes_per_symbol):
+    # skewed counts, where the table saves a fraction of a bit per symbol, between stored blocks
+    rng = random.Random(0)
+    skewed = bytes(rng.choices(b"abc", weights=[90, 9, 1], k=20000))
+    data = skewed + os.urandom(6001) + all_distinct(bytes_per_symbol, 256) + skewed
+    encoder = Encoder(bytes_per_symbol, block_size=3000, ans=True)
+    assert round_trip(encoder, Decoder(workers=2), data) == data
+    if bytes_per_symbol == 1:
+        # wider symbols spread the counts over too many symbols for the table to be worth its header
+        assert encoder.ans_avg_codeword_len < encoder.avg_codeword_len
+
+
+def test_escape(round_trip):
+    # symbols missing from the sample are escaped in the table too
+    data = b"abab" * 1000 + os.urandom(3000)
+    encoder = Encoder(2, block_size=2000, ans=True, sample=SAMPLE_LEAD, sample_size=1000)
+    assert round_trip(encoder, Decoder(), data) == data
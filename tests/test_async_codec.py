@@ -0,0 +1,46 @@
+import asyncio
+import os
+
+import pytest
+
+from async_codec import encode_stream, decode_stream
+from codec import CODER_STATIC, CODER_ADAPTIVE
+from helpers import all_distinct
+
+
+class _Sink:
+    # the part of asyncio.StreamWriter the adapters use
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data: bytes):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def _reader(data: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+async def _round_trip(data: bytes, coder: str, bytes_per_symbol: int, chunk_size: int) -> bytes:
+    comp, decomp = _Sink(), _Sink()
+    await encode_stream(_reader(data), comp, coder, bytes_per_symbol, chunk_size)
+    await decode_stream(_reader(bytes(comp.data)), decomp)
+    return bytes(decomp.data)
+
+
+@pytest.mark.parametrize("coder", [CODER_STATIC, CODER_ADAPTIVE])
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2])
+def test_round_trip(coder, bytes_per_symbol):
+    # chunks of a single symbol, all distinct symbols and random data
+    data = b"a" * 4000 + all_distinct(bytes_per_symbol, 256) + os.urandom(3001)
+    assert asyncio.run(_round_trip(data, coder, bytes_per_symbol, 2000)) == data
+
+
+def test_empty():
+    assert asyncio.run(_round_trip(b"", CODER_STATIC, 1, 2000)) == b""
@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from estimator import select_bytes_per_symbol
+from encoder import Encoder
+from decoder import Decoder
+
+
+@pytest.fixture
+def words(tmp_path) -> str:
+    # records of 4 bytes drawn from 20 distinct words
+    rng = random.Random(0)
+    words = [rng.randbytes(4) for _ in range(20)]
+    path = tmp_path / "words"
+    path.write_bytes(b"".join(rng.choice(words) for _ in range(50000)))
+    return str(path)
+
+
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_select_record_width(words, adaptive):
+    assert select_bytes_per_symbol(words, adaptive=adaptive) == 4
+
+
+def test_select_byte_width(tmp_path):
+    rng = random.Random(0)
+    path = tmp_path / "bytes"
+    path.write_bytes(bytes(rng.choice(b"abcdefgh") for _ in range(200000)))
+    assert select_bytes_per_symbol(str(path)) == 1
+
+
+def test_alphabet_bound(words):
+    # the 4 bytes alphabet does not fit, the smallest width is kept even if its own does not either
+    assert select_bytes_per_symbol(words, max_symbols=10, candidates=[2, 4]) == 2
+
+
+def test_round_trip(words, tmp_path):
+    b = select_bytes_per_symbol(words)
+    Encoder(b).encode(words, str(tmp_path / "comp"))
+    Decoder().decode(str(tmp_path / "comp"), str(tmp_path / "dst"))
+    assert (tmp_path / "dst").read_bytes() == open(words, "rb").read()
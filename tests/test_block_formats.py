@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from encoder import Encoder
+from decoder import Decoder
+from helpers import all_distinct
+
+
+TEXT = b"static huffman blocks, stored blocks and interleaved streams. " * 400
+MIXED = TEXT[:8000] + os.urandom(8000) + TEXT[8000:]
+
+
+@pytest.mark.parametrize("params", [
+    dict(block_size=4000),
+    dict(block_size=4000, streams=3),
+    dict(block_size=4000, ans=True),
+])
+@pytest.mark.parametrize("workers", [1, 0, 2])
+def test_round_trip(round_trip, params, workers):
+    assert round_trip(Encoder(1, **params), Decoder(workers=workers), MIXED) == MIXED
+
+
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2])
+def test_all_distinct(round_trip, bytes_per_symbol):
+    data = all_distinct(bytes_per_symbol, 256 if bytes_per_symbol == 1 else 3000)
+    encoder = Encoder(bytes_per_symbol, block_size=1000 * bytes_per_symbol, streams=2)
+    assert round_trip(encoder, Decoder(workers=2), data) == data
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from encoder import Encoder
+from decoder import Decoder
+from helpers import all_distinct
+import encoder
+
+
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2, 3])
+def test_many_distinct_symbols(round_trip, bytes_per_symbol):
+    # many more distinct symbols than the histogram holds, the rare ones are escaped
+    data = b"xyz" * 5000 + all_distinct(bytes_per_symbol, min(5000, 256 ** bytes_per_symbol)) + os.urandom(3001)
+    coder = Encoder(bytes_per_symbol, max_memory=64 * encoder.SYMBOL_MEMORY)
+    assert round_trip(coder, Decoder(), data) == data
+
+
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2])
+def test_all_distinct(round_trip, bytes_per_symbol):
+    # no symbol is kept, every one is escaped
+    data = all_distinct(bytes_per_symbol, 256 * bytes_per_symbol)
+    coder = Encoder(bytes_per_symbol, max_memory=4 * encoder.SYMBOL_MEMORY)
+    assert round_trip(coder, Decoder(), data) == data
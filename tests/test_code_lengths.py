@@ -0,0 +1,68 @@
+import heapq
+import random
+
+import pytest
+
+from huffman_tree import HuffmanTree, huffman_code_lengths
+from encoder import Encoder
+from decoder import Decoder
+from helpers import all_distinct
+
+
+def reference_cost(counts):
+    # total coded bits of a huffman code built with a heap
+    heap = list(counts)
+    heapq.heapify(heap)
+    cost = 0
+    while len(heap) > 1:
+        merged = heapq.heappop(heap) + heapq.heappop(heap)
+        cost += merged
+        heapq.heappush(heap, merged)
+    return cost
+
+
+def fibonacci(n):
+    fib = [1, 1]
+    while len(fib) < n:
+        fib.append(fib[-1] + fib[-2])
+    return fib
+
+
+rng = random.Random(0)
+DISTRIBUTIONS = [
+    {"a": 1, "b": 1},
+    {chr(i): 1 for i in range(256)},  # all distinct
+    {chr(i): rng.randint(1, 10 ** 6) for i in range(1000)},
+    {chr(i): cnt for i, cnt in enumerate(fibonacci(40))},  # as deep as possible
+]
+
+
+def test_single_symbol():
+    assert huffman_code_lengths({"a": 7}) == {"a": 1}
+
+
+@pytest.mark.parametrize("dist", DISTRIBUTIONS, ids=lambda dist: f"{len(dist)} symbols")
+def test_optimal_and_complete(dist):
+    code_lens = huffman_code_lengths(dist)
+    assert code_lens.keys() == dist.keys()
+    assert sum(dist[symbol] * code_lens[symbol] for symbol in dist) == reference_cost(dist.values())
+    assert sum(2 ** -code_len for code_len in code_lens.values()) == 1
+
+
+@pytest.mark.parametrize("dist", DISTRIBUTIONS, ids=lambda dist: f"{len(dist)} symbols")
+def test_tree_matches_code_lengths(dist):
+    tree = HuffmanTree(symbol_distribution=dist)
+    code_lens = huffman_code_lengths(dist)
+    assert {symbol: len(code) for symbol, code in tree.code_dict.items()} == code_lens
+
+
+@pytest.mark.parametrize("bytes_per_symbol, symbol_cnt", [(1, 256), (2, 20000)])
+def test_all_distinct(round_trip, bytes_per_symbol, symbol_cnt):
+    data = all_distinct(bytes_per_symbol, symbol_cnt)
+    assert round_trip(Encoder(bytes_per_symbol), Decoder(), data) == data
+
+
+def test_many_distinct(round_trip):
+    rng = random.Random(0)
+    data = bytes(rng.choice(range(256)) for _ in range(60000)) + bytes(range(256)) * 10
+    assert round_trip(Encoder(2), Decoder(), data) == data
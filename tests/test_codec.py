@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import codec
+from codec import CoderPool, CODER_IDS, CODER_STATIC, CODER_ADAPTIVE, CODER_LZ
+from helpers import all_distinct
+
+
+CODERS = sorted(CODER_IDS)
+PAYLOADS = {
+    "text": b"bytes in, bytes out. " * 200,
+    "random": os.urandom(1501),
+    "all distinct": all_distinct(2, 1000),
+}
+
+
+def widths(coder):
+    return [1] if coder == CODER_LZ else [1, 2, 3]
+
+
+@pytest.mark.parametrize("coder, bytes_per_symbol", [(c, b) for c in CODERS for b in widths(c)])
+@pytest.mark.parametrize("payload", sorted(PAYLOADS))
+def test_round_trip(coder, bytes_per_symbol, payload):
+    data = PAYLOADS[payload]
+    assert codec.decompress(codec.compress(data, coder, bytes_per_symbol)) == data
+
+
+@pytest.mark.parametrize("data", [b"", b"a", b"aaaa"])
+def test_single_symbol_falls_back_to_adaptive(data):
+    comp = codec.compress(data, CODER_STATIC)
+    assert data == b"" or comp[0] == CODER_IDS[CODER_ADAPTIVE]
+    assert codec.decompress(comp) == data
+
+
+@pytest.mark.parametrize("tree_cache", [None, {}])
+def test_pooled_coders_are_reset(tree_cache):
+    # the same idle coders code every payload, in turn
+    pool = CoderPool(capacity=1, tree_cache=tree_cache)
+    for _ in range(2):
+        for coder in CODERS:
+            for payload in sorted(PAYLOADS):
+                data = PAYLOADS[payload]
+                assert codec.decompress(codec.compress(data, coder, pool=pool), pool=pool) == data
+
+
+def test_shared_pool_across_threads():
+    pool = CoderPool()
+    payloads = [os.urandom(1000) + bytes([i]) * 1000 for i in range(16)]
+
+    def round_trip(data):
+        return codec.decompress(codec.compress(data, CODER_STATIC, 2, pool=pool), pool=pool)
+
+    with ThreadPoolExecutor(4) as executor:
+        assert list(executor.map(round_trip, payloads)) == payloads
+
+
+def test_not_a_payload():
+    with pytest.raises(AssertionError, match="not a compressed payload"):
+        codec.decompress(b"\x00abc")
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+import container_encoder
+from container_encoder import ContainerEncoder, FRAME_STATIC, FRAME_ADAPTIVE, CONTAINER_MAGIC, ORIGINAL_LEN_SIZE
+from container_decoder import ContainerDecoder
+from helpers import all_distinct
+
+
+@pytest.fixture(autouse=True)
+def small_frames(monkeypatch):
+    # cut a few frames without megabyte sized files
+    monkeypatch.setattr(container_encoder, "BYTES_PER_MB", 2000)
+
+
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2, 3])
+@pytest.mark.parametrize("frame_type", [FRAME_STATIC, FRAME_ADAPTIVE])
+def test_round_trip(round_trip, bytes_per_symbol, frame_type):
+    # the last frame may end with a partial symbol
+    data = b"frames " * 500 + os.urandom(3001)
+    coder = ContainerEncoder(bytes_per_symbol, frame_type=frame_type, frame_size=1)
+    assert round_trip(coder, ContainerDecoder(), data) == data
+
+
+@pytest.mark.parametrize("frame_type", [FRAME_STATIC, FRAME_ADAPTIVE])
+def test_all_distinct(round_trip, frame_type):
+    data = all_distinct(2, 3000)
+    coder = ContainerEncoder(2, frame_type=frame_type, frame_size=1)
+    assert round_trip(coder, ContainerDecoder(), data) == data
+
+
+def test_append(tmp_path):
+    first, second = b"first " * 500, all_distinct(2, 1000)
+    (tmp_path / "a").write_bytes(first)
+    (tmp_path / "b").write_bytes(second)
+    comp, dst = str(tmp_path / "comp"), str(tmp_path / "dst")
+
+    ContainerEncoder(1, frame_size=1).encode(str(tmp_path / "a"), comp)
+    ContainerEncoder(2, frame_type=FRAME_ADAPTIVE, frame_size=1).append(str(tmp_path / "b"), comp)
+    ContainerDecoder().decode(comp, dst)
+    assert (tmp_path / "dst").read_bytes() == first + second
+
+
+def test_concatenated_containers(tmp_path):
+    first, second = b"first " * 500, b"second " * 500
+    for name, data in [("a", first), ("b", second)]:
+        (tmp_path / name).write_bytes(data)
+        ContainerEncoder(1, frame_size=1).encode(str(tmp_path / name), str(tmp_path / f"{name}.comp"))
+
+    (tmp_path / "comp").write_bytes((tmp_path / "a.comp").read_bytes() + (tmp_path / "b.comp").read_bytes())
+    ContainerDecoder().decode(str(tmp_path / "comp"), str(tmp_path / "dst"))
+    assert (tmp_path / "dst").read_bytes() == first + second
+
+
+def test_corrupt_frame(tmp_path):
+    (tmp_path / "src").write_bytes(b"frames " * 100)
+    ContainerEncoder(1).encode(str(tmp_path / "src"), str(tmp_path / "comp"))
+
+    comp = bytearray((tmp_path / "comp").read_bytes())
+    comp[len(CONTAINER_MAGIC) + 1 + 1 + ORIGINAL_LEN_SIZE] ^= 0xff  # the checksum of the first frame
+    (tmp_path / "comp").write_bytes(bytes(comp))
+    with pytest.raises(AssertionError, match="checksum mismatch"):
+        ContainerDecoder().decode(str(tmp_path / "comp"), str(tmp_path / "dst"))
+
+
+def test_empty_file(round_trip):
+    assert round_trip(ContainerEncoder(1), ContainerDecoder(), b"") == b""
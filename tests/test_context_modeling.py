@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from adaptive_encoder import AdaptiveEncoder
+from adaptive_decoder import AdaptiveDecoder
+from helpers import all_distinct
+
+
+@pytest.mark.parametrize("context_trees", [1, 4, 256])
+def test_all_distinct(round_trip, context_trees):
+    data = all_distinct(1, 256) * 4
+    assert round_trip(AdaptiveEncoder(1, context_trees=context_trees), AdaptiveDecoder(), data) == data
+
+
+def test_tree_eviction(round_trip):
+    # many more contexts than trees, the least recently used trees are evicted
+    data = all_distinct(1, 256) + os.urandom(5000)
+    encoder = AdaptiveEncoder(1, context_trees=8, shrink_period=500)
+    assert round_trip(encoder, AdaptiveDecoder(), data) == data
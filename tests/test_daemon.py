@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import multiprocessing
+import threading
+import asyncio
+import socket
+import signal
+import json
+import time
+import os
+
+import pytest
+
+import daemon
+from daemon import CompressionDaemon, DaemonClient
+
+
+def start_daemon(socket_path: str, **kwargs) -> str:
+    server = CompressionDaemon(socket_path, **kwargs)
+    threading.Thread(target=lambda: asyncio.run(server.serve()), daemon=True).start()
+
+    deadline = time.time() + 30
+    while not os.path.exists(socket_path):
+        assert time.time() < deadline
+        time.sleep(0.05)
+    return socket_path
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = DaemonClient(start_daemon(str(tmp_path / "huffman.sock"), workers=1, timeout=1))
+    yield client
+    client.close()
+
+
+# the workers are forked from the tests, and run these instead of daemon._decompress_bytes
+def slow_decompress(data: bytes, coder: str) -> bytes:
+    time.sleep(0.6)
+    return data
+
+
+def stuck_decompress(data: bytes, coder: str) -> bytes:
+    # does not give up at its deadline
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+    time.sleep(60)
+    return data
+
+
+def test_round_trip(client):
+    data = b"the daemon compresses and decompresses inline payloads " * 100
+    comp, coder = client.compress(data)
+    assert client.decompress(comp, coder) == data
+
+
+def test_malformed_payload(client):
+    for payload in (b"garbage", bytes((8, 0, 200)) + bytes(20)):
+        with pytest.raises(RuntimeError):
+            client.decompress(payload)
+
+    # the worker is still serving
+    comp, coder = client.compress(b"abcd" * 100)
+    assert client.decompress(comp, coder) == b"abcd" * 100
+
+
+def test_job_deadline(client):
+    with pytest.raises(RuntimeError, match="TimeoutError"):
+        client.compress(os.urandom(400000), "adaptive", 2)
+
+    comp, coder = client.compress(b"abcd" * 100)
+    assert client.decompress(comp, coder) == b"abcd" * 100
+    assert client.stats()["timed out jobs"] == 1
+
+
+def test_run_with_deadline():
+    handler = signal.signal(signal.SIGALRM, daemon._on_deadline)
+    try:
+        with pytest.raises(TimeoutError):
+            daemon._run_with_deadline(partial(time.sleep, 5), 0.1)
+        assert daemon._run_with_deadline(partial(sum, [1, 2]), 0.1) == 3
+    finally:
+        signal.signal(signal.SIGALRM, handler)
+
+
+def test_queued_jobs_are_not_timed_out(tmp_path, monkeypatch):
+    # the second job waits for the only worker longer than the deadline, but runs within it
+    monkeypatch.setattr(daemon, "_decompress_bytes", slow_decompress)
+    monkeypatch.setattr(daemon, "KILL_GRACE", 0.2)
+    socket_path = start_daemon(str(tmp_path / "huffman.sock"), workers=1, timeout=1)
+
+    def decompress(data):
+        client = DaemonClient(socket_path)
+        try:
+            return client.decompress(data)
+        finally:
+            client.close()
+
+    payloads = [bytes([i]) * 100 for i in range(3)]
+    with ThreadPoolExecutor(3) as executor:
+        assert list(executor.map(decompress, payloads)) == payloads
+
+    client = DaemonClient(socket_path)
+    assert client.stats()["timed out jobs"] == 0
+    client.close()
+
+
+def test_malformed_header(tmp_path):
+    socket_path = start_daemon(str(tmp_path / "huffman.sock"), workers=1)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        f = s.makefile("rwb")
+
+        # the requests pipelined after the bad headers are still served
+        f.write(b"not json\n" + b"[1, 2]\n" + b'{"op": "compress", "size": -1}\n' + b'{"op": "stats"}\n')
+        f.flush()
+        responses = [json.loads(f.readline()) for _ in range(4)]
+
+    assert [response["ok"] for response in responses] == [False, False, False, True]
+    assert "JSONDecodeError" in responses[0]["error"]
+
+
+def test_memory_limit_of_file_jobs(tmp_path):
+    socket_path = start_daemon(str(tmp_path / "huffman.sock"), workers=1, memory_limit=2 ** 26)
+    src = tmp_path / "src"
+    src.write_bytes(bytes(2 ** 23))
+
+    client = DaemonClient(socket_path)
+    with pytest.raises(RuntimeError, match="exceeds the memory limit"):
+        client.compress_file(str(src), str(tmp_path / "comp"))
+    client.close()
+
+
+def test_stuck_worker_is_replaced(tmp_path, monkeypatch):
+    monkeypatch.setattr(daemon, "_decompress_bytes", stuck_decompress)
+    monkeypatch.setattr(daemon, "KILL_GRACE", 0.2)
+    socket_path = start_daemon(str(tmp_path / "huffman.sock"), workers=1, timeout=0.5)
+
+    # another child of the process running the daemon is left alone
+    other = multiprocessing.Process(target=time.sleep, args=(60,))
+    other.start()
+    try:
+        client = DaemonClient(socket_path)
+        with pytest.raises(RuntimeError, match="its worker was killed"):
+            client.decompress(b"abcd")
+
+        # served by the new pool
+        comp, coder = client.compress(b"abcd" * 100)
+        assert len(comp) > 0
+        assert client.stats()["timed out jobs"] == 1
+        client.close()
+        assert other.is_alive()
+    finally:
+        other.kill()
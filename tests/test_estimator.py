@@ -0,0 +1,39 @@
+from adaptive_encoder import AdaptiveEncoder
+from encoder import Encoder
+from estimator import CompressibilityEstimator
+
+
+def test_adaptive_header_size(tmp_path):
+    # an empty source costs the header alone
+    encoder = AdaptiveEncoder(1)
+    src = tmp_path / "src"
+    src.write_bytes(b"")
+    encoder.encode(str(src), str(tmp_path / "comp"))
+
+    predicted = CompressibilityEstimator(1)._predict_adaptive_size(0, 0, 0)
+    assert predicted == encoder._get_header_size() == (tmp_path / "comp").stat().st_size
+
+
+def test_static_header_size(tmp_path):
+    data = b"ab" * 100
+    src = tmp_path / "src"
+    src.write_bytes(data)
+    encoder = Encoder(1)
+    encoder.encode(str(src), str(tmp_path / "comp"))
+
+    estimator = CompressibilityEstimator(1)
+    dist = {b"a": 100, b"b": 100}
+    assert estimator._predict_static_size(dist, 2, 0) == encoder._get_header_size()
+
+
+def test_static_header_size_with_escape(tmp_path):
+    # a partial sample escapes the unseen symbols, which have no entry in the code length dict
+    data = bytes(range(256)) + b"a" * 4000
+    src = tmp_path / "src"
+    src.write_bytes(data)
+    encoder = Encoder(1, sample="lead", sample_size=64)
+    encoder.encode(str(src), str(tmp_path / "comp"))
+
+    alphabet_size = len(encoder.code_dict) - 1
+    predicted = CompressibilityEstimator(1)._predict_static_size({b"a": 1}, alphabet_size, 0)
+    assert predicted == encoder._get_header_size()
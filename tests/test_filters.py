@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import filters
+from filters import FilterPipeline
+from encoder import Encoder
+from decoder import Decoder
+
+
+@pytest.mark.parametrize("spec", ["delta:1", "shuffle:3", "shuffle:4,delta:4", "delta:3,rle", "shuffle:3,delta:2"])
+def test_round_trip(round_trip, monkeypatch, spec):
+    # several blocks, none a multiple of 3 before rounding
+    monkeypatch.setattr(filters, "FILTER_BLOCK_SIZE", 1000)
+    data = bytes(i * 7 % 251 for i in range(5000)) + os.urandom(1001)
+    encoder = Encoder(1, filters=FilterPipeline.from_spec(spec))
+    assert round_trip(encoder, Decoder(), data) == data
+
+
+def test_block_size(monkeypatch):
+    monkeypatch.setattr(filters, "FILTER_BLOCK_SIZE", 1000)
+    assert FilterPipeline.from_spec("shuffle:3").block_size == 999
+    assert FilterPipeline.from_spec("shuffle:3,delta:2").block_size == 996
+    assert FilterPipeline.from_spec("delta:4").block_size == 1000
+    with pytest.raises(AssertionError, match="no common multiple"):
+        FilterPipeline.from_spec("shuffle:251,delta:211").block_size
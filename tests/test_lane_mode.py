@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from lane_encoder import LaneEncoder, LANE_CODER_STATIC, LANE_CODER_ADAPTIVE
+from lane_decoder import LaneDecoder
+from helpers import all_distinct
+
+
+@pytest.mark.parametrize("coder", [LANE_CODER_STATIC, LANE_CODER_ADAPTIVE])
+@pytest.mark.parametrize("lane_cnt", [1, 3, 4])
+def test_round_trip(round_trip, coder, lane_cnt):
+    data = all_distinct(4, 2000) + os.urandom(1001)
+    assert round_trip(LaneEncoder(lane_cnt, coder, workers=1), LaneDecoder(workers=1), data) == data
+
+
+def test_single_symbol_lanes(round_trip):
+    # every lane holds a single symbol, which the static coder cannot code alone
+    data = b"\x00\x01\x02\x03" * 1000
+    assert round_trip(LaneEncoder(4, workers=2), LaneDecoder(workers=2), data) == data
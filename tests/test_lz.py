@@ -0,0 +1,34 @@
+import os
+import random
+
+import pytest
+
+from lz_encoder import LZEncoder, LEVELS, MAX_MATCH
+from lz_decoder import LZDecoder
+from helpers import all_distinct
+
+
+TEXT = b"hash chains find the matches, huffman trees code them. " * 300
+
+
+@pytest.mark.parametrize("level", sorted(LEVELS))
+def test_levels(round_trip, level):
+    data = TEXT + os.urandom(3000) + TEXT[:5000]
+    assert round_trip(LZEncoder(level=level, block_size=4000), LZDecoder(), data) == data
+
+
+@pytest.mark.parametrize("data", [
+    b"a" * (10 * MAX_MATCH + 1),  # overlapping matches longer than the longest match
+    os.urandom(6000) * 5,  # matches across blocks, at distances beyond the window of level 1
+    all_distinct(1, 256) * 3,
+    all_distinct(2, 20000),  # every byte value, few matches
+    bytes(random.Random(0).choice(b"ab") for _ in range(20000)),
+], ids=["run", "repeats", "all distinct b=1", "all distinct b=2", "two symbols"])
+@pytest.mark.parametrize("level", [1, 9])
+def test_round_trip(round_trip, data, level):
+    assert round_trip(LZEncoder(level=level, block_size=5000), LZDecoder(), data) == data
+
+
+@pytest.mark.parametrize("data", [b"", b"a", b"ab", b"abc"])
+def test_short_files(round_trip, data):
+    assert round_trip(LZEncoder(), LZDecoder(), data) == data
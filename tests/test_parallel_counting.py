@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+import encoder
+from encoder import Encoder
+from decoder import Decoder
+from helpers import all_distinct
+
+
+@pytest.fixture(autouse=True)
+def small_ranges(monkeypatch):
+    # count in parallel without megabyte sized files
+    monkeypatch.setattr(encoder, "MIN_RANGE_SIZE", 1000)
+
+
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2, 3])
+def test_same_counts_as_serial(round_trip, bytes_per_symbol):
+    # a partial last symbol only ends the last range
+    data = os.urandom(10001)
+    parallel = Encoder(bytes_per_symbol, workers=3)
+    assert round_trip(parallel, Decoder(), data) == data
+    serial = Encoder(bytes_per_symbol)
+    assert round_trip(serial, Decoder(), data) == data
+    assert list(parallel.symbol_distributions.items()) == list(serial.symbol_distributions.items())
+
+
+@pytest.mark.parametrize("workers", [2, 4])
+def test_all_distinct(round_trip, workers):
+    data = all_distinct(2, 20000)
+    assert round_trip(Encoder(2, workers=workers), Decoder(), data) == data
+
+
+def test_file_too_small_to_split(round_trip):
+    data = b"abc" * 100
+    assert round_trip(Encoder(1, workers=4), Decoder(), data) == data
@@ -0,0 +1,36 @@
+import io
+
+from bit_io_stream import BitInStream, BitOutStream, IO_MODE_BYTE
+from parts import part_offsets, write_part_entry, read_part_entry, extract_part, concat_parts
+
+
+def test_part_offsets():
+    assert part_offsets(10, [3, 0, 5]) == [10, 13, 13]
+    assert part_offsets(10, []) == []
+
+
+def test_part_table_round_trip():
+    entries = [(0, 0), (26, 2 ** 40), (2 ** 63, 1)]
+    buffer = io.BytesIO()
+    stream = BitOutStream(buffer, mode=IO_MODE_BYTE)
+    for offset, size in entries:
+        write_part_entry(stream, offset, size)
+
+    buffer.seek(0)
+    stream = BitInStream(buffer, mode=IO_MODE_BYTE)
+    assert [read_part_entry(stream) for _ in entries] == entries
+
+
+def test_extract_and_concat(tmp_path):
+    data = bytes(range(256)) * 40
+    src = tmp_path / "src"
+    src.write_bytes(data)
+
+    bounds = [(0, 1000), (1000, 0), (1000, len(data) - 1000)]
+    part_file_paths = [str(tmp_path / f"part{i}") for i in range(len(bounds))]
+    for (offset, size), p in zip(bounds, part_file_paths):
+        extract_part(str(src), offset, size, p)
+
+    (tmp_path / "dst").write_bytes(b"head")
+    assert concat_parts(part_file_paths, str(tmp_path / "dst"), "ab") == 4 + len(data)
+    assert (tmp_path / "dst").read_bytes() == b"head" + data
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from range_encoder import RangeEncoder
+from range_decoder import RangeDecoder
+from frequency_model import FrequencyModel, MAX_SYMBOLS, MAX_TOTAL
+from helpers import all_distinct
+
+
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2, 3])
+def test_round_trip(round_trip, bytes_per_symbol):
+    data = os.urandom(3000) + b"abcd" * 5000 + os.urandom(1001)
+    assert round_trip(RangeEncoder(bytes_per_symbol, shrink_period=2000), RangeDecoder(), data) == data
+
+
+def test_all_distinct(round_trip):
+    data = bytes(range(256))
+    assert round_trip(RangeEncoder(1), RangeDecoder(), data) == data
+
+
+def test_many_distinct_symbols(round_trip):
+    # more than 2^16 distinct symbols, the model evicts to stay below MAX_SYMBOLS
+    data = all_distinct(3, 70000)
+    encoder = RangeEncoder(3)
+    assert round_trip(encoder, RangeDecoder(), data) == data
+    assert encoder._model.evict_cnt > 0
+
+
+def test_model_bounds():
+    model = FrequencyModel()
+    for i in range(3 * MAX_SYMBOLS):
+        model.add_symbol(str(i))
+        index = model.index_of(str(i % 100))
+        if index is not None:
+            model.update(index)
+
+        assert len(model) <= MAX_SYMBOLS and model.total < MAX_TOTAL
+    assert model.symbol_of(model.index_of(str(i))) == str(i)
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from result_cache import ResultCache
+from encoder import Encoder
+from decoder import Decoder
+from adaptive_encoder import AdaptiveEncoder
+from adaptive_decoder import AdaptiveDecoder
+from helpers import all_distinct
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "cache"), 10 ** 7)
+
+
+@pytest.mark.parametrize("encoder_type, decoder_type", [(Encoder, Decoder), (AdaptiveEncoder, AdaptiveDecoder)])
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2])
+def test_file_hit(tmp_path, round_trip, cache, encoder_type, decoder_type, bytes_per_symbol):
+    data = all_distinct(bytes_per_symbol, 256) + b"cached " * 500 + os.urandom(101)
+    assert round_trip(encoder_type(bytes_per_symbol, result_cache=cache), decoder_type(), data) == data
+    comp = (tmp_path / "comp").read_bytes()
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    assert round_trip(encoder_type(bytes_per_symbol, result_cache=cache), decoder_type(), data) == data
+    assert (tmp_path / "comp").read_bytes() == comp
+    assert cache.hits == 1
+
+
+def test_params_are_part_of_the_key(round_trip, cache):
+    data = b"cached " * 500
+    assert round_trip(Encoder(1, result_cache=cache), Decoder(), data) == data
+    assert round_trip(Encoder(2, result_cache=cache), Decoder(), data) == data
+    assert cache.hits == 0
+
+
+def test_block_hits(round_trip, cache):
+    # the repeated blocks are coded once
+    block = all_distinct(2, 1000)
+    data = block * 4 + b"tail"
+    encoder = Encoder(2, block_size=len(block), result_cache=cache)
+    assert round_trip(encoder, Decoder(), data) == data
+    assert encoder._cached_block_cnt == 3
+
+
+def test_all_distinct(round_trip, cache):
+    data = all_distinct(2, 5000)
+    for _ in range(2):
+        assert round_trip(Encoder(2, block_size=2000, result_cache=cache), Decoder(), data) == data
+
+
+def test_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), 250)
+    for i in range(5):
+        cache.put(str(i), bytes(100))
+    assert cache.get("0") is None
+    assert cache.get("4") == bytes(100)
+
+    # the least recently used entries are loaded from the modification times
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["3", "4"]
+    assert ResultCache(str(tmp_path), 250).get("3") == bytes(100)
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from encoder import Encoder, SAMPLE_LEAD, SAMPLE_STRIDE
+from decoder import Decoder
+from helpers import all_distinct
+
+
+@pytest.mark.parametrize("sample", [SAMPLE_LEAD, SAMPLE_STRIDE])
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2])
+def test_symbols_missing_from_sample(round_trip, sample, bytes_per_symbol):
+    # most symbols after the sample are missing from it and escaped
+    data = b"abab" * 1000 + all_distinct(bytes_per_symbol, 256 * bytes_per_symbol) + os.urandom(2001)
+    coder = Encoder(bytes_per_symbol, sample=sample, sample_size=1000)
+    assert round_trip(coder, Decoder(), data) == data
+
+
+@pytest.mark.parametrize("sample", [SAMPLE_LEAD, SAMPLE_STRIDE])
+def test_all_distinct(round_trip, sample):
+    data = all_distinct(2, 10000)
+    assert round_trip(Encoder(2, sample=sample, sample_size=4000), Decoder(), data) == data
+
+
+def test_sample_larger_than_file(round_trip):
+    data = b"a short file"
+    assert round_trip(Encoder(1, sample=SAMPLE_LEAD), Decoder(), data) == data
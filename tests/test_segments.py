@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+import segment_encoder
+from segment_encoder import SegmentEncoder
+from segment_decoder import SegmentDecoder
+from helpers import all_distinct
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    # cut a few segments without megabyte sized files
+    monkeypatch.setattr(segment_encoder, "BYTES_PER_MB", 2000)
+
+
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2, 3])
+@pytest.mark.parametrize("primer_size", [0, 16])
+def test_round_trip(round_trip, bytes_per_symbol, primer_size):
+    # the last segment may end with a partial symbol
+    data = b"segments " * 500 + os.urandom(3001)
+    coder = SegmentEncoder(bytes_per_symbol, segment_size=1, primer_size=primer_size, workers=2)
+    assert round_trip(coder, SegmentDecoder(workers=2), data) == data
+
+
+def test_all_distinct(round_trip):
+    data = all_distinct(2, 3000)
+    coder = SegmentEncoder(2, segment_size=1, primer_size=64)
+    assert round_trip(coder, SegmentDecoder(), data) == data
+
+
+def test_empty_file(round_trip):
+    assert round_trip(SegmentEncoder(1), SegmentDecoder(), b"") == b""
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from encoder import Encoder
+from decoder import Decoder
+from adaptive_encoder import AdaptiveEncoder
+from adaptive_decoder import AdaptiveDecoder
+from utils import STORED_FORMAT_ID
+from helpers import all_distinct
+
+
+CODERS = [(Encoder, Decoder), (AdaptiveEncoder, AdaptiveDecoder)]
+
+
+@pytest.mark.parametrize("encoder_type, decoder_type", CODERS)
+@pytest.mark.parametrize("data", [os.urandom(20000), all_distinct(1, 256)], ids=["random", "all distinct"])
+def test_incompressible(tmp_path, round_trip, encoder_type, decoder_type, data):
+    assert round_trip(encoder_type(1, min_ratio=0.05), decoder_type(), data) == data
+    assert (tmp_path / "comp").read_bytes() == bytes((STORED_FORMAT_ID,)) + data
+
+
+@pytest.mark.parametrize("encoder_type, decoder_type", CODERS)
+def test_compressible(tmp_path, round_trip, encoder_type, decoder_type):
+    data = b"a compressible text is not stored. " * 500
+    assert round_trip(encoder_type(1, min_ratio=0.05), decoder_type(), data) == data
+    assert (tmp_path / "comp").read_bytes()[0] != STORED_FORMAT_ID
+
+
+@pytest.mark.parametrize("encoder_type, decoder_type", CODERS)
+def test_in_memory(encoder_type, decoder_type):
+    data = os.urandom(5000)
+    comp = encoder_type(1, min_ratio=0.05).compress(data)
+    assert comp[0] == STORED_FORMAT_ID
+    assert decoder_type().decompress(comp) == data
@@ -0,0 +1,62 @@
+import random
+import os
+
+import pytest
+
+from encoder import Encoder
+from decoder import Decoder
+from adaptive_encoder import AdaptiveEncoder
+from adaptive_decoder import AdaptiveDecoder
+from base_coder import BLOCK_STORED
+from helpers import all_distinct
+
+
+def read_blocks(decoder, comp_file_path):
+    # [(block type, content)] of a compressed file
+    with open(comp_file_path, "rb") as f:
+        decoder._parse_header(f)
+        return list(iter(lambda: decoder._read_block(f), None))
+
+
+@pytest.mark.parametrize("encoder_type, decoder_type", [(Encoder, Decoder), (AdaptiveEncoder, AdaptiveDecoder)])
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2])
+def test_round_trip(round_trip, encoder_type, decoder_type, bytes_per_symbol):
+    # coded blocks between stored ones, and a last block shorter than the others
+    data = b"ab" * 3000 + os.urandom(6000) + all_distinct(bytes_per_symbol, 256) + b"cd" * 3000 + os.urandom(101)
+    encoder = encoder_type(bytes_per_symbol, block_size=2000)
+    assert round_trip(encoder, decoder_type(), data) == data
+
+
+def test_stored_blocks_are_not_expanded(tmp_path, round_trip):
+    data = os.urandom(20000)
+    assert round_trip(AdaptiveEncoder(1, block_size=2000), AdaptiveDecoder(), data) == data
+    assert (tmp_path / "comp").stat().st_size < len(data) * 1.01
+
+
+@pytest.mark.parametrize("params", [{}, dict(context_trees=16)], ids=["order-0", "context trees"])
+def test_blocks_are_coded_by_the_live_tree(tmp_path, round_trip, params):
+    # the tree learns a skewed alphabet, later blocks draw uniformly from it and are coded in fewer bits than stored,
+    # even though they would be stored if every distinct symbol was charged as new
+    rng = random.Random(0)
+    alphabet = bytes(range(200))
+    data = bytes(rng.choices(alphabet, weights=[50] + [1] * 199, k=4000)) + bytes(rng.choices(alphabet, k=16000))
+    encoder = AdaptiveEncoder(1, block_size=4000, **params)
+    assert round_trip(encoder, AdaptiveDecoder(), data) == data
+
+    blocks = read_blocks(AdaptiveDecoder(), tmp_path / "comp")
+    assert len(blocks) == 5
+    assert all(len(content) < 4000 for block_type, content in blocks if block_type != BLOCK_STORED)
+    if not params:
+        assert all(block_type != BLOCK_STORED for block_type, _ in blocks)
+
+
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2])
+def test_coded_blocks_are_smaller_than_stored(tmp_path, round_trip, bytes_per_symbol):
+    # a stored block does not change the tree, the next blocks are coded as if it was not there
+    data = b"ab" * 2000 + all_distinct(bytes_per_symbol, 256) + os.urandom(4000) + b"ab" * 2000
+    encoder = AdaptiveEncoder(bytes_per_symbol, block_size=1000 * bytes_per_symbol)
+    assert round_trip(encoder, AdaptiveDecoder(), data) == data
+
+    blocks = read_blocks(AdaptiveDecoder(), tmp_path / "comp")
+    assert any(block_type == BLOCK_STORED for block_type, _ in blocks)
+    assert all(len(content) < 1000 * bytes_per_symbol for block_type, content in blocks if block_type != BLOCK_STORED)
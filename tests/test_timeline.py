@@ -0,0 +1,127 @@
+import csv
+import json
+import math
+import os
+
+import pytest
+
+import base_coder
+import segment_encoder
+import container_encoder
+from encoder import Encoder
+from decoder import Decoder
+from adaptive_encoder import AdaptiveEncoder
+from adaptive_decoder import AdaptiveDecoder
+from range_encoder import RangeEncoder
+from range_decoder import RangeDecoder
+from lz_encoder import LZEncoder
+from lz_decoder import LZDecoder
+from lane_encoder import LaneEncoder
+from lane_decoder import LaneDecoder
+from segment_encoder import SegmentEncoder
+from segment_decoder import SegmentDecoder
+from container_encoder import ContainerEncoder
+from container_decoder import ContainerDecoder
+from helpers import all_distinct
+
+
+CODERS = [
+    (lambda b: Encoder(b, timeline=1), Decoder),
+    (lambda b: Encoder(b, timeline=1, block_size=1000), Decoder),
+    (lambda b: AdaptiveEncoder(b, timeline=1, shrink_period=500), AdaptiveDecoder),
+    (lambda b: RangeEncoder(b, timeline=1), RangeDecoder),
+]
+CODER_IDS = ["static", "static blocks", "adaptive", "range"]
+
+# coders of independent parts (blocks, lanes, segments, frames), whose rows end on part boundaries
+PART_CODERS = [
+    (lambda b: LZEncoder(block_size=1000, timeline=1), LZDecoder, 1),
+    (lambda b: LaneEncoder(4, workers=2, timeline=1), lambda: LaneDecoder(workers=2), 1),
+    (lambda b: SegmentEncoder(b, workers=2, segment_size=1, timeline=1), lambda: SegmentDecoder(workers=2), 2),
+    (lambda b: ContainerEncoder(b, frame_size=1, timeline=1), ContainerDecoder, 2),
+]
+PART_CODER_IDS = ["lz", "lanes", "segments", "frames"]
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # a few rows without megabyte sized files
+    monkeypatch.setattr(base_coder, "BYTES_PER_MB", 2000)
+    monkeypatch.setattr(segment_encoder, "BYTES_PER_MB", 3000)
+    monkeypatch.setattr(container_encoder, "BYTES_PER_MB", 3000)
+
+
+@pytest.mark.parametrize("new_encoder, decoder_type", CODERS, ids=CODER_IDS)
+@pytest.mark.parametrize("bytes_per_symbol", [1, 2])
+def test_rows_cover_the_input(round_trip, new_encoder, decoder_type, bytes_per_symbol):
+    data = all_distinct(bytes_per_symbol, 256) + b"timeline " * 1000 + os.urandom(2001)
+    encoder = new_encoder(bytes_per_symbol)
+    assert round_trip(encoder, decoder_type(), data) == data
+
+    # a chunk ends on a buffer or block boundary, small files without blocks have a single row
+    rows = encoder.timeline_rows
+    assert len(rows) > 1 or encoder._block_size == 0
+    assert [row["chunk"] for row in rows] == list(range(len(rows)))
+    assert sum(row["input_bytes"] for row in rows) == len(data)
+    assert all(row["input_bytes"] >= 2000 for row in rows[:-1])
+    assert 0 <= rows[0]["entropy"] <= 8 * bytes_per_symbol
+
+
+@pytest.mark.parametrize("new_encoder, decoder_type, bytes_per_symbol", PART_CODERS, ids=PART_CODER_IDS)
+def test_part_rows(tmp_path, round_trip, new_encoder, decoder_type, bytes_per_symbol):
+    data = b"timeline " * 1000 + os.urandom(4001)  # ends with a partial symbol of 2 bytes
+    encoder = new_encoder(bytes_per_symbol)
+    assert round_trip(encoder, decoder_type(), data) == data
+
+    rows = encoder.timeline_rows
+    assert len(rows) > 1
+    assert [row["chunk"] for row in rows] == list(range(len(rows)))
+    assert sum(row["input_bytes"] for row in rows) == len(data)
+    assert all(row["input_bytes"] >= 2000 for row in rows[:-1])
+    assert all(0 <= row["entropy"] <= 8 * bytes_per_symbol for row in rows)
+
+    # every byte after the header is accounted for
+    comp_size = (tmp_path / "comp").stat().st_size
+    assert sum(row["output_bits"] for row in rows) == (comp_size - encoder._get_header_size()) * 8
+
+
+@pytest.mark.parametrize("new_encoder, decoder_type, bytes_per_symbol", PART_CODERS, ids=PART_CODER_IDS)
+def test_empty_parts(tmp_path, round_trip, new_encoder, decoder_type, bytes_per_symbol):
+    # an empty file has no row
+    encoder = new_encoder(bytes_per_symbol)
+    assert round_trip(encoder, decoder_type(), b"") == b""
+    assert encoder.timeline_rows == []
+
+    # lanes left empty by a file shorter than an element still count in the row
+    encoder = new_encoder(bytes_per_symbol)
+    assert round_trip(encoder, decoder_type(), b"t") == b"t"
+    [row] = encoder.timeline_rows
+    assert row["input_bytes"] == 1
+    assert row["output_bits"] == ((tmp_path / "comp").stat().st_size - encoder._get_header_size()) * 8
+
+
+@pytest.mark.parametrize("new_encoder, decoder_type", CODERS, ids=CODER_IDS)
+def test_all_distinct(round_trip, new_encoder, decoder_type):
+    # every chunk holds distinct symbols only, of the highest entropy for its size
+    data = all_distinct(2, 1000)
+    encoder = new_encoder(2)
+    assert round_trip(encoder, decoder_type(), data) == data
+
+    rows = encoder.timeline_rows
+    assert sum(row["input_bytes"] for row in rows) == len(data)
+    for row in rows:
+        assert row["entropy"] == pytest.approx(max(0, math.log2(row["input_bytes"] // 2)))
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".json"])
+def test_export(tmp_path, round_trip, suffix):
+    data = b"timeline " * 1001  # ends with a partial symbol
+    encoder = Encoder(2, timeline=1)
+    assert round_trip(encoder, Decoder(), data) == data
+
+    export_path = tmp_path / f"timeline{suffix}"
+    encoder.export_timeline(export_path)
+    with open(export_path) as f:
+        rows = json.load(f) if suffix == ".json" else list(csv.DictReader(f))
+    assert len(rows) == len(encoder.timeline_rows)
+    assert sum(int(row["input_bytes"]) for row in rows) == len(data)
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from adaptive_encoder import AdaptiveEncoder
+from adaptive_decoder import AdaptiveDecoder
+from helpers import all_distinct
+
+
+@pytest.mark.parametrize("bytes_per_symbol, symbol_cnt", [(1, 256), (2, 800)])
+def test_all_distinct(tmp_path, round_trip, bytes_per_symbol, symbol_cnt):
+    # every symbol is new to the tree
+    data = all_distinct(bytes_per_symbol, symbol_cnt)
+    encoder = AdaptiveEncoder(bytes_per_symbol, tree_stats=True)
+    assert round_trip(encoder, AdaptiveDecoder(), data) == data
+
+    stats = encoder.tree_stats
+    assert stats["symbols"] == stats["escapes"] == stats["leaves"] == symbol_cnt
+    assert sum(stats["code lengths"].values()) == symbol_cnt
+    assert stats["nodes"] == 2 * symbol_cnt + 1  # with the NYT leaf
+
+    # the counters do not change the output
+    comp = (tmp_path / "comp").read_bytes()
+    assert round_trip(AdaptiveEncoder(bytes_per_symbol), AdaptiveDecoder(), data) == data
+    assert (tmp_path / "comp").read_bytes() == comp
+
+
+@pytest.mark.parametrize("params", [
+    dict(shrink_period=500),
+    dict(shrink_period=500, evict_after=1),
+    dict(context_trees=4, shrink_period=500),
+], ids=["shrink", "evict", "context trees"])
+def test_many_distinct(round_trip, params):
+    data = all_distinct(1, 256) + b"stats " * 500 + os.urandom(2000)
+    encoder = AdaptiveEncoder(1, tree_stats=True, **params)
+    assert round_trip(encoder, AdaptiveDecoder(), data) == data
+
+    stats = encoder.tree_stats
+    assert stats["symbols"] == len(data)
+    assert stats["shrinks"] > 0
+    assert stats["escapes"] >= 256  # every byte value is new at least once
+    assert stats["update time"] <= stats["coding time"]
+
+
+def test_disabled(round_trip):
+    encoder = AdaptiveEncoder(1)
+    assert round_trip(encoder, AdaptiveDecoder(), b"abc") == b"abc"
+    with pytest.raises(AssertionError, match="stats are not enabled"):
+        encoder.tree_stats
@@ -0,0 +1,78 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from collections import Counter
+from pathlib import Path
+from math import log2
+import json
+import time
+import csv
+
+
+TIMELINE_FIELDS = ("chunk", "input_bytes", "output_bits", "avg_code_len", "entropy", "elapsed", "shrinks")
+
+
+def export_rows(rows: List[Dict], export_path: Path):
+    # json for a .json path, csv otherwise
+    with open(export_path, "w", newline="") as f:
+        if Path(export_path).suffix == ".json":
+            json.dump(rows, f, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=TIMELINE_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+class Timeline:
+    # statistics of every `chunk_size` bytes of input of an encode:
+    #     input bytes, output bits, average code length so far, entropy of the chunk (bits per symbol),
+    #     seconds spent on the chunk and shrinks of the model during the chunk
+    # the coder reports its running totals after each buffer or block, so a chunk ends on the first report past its size
+
+    def __init__(self, chunk_size: int, bytes_per_symbol: int):
+        assert chunk_size > 0
+        self._chunk_size: int = chunk_size  # in bytes
+        self._bytes_per_symbol: int = bytes_per_symbol
+        self._rows: List[Dict] = []
+
+        # totals of the coder at the start of the open chunk
+        self._symbol_cnt: int = 0
+        self._bits: int = 0
+        self._shrink_cnt: int = 0
+        self._time: float = time.perf_counter()
+
+        self._counts: Counter = Counter()  # of the symbols of the open chunk
+        self._last: Optional[Tuple[int, int, int, float]] = None  # the last report, None if the chunk is empty
+
+    @property
+    def rows(self) -> List[Dict]:
+        # the open chunk is the last row
+        return self._rows + ([self._to_row()] if self._last is not None else [])
+
+    def update(self, symbols: Iterable[str], symbol_cnt: int, bits: int, shrink_cnt: int=0):
+        # `symbols` coded since the last update, along with the totals of the coder so far
+        self._counts.update(symbols)
+        self._last = (symbol_cnt, bits, shrink_cnt, time.perf_counter())
+
+        if (symbol_cnt - self._symbol_cnt) * self._bytes_per_symbol >= self._chunk_size:
+            self._rows.append(self._to_row())
+            self._symbol_cnt, self._bits, self._shrink_cnt, self._time = self._last
+            self._counts = Counter()
+            self._last = None
+
+    def _to_row(self) -> Dict:
+        symbol_cnt, bits, shrink_cnt, now = self._last
+        chunk_symbol_cnt = symbol_cnt - self._symbol_cnt
+
+        entropy = 0
+        for cnt in self._counts.values():
+            p = cnt / chunk_symbol_cnt
+            entropy -= p * log2(p)
+
+        return dict(
+            chunk=len(self._rows),
+            input_bytes=chunk_symbol_cnt * self._bytes_per_symbol,
+            output_bits=bits - self._bits,
+            avg_code_len=bits / symbol_cnt,
+            entropy=entropy,
+            elapsed=now - self._time,
+            shrinks=shrink_cnt - self._shrink_cnt,
+        )
@@ -1,3 +1,6 @@
+from collections import OrderedDict
+
+
 BITS_PER_BYTE = 8
 BUFFER_SIZE = 256 * 1024
 MAX_BYTE_PER_SYMBOL = 8
@@ -5,8 +8,45 @@ BYTES_PER_MB = 2**20
 
 COMP_FILE_EXTENSION = "comp"
 DECOMP_FILE_EXTENSION = "decomp"
+SNAPSHOT_FILE_EXTENSION = "idx"
 PROGRESS_FILE_NAME = "progress.txt"
 
+# the first header byte of a huffman coded file is bits per symbol, which is always a multiple of BITS_PER_BYTE
+# any other value of the first byte identifies a different format
+STORED_FORMAT_ID = 0  # the source file is stored as is
+LANE_FORMAT_ID = 1
+SEGMENT_FORMAT_ID = 2
+CONTAINER_FORMAT_ID = 3
+LZ_FORMAT_ID = 4
+RANGE_FORMAT_ID = 5
+ANS_FORMAT_ID = 6  # precedes the header of a huffman coded file which also holds a tANS table
+
+# header fields, shared by the coders and the size predictions of the estimator
+BLOCK_SIZE_SIZE = 4  # header field of the block size
+SHRINK_PERIOD_SIZE = 8  # bytes used to store the shrink period (in symbols)
+DRIFT_WINDOW_SIZE = 4  # bytes used to store the drift window (in symbols)
+CONTEXT_TREES_SIZE = 2  # bytes used to store the max number of context trees
+ADAPTIVE_HEADER_SIZE = (  # header of an adaptive huffman coded file, the filter chain excluded
+    3  # bits per symbol, dummy codeword bits, dummy symbol bytes
+    + SHRINK_PERIOD_SIZE + 1  # shrink period, shrink factor
+    + 1 + 1  # aging mode, evict after
+    + DRIFT_WINDOW_SIZE + 1  # drift window, drift threshold
+    + CONTEXT_TREES_SIZE
+    + BLOCK_SIZE_SIZE
+)
+
+
+def static_header_size(bytes_per_symbol: int, alphabet_size: int) -> int:
+    # header of a huffman coded file with `alphabet_size` symbols in its code length dict,
+    # the filter chain and the tANS table excluded
+    header_size = 2  # bits per symbol, dummy symbol bytes
+    header_size += bytes_per_symbol  # size of codelen_dict
+    header_size += alphabet_size * 2 * bytes_per_symbol  # code length dict
+    header_size += bytes_per_symbol  # escape code length
+    header_size += 1  # dummy codeword bits
+    header_size += BLOCK_SIZE_SIZE
+    return header_size
+
 
 def extended_ord(string: str) -> int:
     order = 0
@@ -27,3 +67,40 @@ def extended_chr(order: int, bits_per_symbol: int) -> str:
 
     assert order == 0
     return symbol
+
+def bits_to_bytes(bits: str) -> bytes:
+    # the trailing byte is padded with 0s
+    if len(bits) == 0:
+        return b""
+
+    dummy_bits = -len(bits) % BITS_PER_BYTE
+    return int(bits + "0" * dummy_bits, 2).to_bytes((len(bits) + dummy_bits) // BITS_PER_BYTE, "big")
+
+def bytes_to_bits(data: bytes) -> str:
+    if len(data) == 0:
+        return ""
+
+    return bin(int.from_bytes(data, "big"))[2:].zfill(len(data) * BITS_PER_BYTE)
+
+
+class LRUCache(OrderedDict):
+    # a dict holding at most `capacity` items, the least recently used one is evicted first
+    def __init__(self, capacity: int):
+        assert capacity > 0
+        super().__init__()
+        self._capacity = capacity
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+
+        if len(self) > self._capacity:
+            self.popitem(last=False)